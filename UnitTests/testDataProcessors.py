@@ -1,6 +1,7 @@
 from sqdtoolz.Laboratory import*
 
 from sqdtoolz.HAL.Processors.ProcessorCPU import*
+from sqdtoolz.HAL.Processors.ProcessorCPUPool import*
 from sqdtoolz.HAL.Processors.CPU.CPU_DDC import*
 from sqdtoolz.HAL.Processors.CPU.CPU_FIR import*
 from sqdtoolz.HAL.Processors.CPU.CPU_Mean import*
@@ -8,6 +9,7 @@ from sqdtoolz.HAL.Processors.CPU.CPU_Integrate import*
 from sqdtoolz.HAL.Processors.CPU.CPU_Max import*
 from sqdtoolz.HAL.Processors.CPU.CPU_ConstantArithmetic import*
 from sqdtoolz.HAL.Processors.CPU.CPU_ChannelArithmetic import*
+from sqdtoolz.Utilities.ProcessorBenchmark import ProcessorBenchmark
 TEST_CPU = True
 
 try:
@@ -24,6 +26,9 @@ except ModuleNotFoundError:
     pass
 
 import random
+import time
+import tracemalloc
+import json
 import matplotlib.pyplot as plt
 
 INCLUDE_PLOTS = False
@@ -902,6 +907,8 @@ class TestCPU(unittest.TestCase):
         new_proc.push_data(cur_data)
         fin_data = new_proc.get_all_data()
         expected_ans = np.array([[np.fft.fft([(s+2*r)*x for x in range(1,data_size+1)]) for s in range(1,num_segs+1)] for r in range(1,num_reps+1)])
+        #The Nyquist component of a real signal is real (np.fft only gives a zero imaginary part to within round-off errors)
+        expected_ans[:,:,data_size//2] = np.real(expected_ans[:,:,data_size//2])
         assert self.arr_equality_pct(fin_data['data']['fft_real'], np.real(expected_ans)), "CPU FFT does not yield expected result."
         assert self.arr_equality_pct(fin_data['data']['fft_imag'], np.imag(expected_ans)), "CPU FFT does not yield expected result."
         expected_ans = np.fft.fftfreq(data_size, 1.0/15)
@@ -923,6 +930,8 @@ class TestCPU(unittest.TestCase):
         new_proc.push_data(cur_data)
         fin_data = new_proc.get_all_data()
         expected_ans = np.array([[np.fft.fft([(s+2*r)*x for x in range(1,data_size+1)]) for s in range(1,num_segs+1)] for r in range(1,num_reps+1)])
+        #The Nyquist component of a real signal is real (np.fft only gives a zero imaginary part to within round-off errors)
+        expected_ans[:,:,data_size//2] = np.real(expected_ans[:,:,data_size//2])
         assert self.arr_equality_pct(fin_data['data']['fft_real'], np.real(expected_ans)), "CPU FFT does not yield expected result."
         assert self.arr_equality_pct(fin_data['data']['fft_imag'], np.imag(expected_ans)), "CPU FFT does not yield expected result."
         expected_ans = np.fft.fftfreq(data_size, 1.0/15)
@@ -1157,7 +1166,470 @@ class TestCPU(unittest.TestCase):
 
         self.cleanup()
 
+    def test_AsyncProcessing(self):
+        self.initialise()
+        class CPU_SlowStage(ProcNodeCPU):
+            def __init__(self, delay, fail=False):
+                self.delay = delay
+                self.fail = fail
+            def process_data(self, data_pkt, **kwargs):
+                time.sleep(self.delay)
+                assert not self.fail, "Failing stage."
+                data_pkt['data']['ch1'] = data_pkt['data']['ch1'] * 2
+                return data_pkt
+        num_blocks = 5
+        blocks = [np.random.rand(2, 3, 16) for m in range(num_blocks)]
+        #
+        #Processing must overlap with the (simulated) acquisition of the next block
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_SlowStage(0.2))
+        new_proc.add_stage(CPU_Mean('sample'))
+        start_time = time.time()
+        for cur_block in blocks:
+            time.sleep(0.2)
+            new_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : cur_block}, 'misc' : {'SampleRates' : [1]}})
+        fin_data = new_proc.get_all_data()
+        assert time.time() - start_time < 0.2*num_blocks*2 - 0.2, "CPU processing did not run asynchronously with the acquisition."
+        assert self.arr_equality(fin_data['data']['ch1'], np.concatenate([np.mean(x*2, axis=-1) for x in blocks])), "Asynchronous CPU processing does not yield expected result."
+        #
+        #Errors in the background processing must be raised in get_all_data
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_SlowStage(0.01, True))
+        for cur_block in blocks:
+            new_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : cur_block}, 'misc' : {'SampleRates' : [1]}})
+        with self.assertRaises(AssertionError):
+            new_proc.get_all_data()
+        #...and the processor must be usable afterwards
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_Mean('sample'))
+        new_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : blocks[0]}, 'misc' : {'SampleRates' : [1]}})
+        fin_data = new_proc.get_all_data()
+        assert self.arr_equality(fin_data['data']['ch1'], np.mean(blocks[0], axis=-1)), "CPU processing did not recover from an error."
+        self.cleanup()
+
+    def test_ProcessPool(self):
+        self.initialise()
+        def setup_pipeline(cur_proc):
+            cur_proc.reset_pipeline()
+            cur_proc.add_stage(CPU_DDC([10e6, 25e6]))
+            cur_proc.add_stage(CPU_FIR([{'Type' : 'low', 'Taps' : 40, 'fc' : 5e6, 'Win' : 'hamming'}]*4))
+            cur_proc.add_stage(CPU_Mean('sample'))
+            cur_proc.add_stage_end(CPU_Mean('repetition'))
+        proc_serial = ProcessorCPU('cpu_test', self.lab)
+        setup_pipeline(proc_serial)
+        proc_pool = ProcessorCPUPool('cpu_pool_test', self.lab, num_workers=2)
+        setup_pipeline(proc_pool)
+        #
+        #The outputs must be bit-identical to the serial processor
+        blocks = [np.random.rand(3, 4, 128) for m in range(5)]
+        for cur_proc in [proc_serial, proc_pool]:
+            for cur_block in blocks:
+                cur_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : cur_block.copy(), 'ch2' : cur_block[::-1].copy()}, 'misc' : {'SampleRates' : [1e9, 1e9]}})
+        fin_serial = proc_serial.get_all_data()
+        fin_pool = proc_pool.get_all_data()
+        assert fin_serial['parameters'] == fin_pool['parameters'], "CPU process pool does not yield the expected parameters."
+        assert fin_serial['misc'] == fin_pool['misc'], "CPU process pool does not yield the expected miscellaneous data."
+        assert list(fin_serial['data'].keys()) == list(fin_pool['data'].keys()), "CPU process pool does not yield the expected channels."
+        for cur_ch in fin_serial['data']:
+            assert np.array_equal(fin_serial['data'][cur_ch], fin_pool['data'][cur_ch]), "CPU process pool does not yield bit-identical results."
+        #
+        #A single large data block must be split across the workers and reassembled in order
+        for cur_proc in [proc_serial, proc_pool]:
+            cur_proc.reset_pipeline()
+            cur_proc.add_stage(CPU_DDC([10e6, 25e6]))
+            cur_proc.add_stage(CPU_FIR([{'Type' : 'low', 'Taps' : 40, 'fc' : 5e6, 'Win' : 'hamming'}]*4))
+            cur_proc.add_stage(CPU_Mean('sample'))
+        big_block = np.random.rand(101, 4, 256)
+        for cur_proc in [proc_serial, proc_pool]:
+            cur_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : big_block.copy(), 'ch2' : big_block[::-1].copy()}, 'misc' : {'SampleRates' : [1e9, 1e9]}})
+        assert len(proc_pool._pending) == 1 and len(proc_pool._pending[0][1]) == 2, "CPU process pool did not split the data block across the workers."
+        fin_serial = proc_serial.get_all_data()
+        fin_pool = proc_pool.get_all_data()
+        assert fin_serial['parameters'] == fin_pool['parameters'], "CPU process pool does not yield the expected parameters."
+        assert fin_serial['misc'] == fin_pool['misc'], "CPU process pool does not yield the expected miscellaneous data."
+        for cur_ch in fin_serial['data']:
+            assert fin_pool['data'][cur_ch].shape[0] == 101, "CPU process pool did not reassemble the data block."
+            assert np.array_equal(fin_serial['data'][cur_ch], fin_pool['data'][cur_ch]), "CPU process pool does not yield bit-identical results."
+        #
+        #Errors in the workers must be raised in get_all_data
+        proc_pool.reset_pipeline()
+        proc_pool.add_stage(CPU_Mean('frequency'))
+        proc_pool.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : blocks[0]}, 'misc' : {'SampleRates' : [1]}})
+        with self.assertRaises(AssertionError):
+            proc_pool.get_all_data()
+        #
+        #The processor configuration must include the number of workers
+        assert proc_pool._get_current_config()['NumWorkers'] == 2, "CPU process pool did not store the number of workers."
+        proc_pool.shutdown()
+        self.cleanup()
+
+    def test_FusedDDC(self):
+        self.initialise()
+        num_reps, num_segs, data_size = 8, 3, 1024
+        rand_data = np.random.rand(num_reps, num_segs, data_size)
+        def make_data():
+            return {
+                'parameters' : ['repetition', 'segment', 'sample'],
+                'data' : { 'ch1' : np.cos(2*np.pi*25e6*np.arange(data_size)/1e9 + np.arange(num_reps*num_segs)[:,None]).reshape(num_reps, num_segs, data_size),
+                           'ch2' : rand_data.copy() },
+                'misc' : {'SampleRates' : [1e9, 1e9]}
+            }
+        def run_unfused(stages, data_pkt):
+            for cur_stage in stages:
+                data_pkt = cur_stage.process_data(data_pkt)
+            return data_pkt
+        fir_specs = [{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}, {'Type' : 'high', 'Taps' : 33, 'fc' : 5e6, 'Win' : 'hamming'}]*2
+        test_cases = [
+            ([25e6, 25e6], lambda: CPU_Mean('sample')),
+            ([25e6, 0], lambda: CPU_Integrate('sample')),
+            ([None, 10e6], lambda: CPU_Mean('sample')),
+            ([25e6, 25e6], lambda: CPU_Mean('segment'))    #Not fusable - must fall back onto the individual stages
+        ]
+        for ddc_freqs, reduce_stage in test_cases:
+            new_proc = ProcessorCPU('cpu_test', self.lab)
+            new_proc.reset_pipeline()
+            new_proc.add_stage(CPU_DDC(ddc_freqs))
+            new_proc.add_stage(CPU_FIR(fir_specs))
+            new_proc.add_stage(reduce_stage())
+            assert isinstance(new_proc._get_exec_pipeline()[0], CPU_FusedDDC), "ProcessorCPU did not fuse the DDC-FIR-Mean chain."
+            cur_data = make_data()
+            expected_ans = run_unfused([CPU_DDC(ddc_freqs), CPU_FIR(fir_specs), reduce_stage()], make_data())
+            new_proc.push_data(cur_data)
+            fin_data = new_proc.get_all_data()
+            assert list(fin_data['data'].keys()) == list(expected_ans['data'].keys()), "Fused DDC does not yield the expected channels."
+            assert fin_data['parameters'] == expected_ans['parameters'], "Fused DDC does not yield the expected parameters."
+            assert fin_data['misc']['SampleRates'] == expected_ans['misc']['SampleRates'], "Fused DDC does not yield the expected sample rates."
+            for cur_ch in expected_ans['data']:
+                assert self.arr_equality(fin_data['data'][cur_ch], expected_ans['data'][cur_ch]), "Fused DDC does not yield expected result."
+        #
+        #Check the explicit stage and its configuration
+        fused_stage = CPU_FusedDDC.fromConfigDict(CPU_FusedDDC([25e6, 25e6], fir_specs, 'sample', 'sum')._get_current_config())
+        fin_data = fused_stage.process_data(make_data())
+        expected_ans = run_unfused([CPU_DDC([25e6, 25e6]), CPU_FIR(fir_specs), CPU_Integrate('sample')], make_data())
+        for cur_ch in expected_ans['data']:
+            assert self.arr_equality(fin_data['data'][cur_ch], expected_ans['data'][cur_ch]), "Fused DDC does not yield expected result."
+        #
+        #The fused chain must not allocate intermediate arrays the size of the raw data
+        cur_data = make_data()
+        raw_size = cur_data['data']['ch1'].nbytes
+        tracemalloc.start()
+        fused_stage.process_data(cur_data)
+        peak_mem = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert peak_mem < raw_size / 2, "Fused DDC allocated intermediate arrays."
+        self.cleanup()
+
+    def test_StreamingMean(self):
+        self.initialise()
+        num_blocks, num_reps, num_segs, data_size = 20, 50, 3, 64
+        blocks = [np.random.rand(num_reps, num_segs, data_size) + 1e3 for m in range(num_blocks)]
+        all_data = np.concatenate(blocks)
+        #
+        #Mean (and variance) across the repetitions folded in block-by-block must match that over the entire dataset
+        for cur_proc in [ProcessorCPU('cpu_test', self.lab), ProcessorCPUPool('cpu_pool_test', self.lab, num_workers=2)]:
+            cur_proc.reset_pipeline()
+            cur_proc.add_stage(CPU_ConstantArithmetic(2, '*'))
+            cur_proc.add_stage_end(CPU_Mean('repetition', variance=True))
+            cur_proc.add_stage_end(CPU_Mean('sample'))
+            for cur_block in blocks:
+                cur_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : cur_block.copy(), 'ch2' : cur_block[:,::-1].copy()}, 'misc' : {'SampleRates' : [1e9, 2e9]}})
+            fin_data = cur_proc.get_all_data()
+            assert fin_data['parameters'] == ['segment'], "Streaming mean does not yield the expected parameters."
+            assert list(fin_data['data'].keys()) == ['ch1', 'ch2', 'ch1_var', 'ch2_var'], "Streaming mean does not yield the expected channels."
+            assert fin_data['misc']['SampleRates'] == [1e9, 2e9, 1e9, 2e9], "Streaming mean does not yield the expected sample rates."
+            assert self.arr_equality_pct(fin_data['data']['ch1'], np.mean(2*all_data, axis=(0,2))), "Streaming mean does not yield expected result."
+            assert self.arr_equality_pct(fin_data['data']['ch2'], np.mean(2*all_data[:,::-1], axis=(0,2))), "Streaming mean does not yield expected result."
+            assert self.arr_equality_pct(fin_data['data']['ch1_var'], np.mean(np.var(2*all_data, axis=0), axis=-1)), "Streaming variance does not yield expected result."
+            assert cur_proc.cur_data_processed == [] and cur_proc.cur_data_accum == None, "Streaming mean did not clear the accumulators."
+            if isinstance(cur_proc, ProcessorCPUPool):
+                cur_proc.shutdown()
+        #
+        #The accumulators must not grow with the number of blocks
+        mean_stage = CPU_Mean('repetition')
+        accum = None
+        for cur_block in blocks:
+            accum = mean_stage.accumulate({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : cur_block}}, accum)
+        assert accum['sums']['ch1'].shape == (num_segs, data_size), "Streaming mean stores more than the running sum."
+        assert self.arr_equality_pct(mean_stage.get_accumulated(accum)['data']['ch1'], np.mean(all_data, axis=0)), "Streaming mean does not yield expected result."
+        #
+        #Mean across the repetitions that is not the first end-stage (or first parameter) must still work on the collated data
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        new_proc.reset_pipeline()
+        new_proc.add_stage_end(CPU_Mean('segment', variance=True))
+        for cur_block in blocks[:3]:
+            new_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : cur_block.copy()}, 'misc' : {'SampleRates' : [1e9]}})
+        fin_data = new_proc.get_all_data()
+        assert self.arr_equality(fin_data['data']['ch1'], np.mean(np.concatenate(blocks[:3]), axis=1)), "Mean does not yield expected result."
+        assert self.arr_equality(fin_data['data']['ch1_var'], np.var(np.concatenate(blocks[:3]), axis=1)), "Variance does not yield expected result."
+        #
+        #Check configuration
+        assert CPU_Mean.fromConfigDict(CPU_Mean('repetition', True)._get_current_config())._variance, "CPU_Mean did not store the variance option."
+        assert 'Variance' not in CPU_Mean('repetition')._get_current_config(), "CPU_Mean configuration changed when not calculating the variance."
+        self.cleanup()
+
+    def test_SinglePrecision(self):
+        self.initialise()
+        num_reps, num_segs, data_size = 6, 3, 512
+        raw_data = [np.random.randint(-2048, 2048, size=(num_reps, num_segs, data_size)).astype(np.int16) for m in range(2)]
+        fir_specs = [{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}]*4
+        test_cases = [
+            ([CPU_DDC([25e6, 10e6]), CPU_FIR(fir_specs), CPU_Mean('sample')], [CPU_Mean('repetition', variance=True)]),
+            ([CPU_DDC([25e6, 10e6]), CPU_FIR(fir_specs), CPU_ConstantArithmetic(3, '*'), CPU_Integrate('sample')], []),
+            ([CPU_ChannelArithmetic([0,1], '-', False), CPU_MeanBlock('sample', 4)], [CPU_Mean('segment')]),
+            ([CPU_FFT()], [CPU_Mean('repetition')]),
+        ]
+        for stages, stages_end in test_cases:
+            results = {}
+            for cur_precision in ['float64', 'float32']:
+                new_proc = ProcessorCPU('cpu_test', self.lab, precision=cur_precision)
+                new_proc.reset_pipeline()
+                for cur_stage in stages:
+                    new_proc.add_stage(type(cur_stage).fromConfigDict(cur_stage._get_current_config()))
+                for cur_stage in stages_end:
+                    new_proc.add_stage_end(type(cur_stage).fromConfigDict(cur_stage._get_current_config()))
+                for cur_block in raw_data:
+                    #The double-precision mode receives the samples as cast by the digitiser driver
+                    cur_block = cur_block if cur_precision == 'float32' else cur_block.astype(np.float64)
+                    new_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : cur_block.copy(), 'ch2' : cur_block[...,::-1].copy()}, 'misc' : {'SampleRates' : [1e9, 1e9]}})
+                results[cur_precision] = new_proc.get_all_data()
+            assert list(results['float32']['data'].keys()) == list(results['float64']['data'].keys()), "Single-precision processing does not yield the expected channels."
+            for cur_ch in results['float64']['data']:
+                res32, res64 = results['float32']['data'][cur_ch], results['float64']['data'][cur_ch]
+                assert res32.dtype == np.float32, "Single-precision processing does not yield single-precision outputs."
+                assert res64.dtype == np.float64, "Double-precision processing does not yield double-precision outputs."
+                #The precision loss must be consistent with single-precision arithmetic
+                rel_err = np.max(np.abs(res32 - res64)) / np.max(np.abs(res64))
+                assert rel_err < 1e-5, f"Single-precision processing has an unexpectedly large error ({rel_err})."
+        #
+        #Raw integer samples are kept until the first arithmetic stage
+        new_proc = ProcessorCPU('cpu_test', self.lab, precision='float32')
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_Max('sample'))
+        new_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : raw_data[0]}, 'misc' : {'SampleRates' : [1e9]}})
+        fin_data = new_proc.get_all_data()
+        assert fin_data['data']['ch1'].dtype == np.int16, "Single-precision processing cast the raw samples before an arithmetic stage."
+        assert np.array_equal(fin_data['data']['ch1'], np.max(raw_data[0], axis=-1)), "CPU Max does not yield expected result."
+        #
+        #Check configuration
+        new_proc = ProcessorCPU('cpu_test_config', self.lab, precision='float32')
+        new_proc._set_current_config(ProcessorCPU('cpu_test', self.lab)._get_current_config() | {'Name' : 'cpu_test_config'}, self.lab)
+        assert new_proc.Precision == 'float64', "ProcessorCPU did not load the precision from its configuration."
+        new_proc = ProcessorCPU.fromConfigDict(ProcessorCPU('cpu_test', self.lab, precision='float32')._get_current_config(), self.lab)
+        assert new_proc.Precision == 'float32', "ProcessorCPU did not store the precision."
+        with self.assertRaises(AssertionError):
+            new_proc.Precision = 'float16'
+        self.cleanup()
+
+    def test_FIR(self):
+        self.initialise()
+        num_reps, num_segs, data_size = 4, 3, 1000
+        rand_data = np.random.rand(num_reps, num_segs, data_size)
+        def make_data():
+            return {
+                'parameters' : ['repetition', 'segment', 'sample'],
+                'data' : { 'ch1' : rand_data.copy(), 'ch2' : rand_data[...,::-1].copy() },
+                'misc' : {'SampleRates' : [1e9, 2e9]}
+            }
+        #
+        #Short and long (i.e. FFT-based) filters must match the direct convolution
+        for num_taps in [40, 41, 200, 201]:
+            fir_specs = [{'Type' : 'low', 'Taps' : num_taps, 'fc' : 10e6, 'Win' : 'hamming'}, {'Type' : 'high', 'Taps' : num_taps, 'fc' : 50e6, 'Win' : 'hamming'}]
+            fir_stage = CPU_FIR(fir_specs)
+            fin_data = fir_stage.process_data(make_data())
+            for ch_ind, cur_ch in enumerate(['ch1', 'ch2']):
+                expected_ans = scipy.ndimage.convolve1d(make_data()['data'][cur_ch], fir_stage._get_fir_coeffs(ch_ind, [1e9, 2e9][ch_ind], data_size))
+                assert self.arr_equality(fin_data['data'][cur_ch], expected_ans), "CPU FIR does not yield expected result."
+            assert fin_data['misc']['SampleRates'] == [1e9, 2e9], "CPU FIR changed the sample rates."
+        #
+        #The decimating (polyphase) filter must match the decimated output of the full filter
+        for num_taps, decimation in [(40, 4), (41, 3), (200, 7)]:
+            fir_specs = [{'Type' : 'low', 'Taps' : num_taps, 'fc' : 10e6, 'Win' : 'hamming'}, {'Type' : 'low', 'Taps' : num_taps, 'fc' : 10e6, 'Win' : 'hamming', 'Decimation' : decimation}]
+            expected_ans = CPU_FIR([fir_specs[0]]*2).process_data(make_data())
+            fin_data = CPU_FIR.fromConfigDict(CPU_FIR(fir_specs)._get_current_config()).process_data(make_data())
+            assert self.arr_equality(fin_data['data']['ch1'], expected_ans['data']['ch1']), "CPU FIR does not yield expected result."
+            assert self.arr_equality(fin_data['data']['ch2'], expected_ans['data']['ch2'][...,::decimation]), "CPU FIR with decimation does not yield expected result."
+            assert fin_data['misc']['SampleRates'] == [1e9, 2e9/decimation], "CPU FIR with decimation does not update the sample rates."
+        #
+        #A decimating filter cannot be fused with a subsequent mean
+        new_proc = ProcessorCPU('cpu_test', self.lab)
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_DDC([25e6, 25e6]))
+        new_proc.add_stage(CPU_FIR([{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming', 'Decimation' : 4}]*4))
+        new_proc.add_stage(CPU_Mean('sample'))
+        assert len(new_proc._get_exec_pipeline()) == 3, "ProcessorCPU fused a decimating FIR filter."
+        new_proc.push_data(make_data())
+        fin_data = new_proc.get_all_data()
+        expected_ans = make_data()
+        for cur_stage in [CPU_DDC([25e6, 25e6]), CPU_FIR([{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}]*4)]:
+            expected_ans = cur_stage.process_data(expected_ans)
+        for cur_ch in expected_ans['data']:
+            assert self.arr_equality(fin_data['data'][cur_ch], np.mean(expected_ans['data'][cur_ch][...,::4], axis=-1)), "CPU FIR with decimation does not yield expected result."
+        #
+        #The designed taps are cached for each set of filter parameters
+        fir_stage = CPU_FIR([{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}])
+        coeffs = fir_stage._get_fir_coeffs(0, 1e9, data_size)
+        fir_stage._get_fir_coeffs(0, 2e9, data_size)
+        assert fir_stage._get_fir_coeffs(0, 1e9, data_size) is coeffs, "CPU FIR did not cache the filter coefficients."
+        self.cleanup()
+
+    def test_RealFFT(self):
+        self.initialise()
+        for data_size in [1000, 1001]:
+            rand_data = np.random.rand(3, 4, data_size)
+            expected_fft = np.fft.fft(rand_data)
+            #
+            #Real inputs (i.e. via the real FFT) with the full spectrum
+            for cur_stage in [CPU_FFT(), CPU_ESD()]:
+                fin_data = cur_stage.process_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : rand_data.copy()}, 'misc' : {'SampleRates' : [20]}})
+                if isinstance(cur_stage, CPU_FFT):
+                    assert self.arr_equality_pct(fin_data['data']['fft_real'], np.real(expected_fft)), "CPU FFT does not yield expected result."
+                    assert self.arr_equality_pct(fin_data['data']['fft_imag'], np.imag(expected_fft)), "CPU FFT does not yield expected result."
+                else:
+                    assert self.arr_equality_pct(fin_data['data']['esd'], np.abs(expected_fft)**2), "CPU ESD does not yield expected result."
+                assert self.arr_equality(fin_data['parameter_values']['fft_frequency'], np.fft.fftfreq(data_size, 1.0/20)), "CPU FFT does not give right frequencies."
+                assert fin_data['parameters'] == ['repetition', 'segment', 'fft_frequency'], "CPU FFT does not yield the expected parameters."
+            #
+            #Real inputs with only the non-negative frequencies
+            num_half = data_size//2 + 1
+            for cur_stage in [CPU_FFT(one_sided=True, workers=2), CPU_ESD(one_sided=True, workers=2)]:
+                cur_stage = type(cur_stage).fromConfigDict(cur_stage._get_current_config())
+                fin_data = cur_stage.process_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : rand_data.copy()}, 'misc' : {'SampleRates' : [20]}})
+                if isinstance(cur_stage, CPU_FFT):
+                    assert self.arr_equality_pct(fin_data['data']['fft_real'], np.real(expected_fft[...,:num_half])), "CPU FFT does not yield expected result."
+                    assert self.arr_equality_pct(fin_data['data']['fft_imag'], np.imag(expected_fft[...,:num_half])), "CPU FFT does not yield expected result."
+                else:
+                    assert self.arr_equality_pct(fin_data['data']['esd'], np.abs(expected_fft[...,:num_half])**2), "CPU ESD does not yield expected result."
+                assert self.arr_equality(fin_data['parameter_values']['fft_frequency'], np.fft.rfftfreq(data_size, 1.0/20)), "CPU FFT does not give right frequencies."
+            #
+            #Complex inputs always yield the full spectrum
+            fin_data = CPU_ESD(one_sided=True).process_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : rand_data.copy(), 'ch2' : rand_data[...,::-1].copy()}, 'misc' : {'SampleRates' : [20, 20]}})
+            assert self.arr_equality_pct(fin_data['data']['esd'], np.abs(np.fft.fft(rand_data + 1j*rand_data[...,::-1]))**2), "CPU ESD does not yield expected result."
+            #
+            #A single complex channel (e.g. the output of a DDC) also yields the full spectrum
+            complex_data = rand_data + 1j*rand_data[...,::-1]
+            for cur_stage in [CPU_FFT(one_sided=True), CPU_ESD(one_sided=True)]:
+                fin_data = cur_stage.process_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : complex_data.copy()}, 'misc' : {'SampleRates' : [20]}})
+                if isinstance(cur_stage, CPU_FFT):
+                    assert self.arr_equality_pct(fin_data['data']['fft_real'], np.real(np.fft.fft(complex_data))), "CPU FFT does not yield expected result."
+                    assert self.arr_equality_pct(fin_data['data']['fft_imag'], np.imag(np.fft.fft(complex_data))), "CPU FFT does not yield expected result."
+                else:
+                    assert self.arr_equality_pct(fin_data['data']['esd'], np.abs(np.fft.fft(complex_data))**2), "CPU ESD does not yield expected result."
+                assert self.arr_equality(fin_data['parameter_values']['fft_frequency'], np.fft.fftfreq(data_size, 1.0/20)), "CPU FFT does not give right frequencies."
+        #
+        #Single-precision inputs stay in single-precision and the frequency axis is reused
+        fft_stage = CPU_FFT()
+        fin_data = fft_stage.process_data({'parameters' : ['segment', 'sample'], 'data' : {'ch1' : np.random.rand(2, 64).astype(np.float32)}, 'misc' : {'SampleRates' : [20]}})
+        assert fin_data['data']['fft_real'].dtype == np.float32, "CPU FFT did not preserve single-precision."
+        fin_data2 = fft_stage.process_data({'parameters' : ['segment', 'sample'], 'data' : {'ch1' : np.random.rand(2, 64).astype(np.float32)}, 'misc' : {'SampleRates' : [20]}})
+        assert fin_data['parameter_values']['fft_frequency'] is fin_data2['parameter_values']['fft_frequency'], "CPU FFT did not cache the frequency axis."
+        self.cleanup()
+
+    def test_Profiler(self):
+        self.initialise()
+        num_blocks = 3
+        blocks = [np.random.rand(4, 2, 256) for m in range(num_blocks)]
+        for cur_proc in [ProcessorCPU('cpu_test', self.lab), ProcessorCPUPool('cpu_pool_test', self.lab, num_workers=2)]:
+            cur_proc.reset_pipeline()
+            cur_proc.add_stage(CPU_ConstantArithmetic(2, '*'))
+            cur_proc.add_stage(CPU_Mean('sample'))
+            cur_proc.add_stage_end(CPU_Mean('segment'))
+            assert not cur_proc.ProfilingEnabled, "Profiling is enabled by default."
+            with self.assertRaises(AssertionError):
+                cur_proc.get_profile_report()
+            cur_proc.enable_profiling()
+            for cur_block in blocks:
+                cur_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : cur_block.copy()}, 'misc' : {'SampleRates' : [1e9]}})
+            fin_data = cur_proc.get_all_data()
+            assert self.arr_equality(fin_data['data']['ch1'], np.mean(2*np.concatenate(blocks), axis=(1,2))), "Profiling changed the processed result."
+            #
+            report = cur_proc.get_profile_report()
+            assert len(report['Records']) == 2*num_blocks + 1, "Profiler did not record every stage call."
+            main_records = [x for x in report['Records'] if x['Pipeline'] == 'main' and x['StageIndex'] == 1]
+            assert [x['Call'] for x in main_records] == list(range(num_blocks)), "Profiler did not number the stage calls."
+            assert main_records[0]['Stage'] == 'CPU_Mean', "Profiler did not record the stage type."
+            assert main_records[0]['InputShapes'] == {'ch1' : [4, 2, 256]} and main_records[0]['OutputShapes'] == {'ch1' : [4, 2]}, "Profiler did not record the data shapes."
+            assert main_records[0]['InputDtypes'] == {'ch1' : 'float64'}, "Profiler did not record the data types."
+            assert all(x['Time'] > 0 for x in report['Records']), "Profiler did not record the stage times."
+            #The multiplication allocates a new array the size of the input block
+            assert all(x['BytesAllocated'] >= 0 for x in report['Records']), "Profiler did not record the memory allocated."
+            assert [(x['Pipeline'], x['StageIndex'], x['Calls']) for x in report['Summary']] == [('main', 0, num_blocks), ('main', 1, num_blocks), ('end', 0, 1)], "Profiler summary is incorrect."
+            #
+            cur_proc.save_profile_report('test_save_dir/profile.json')
+            with open('test_save_dir/profile.json') as infile:
+                assert json.load(infile)['Summary'] == report['Summary'], "Profiler did not save the report."
+            cur_proc.clear_profile()
+            assert cur_proc.get_profile_report()['Records'] == [], "Profiler did not clear the records."
+            cur_proc.disable_profiling()
+            assert not cur_proc.ProfilingEnabled, "Profiling was not disabled."
+            if isinstance(cur_proc, ProcessorCPUPool):
+                cur_proc.shutdown()
+        assert not tracemalloc.is_tracing(), "Profiler did not stop tracing the memory."
+        self.cleanup()
+
+    def test_PipelinePlan(self):
+        self.initialise()
+        data_in = np.random.rand(4, 3, 64)
+        data_in2 = np.random.rand(4, 3, 64)
+        def run_proc(stages):
+            new_proc = ProcessorCPU('cpu_test', self.lab)
+            new_proc.reset_pipeline()
+            for cur_stage in stages:
+                new_proc.add_stage(cur_stage)
+            new_proc.push_data({'parameters' : ['repetition', 'segment', 'sample'], 'data' : {'ch1' : data_in.copy(), 'ch2' : data_in2.copy()}, 'misc' : {'SampleRates' : [1e9]*2}})
+            return new_proc.get_all_data(), new_proc._get_exec_pipeline()
+
+        #Duplicated channels are aliased if nothing modifies them later
+        stages = [CPU_Duplicate([2,1]), CPU_Mean('sample')]
+        fin_data, exec_pipeline = run_proc(stages)
+        assert exec_pipeline[0]._alias and not stages[0]._alias, "Pipeline planning did not alias the duplicated channels."
+        assert self.arr_equality(fin_data['data']['ch1_0'], np.mean(data_in, axis=2)) and self.arr_equality(fin_data['data']['ch1_1'], np.mean(data_in, axis=2)), "Aliased duplicates do not yield the expected result."
+        assert self.arr_equality(fin_data['data']['ch2'], np.mean(data_in2, axis=2)), "Aliased duplicates do not yield the expected result."
+        #...but not when a later stage operates in-place
+        fin_data, exec_pipeline = run_proc([CPU_Duplicate([2,1]), CPU_ConstantArithmetic(2, '*', [1])])
+        assert not exec_pipeline[0]._alias, "Pipeline planning aliased duplicates that are modified in-place."
+        assert self.arr_equality(fin_data['data']['ch1_0'], 2*data_in) and self.arr_equality(fin_data['data']['ch1_1'], data_in), "Duplicates modified in-place do not yield the expected result."
+
+        #A single slice is moved ahead of the constant arithmetic
+        stages = [CPU_ConstantArithmetic(3, '+'), CPU_ConstantArithmetic(2, '*', [1]), CPU_Slice([(0,2)], axis=1)]
+        fin_data, exec_pipeline = run_proc(stages)
+        assert [type(x) for x in exec_pipeline] == [CPU_Slice, CPU_ConstantArithmetic, CPU_ConstantArithmetic], "Pipeline planning did not move the slice upstream."
+        assert self.arr_equality(fin_data['data']['ch1_slice0'], data_in[:,0:2] + 3), "Moving the slice upstream does not yield the expected result."
+        assert self.arr_equality(fin_data['data']['ch2_slice0'], 2*(data_in2[:,0:2] + 3)), "Moving the slice upstream does not yield the expected result."
+        #Multiple slices may overlap and are left as is
+        fin_data, exec_pipeline = run_proc([CPU_ConstantArithmetic(3, '+'), CPU_Slice([(0,2),(1,3)], axis=1)])
+        assert [type(x) for x in exec_pipeline] == [CPU_ConstantArithmetic, CPU_Slice], "Pipeline planning moved multiple slices upstream."
+        assert self.arr_equality(fin_data['data']['ch1_slice1'], data_in[:,1:3] + 3), "Multiple slices do not yield the expected result."
+
+        #Channel arithmetic writes into its input unless channels may share memory
+        stages = [CPU_ChannelArithmetic([0,1], '-'), CPU_Mean('sample')]
+        fin_data, exec_pipeline = run_proc(stages)
+        assert exec_pipeline[0]._in_place and not stages[0]._in_place, "Pipeline planning did not run the channel arithmetic in-place."
+        assert self.arr_equality(fin_data['data']['ch1_-_ch2'], np.mean(data_in - data_in2, axis=2)), "In-place channel arithmetic does not yield the expected result."
+        fin_data, exec_pipeline = run_proc([CPU_Duplicate([2,1]), CPU_ChannelArithmetic([0,1], '+')])
+        assert not exec_pipeline[1]._in_place and exec_pipeline[0]._alias, "Pipeline planning ran the channel arithmetic in-place on aliased channels."
+        assert self.arr_equality(fin_data['data']['ch2_+_ch1_0'], data_in2 + data_in) and self.arr_equality(fin_data['data']['ch1_1'], data_in), "Channel arithmetic on duplicates does not yield the expected result."
+        self.cleanup()
 
+    def test_Benchmark(self):
+        bench = ProcessorBenchmark('small', 1, cases=['Mean-Repetition', 'DDC-FIR-Mean-float32'])
+        results = bench.run()
+        assert list(results['Results'].keys()) == ['Mean-Repetition', 'DDC-FIR-Mean-float32'], "Benchmark did not run the given cases."
+        num_reps, num_segs, num_samples, block_reps = ProcessorBenchmark.SIZES['small']
+        for cur_result in results['Results'].values():
+            assert cur_result['Samples'] == 2*num_reps*num_segs*num_samples, "Benchmark did not count the input samples."
+            assert cur_result['SamplesPerSecond'] > 0 and cur_result['PeakBytes'] > 0, "Benchmark did not record the throughput or memory."
+        assert results['Results']['DDC-FIR-Mean-float32']['Precision'] == 'float32', "Benchmark did not run the case in single-precision."
+        assert not tracemalloc.is_tracing(), "Benchmark did not stop tracing the memory."
+        #
+        ProcessorBenchmark.save_results(results, 'bench_test.json')
+        baseline = ProcessorBenchmark.load_results('bench_test.json')
+        os.remove('bench_test.json')
+        comparison = ProcessorBenchmark.compare_results(baseline, results)
+        assert [x['Case'] for x in comparison] == ['Mean-Repetition', 'DDC-FIR-Mean-float32'], "Benchmark comparison did not match the cases."
+        assert all(x['Speedup'] == 1.0 and not x['Regression'] for x in comparison), "Benchmark comparison against itself flagged a regression."
+        baseline['Results']['Mean-Repetition']['SamplesPerSecond'] *= 2
+        assert ProcessorBenchmark.compare_results(baseline, results)[0]['Regression'], "Benchmark comparison did not flag a regression."
 
 
 class TestGPU(unittest.TestCase):
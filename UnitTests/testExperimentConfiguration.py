@@ -612,6 +612,46 @@ class TestHALInstantiation(unittest.TestCase):
         assert assert_found, "Function update_waveforms failed to trigger an assertion error when feeding waveforms of different size while demanding reference marker segments amongst each other."
 
         self.cleanup()
+
+    def test_PrepareUnchangedHALs(self):
+        self.initialise()
+        hal_mw = self.lab.HAL('MW-Src')
+        hal_ddg = self.lab.HAL('ddg')
+        expConfig = ExperimentConfiguration('testConf', self.lab, 1.0, ['ddg', 'MW-Src'], 'dum_acq')
+        num_preparations = {'ddg' : 0, 'MW-Src' : 0}
+        def count_preparations(hal):
+            orig_prepare = hal.prepare_initial
+            def prepare_initial():
+                num_preparations[hal.Name] += 1
+                orig_prepare()
+            return prepare_initial
+        hal_mw.prepare_initial = count_preparations(hal_mw)
+        hal_ddg.prepare_initial = count_preparations(hal_ddg)
+        #
+        expConfig.init_instruments()
+        expConfig.prepare_instruments(skip_unchanged=True)
+        assert num_preparations == {'ddg' : 1, 'MW-Src' : 1}, "All HALs must be prepared on the first call to prepare_instruments."
+        expConfig.prepare_instruments(skip_unchanged=True)
+        assert num_preparations == {'ddg' : 1, 'MW-Src' : 1}, "Unchanged HALs were re-prepared."
+        hal_mw.Frequency = 5e9
+        expConfig.prepare_instruments(skip_unchanged=True)
+        assert num_preparations == {'ddg' : 1, 'MW-Src' : 2}, "Only the HAL with changed properties should be re-prepared."
+        expConfig.prepare_instruments()
+        assert num_preparations == {'ddg' : 2, 'MW-Src' : 3}, "All HALs must be prepared when not skipping unchanged HALs."
+        #Unchanged HALs must still be activated (e.g. if the output was switched off directly via the driver)
+        hal_mw._instr_mw_output.Output = False
+        expConfig.prepare_instruments(skip_unchanged=True)
+        assert hal_mw.Output, "The unchanged MW source was not reactivated."
+        assert num_preparations == {'ddg' : 2, 'MW-Src' : 3}, "Unchanged HALs were re-prepared."
+        #Making the instruments safe must force the next preparation to include all HALs
+        expConfig.makesafe_instruments()
+        assert not hal_mw.Output, "The MW source was not deactivated."
+        expConfig.prepare_instruments(skip_unchanged=True)
+        assert num_preparations == {'ddg' : 3, 'MW-Src' : 4}, "All HALs must be prepared after making the instruments safe."
+        assert hal_mw.Output, "The MW source was not reactivated."
+        self.cleanup()
+
+
 class TestSaveLoad(unittest.TestCase):
     def initialise(self):
         self.lab = Laboratory('UnitTests\\UTestExperimentConfiguration.yaml', 'test_save_dir/')
@@ -89,6 +89,55 @@ class TestExpFileIO(unittest.TestCase):
         reader = None
         self.cleanup()
     
+    def test_DirectoryLazyAndCache(self):
+        self.initialise()
+        self.lab.group_open("test_group")
+        for m in self.lab.VAR("testAmpl").arange(0,3,1):
+            exp = Experiment("test", self.lab.CONFIG('testConf'))
+            res = self.lab.run_single(exp, [(self.lab.VAR("myFreq"), np.arange(4))])
+            time.sleep(1)
+        self.lab.group_close()
+        #
+        reader = FileIODirectory.fromReader(res, use_index_cache=False)
+        arr = reader.get_numpy_array()
+        ts = reader.get_time_stamps()
+        assert arr.shape[:2] == (3,4), "FileIODirectory returns the wrong array shape."
+        cache_file = os.path.dirname(os.path.dirname(res.file_path)) + '/' + FileIODirectory.INDEX_CACHE_FILE
+        assert not os.path.isfile(cache_file), "FileIODirectory wrote an index cache when it was disabled."
+        #
+        lazy_arr = reader.get_lazy_array()
+        assert lazy_arr.shape == arr.shape, "FileIODirectory returns a lazy array of the wrong shape."
+        for cur_slice in [np.s_[1], np.s_[:,2], np.s_[::2,1:3], np.s_[-1,...,0], np.s_[[2,0]]]:
+            assert self.arr_equality(lazy_arr[cur_slice], arr[cur_slice]), f"FileIODirectory lazy array does not slice correctly for {cur_slice}."
+        #
+        #The first scan writes the index cache, while the second uses it
+        reader2 = FileIODirectory.fromReader(res)
+        assert os.path.isfile(cache_file), "FileIODirectory did not write an index cache."
+        reader3 = FileIODirectory.fromReader(res)
+        for cur_rdr in [reader2, reader3]:
+            assert cur_rdr.param_names == reader.param_names, "FileIODirectory returns wrong parameters when using the index cache."
+            assert all(self.arr_equality(x,y) for x,y in zip(cur_rdr.param_vals, reader.param_vals)), "FileIODirectory returns wrong parameters when using the index cache."
+            assert cur_rdr.folders == reader.folders, "FileIODirectory returns wrong folders when using the index cache."
+            assert self.arr_equality(cur_rdr.get_numpy_array(), arr), "FileIODirectory returns wrong data when using the index cache."
+            assert np.array_equal(cur_rdr.get_time_stamps(), ts), "FileIODirectory returns wrong time-stamps when using the index cache."
+        #
+        #Deleted folders are dropped from the index cache while the entries of other scans are kept
+        with open(cache_file) as json_file:
+            cache_data = json.load(json_file)
+        cache_data['000000-other/data.h5'] = cache_data[os.path.basename(reader.folders[0]) + '/' + os.path.basename(res.file_path)]
+        with open(cache_file, 'w') as outfile:
+            json.dump(cache_data, outfile)
+        shutil.rmtree(reader.folders[0])
+        reader4 = FileIODirectory.fromReader(res)
+        assert reader4.folders == reader.folders[1:], "FileIODirectory returns wrong folders after deleting a folder."
+        with open(cache_file) as json_file:
+            cache_data = json.load(json_file)
+        assert sorted(cache_data.keys()) == sorted(['000000-other/data.h5'] + [os.path.basename(x) + '/' + os.path.basename(res.file_path) for x in reader.folders[1:]]), "FileIODirectory did not prune the index cache."
+        #
+        res.release()
+        res = None
+        self.cleanup()
+
     def test_ManyOneSampling(self):
         self.initialise()
         VariableInternal('test_var', self.lab, 0)
@@ -186,6 +235,220 @@ class TestExpFileIO(unittest.TestCase):
         reader = None
         self.cleanup()
 
+    def test_BufferedWriter(self):
+        self.initialise()
+        sweep_vars = [(self.lab.VAR("myFreq"), np.arange(5)), (self.lab.VAR("testAmpl"), np.arange(7))]
+        data_pkts = [{'parameters' : ['repetition', 'sample'], 'data' : {'rf_I' : np.random.rand(3,4), 'rf_Q' : np.random.rand(3,4)}} for m in range(35)]
+        arr_expected = np.stack([np.stack([x['data']['rf_I'], x['data']['rf_Q']], axis=-1) for x in data_pkts]).reshape(5,7,3,4,2)
+        #
+        #Ring buffer smaller than the dataset (forces wrap-arounds) with flushing only on a full buffer
+        writer = FileIOWriter('testFile.h5', buffered=True, flush_time=1e9, flush_size=3*12*2*8, chunk_size=12*2*8)
+        for m in range(10):
+            writer.push_datapkt(data_pkts[m], sweep_vars)
+        tempRdr = FileIOReader('testFile.h5')
+        arr = tempRdr.get_numpy_array().reshape(-1,3,4,2)
+        assert self.arr_equality(arr[:9], arr_expected.reshape(-1,3,4,2)[:9]), "Buffered FileIOWriter did not write full ring buffers onto disk."
+        assert np.all(np.isnan(arr[9:])), "Buffered FileIOWriter wrote a partially filled ring buffer onto disk before the flush time."
+        tempRdr.release()
+        for m in range(10,35):
+            writer.push_datapkt(data_pkts[m], sweep_vars)
+        writer.close()
+        tempRdr = FileIOReader('testFile.h5')
+        assert self.arr_equality(tempRdr.get_numpy_array(), arr_expected), "Buffered FileIOWriter did not write the data correctly."
+        assert tempRdr.get_time_stamps().shape == (5,7,3,4), "Buffered FileIOWriter did not write the time-stamps correctly."
+        assert np.all(~np.isnat(tempRdr.get_time_stamps())), "Buffered FileIOWriter did not write the time-stamps correctly."
+        tempRdr.release()
+        os.remove('testFile.h5')
+        #
+        #Zero flush time must make every packet visible to SWMR readers immediately
+        writer = FileIOWriter('testFile.h5', buffered=True, flush_time=0)
+        writer.push_datapkt(data_pkts[0], sweep_vars)
+        tempRdr = FileIOReader('testFile.h5')
+        arr = tempRdr.get_numpy_array().reshape(-1,3,4,2)
+        assert self.arr_equality(arr[0], arr_expected.reshape(-1,3,4,2)[0]), "Buffered FileIOWriter did not flush the data on the flush time."
+        assert np.all(np.isnan(arr[1:])), "Buffered FileIOWriter wrote erroneous data."
+        tempRdr.release()
+        writer.close()
+        os.remove('testFile.h5')
+        #
+        #Run an experiment with buffered writes
+        exp = Experiment("test", self.lab.CONFIG('testConf'))
+        res = self.lab.run_single(exp, [(self.lab.VAR("myFreq"), np.arange(3))], buffered_writes=True)
+        arr = res.get_numpy_array()
+        assert arr.shape[0] == 3 and not np.any(np.isnan(arr)), "Buffered writes in an experiment did not write all the data."
+        res.release()
+        res = None
+        self.cleanup()
+
+    def test_StreamedDataBlocks(self):
+        self.initialise()
+        sweep_vars = [(self.lab.VAR("myFreq"), np.arange(3))]
+        data_pkts = [{'parameters' : ['repetition', 'sample'], 'data' : {'rf_I' : np.random.rand(5,4), 'rf_Q' : np.random.rand(5,4)}} for m in range(3)]
+        arr_expected = np.stack([np.stack([x['data']['rf_I'], x['data']['rf_Q']], axis=-1) for x in data_pkts])
+        for compact_ts in [False, True]:
+            writer = FileIOWriter('testFile.h5', compact_timestamps=compact_ts)
+            for cur_pkt in data_pkts:
+                #Stream in uneven blocks of repetitions
+                blocks = ({'parameters' : cur_pkt['parameters'], 'data' : {k : v[r:r+2] for k,v in cur_pkt['data'].items()}} for r in range(0,5,2))
+                writer.push_datapkt_blocks(blocks, 5, sweep_vars)
+            writer.close()
+            tempRdr = FileIOReader('testFile.h5')
+            assert self.arr_equality(tempRdr.get_numpy_array(), arr_expected), "FileIOWriter did not write streamed data blocks correctly."
+            assert tempRdr.param_names == ['myFreq', 'repetition', 'sample'], "FileIOWriter did not write the parameters of streamed data blocks correctly."
+            assert np.all(~np.isnat(tempRdr.get_time_stamps())), "FileIOWriter did not write the time-stamps of streamed data blocks correctly."
+            tempRdr.release()
+            os.remove('testFile.h5')
+        #
+        #Run an experiment streaming the raw data from the ACQ
+        exp = Experiment("test", self.lab.CONFIG('testConf'))
+        res = self.lab.run_single(exp, [(self.lab.VAR("myFreq"), np.arange(3))])
+        shape_expected = res.get_numpy_array().shape
+        res.release()
+        time.sleep(1)
+        res = self.lab.run_single(exp, [(self.lab.VAR("myFreq"), np.arange(3))], stream_data=True)
+        arr = res.get_numpy_array()
+        assert arr.shape == shape_expected and not np.any(np.isnan(arr)), "Streaming data in an experiment did not write all the data."
+        res.release()
+        res = None
+        self.cleanup()
+
+    def test_WriterThread(self):
+        self.initialise()
+        sweep_vars = [(self.lab.VAR("myFreq"), np.arange(5)), (self.lab.VAR("testAmpl"), np.arange(7))]
+        data_pkts = [{'parameters' : ['repetition', 'sample'], 'data' : {'rf_I' : np.random.rand(3,4), 'rf_Q' : np.random.rand(3,4)}} for m in range(35)]
+        arr_expected = np.stack([np.stack([x['data']['rf_I'], x['data']['rf_Q']], axis=-1) for x in data_pkts]).reshape(5,7,3,4,2)
+        writer = FileIOWriter('testFile.h5')
+        writer_thread = FileIOWriterThread(max_queue_size=2)
+        for cur_pkt in data_pkts:
+            writer_thread.push_datapkt(writer, cur_pkt, sweep_vars)
+        writer_thread.close()
+        writer.close()
+        tempRdr = FileIOReader('testFile.h5')
+        assert self.arr_equality(tempRdr.get_numpy_array(), arr_expected), "FileIOWriterThread did not write the data correctly."
+        tempRdr.release()
+        os.remove('testFile.h5')
+        #
+        #Errors in the writer thread must be raised in the calling thread
+        writer = FileIOWriter('testFile.h5')
+        writer_thread = FileIOWriterThread(max_queue_size=2)
+        writer_thread.push_datapkt(writer, data_pkts[0], sweep_vars)
+        writer_thread.push_datapkt(writer, {'parameters' : ['repetition', 'sample'], 'data' : {'bad_ch' : np.random.rand(3,4)}}, sweep_vars)
+        with self.assertRaises(KeyError):
+            for m in range(1,35):
+                writer_thread.push_datapkt(writer, data_pkts[m], sweep_vars)
+            writer_thread.close()
+        assert not writer_thread._thread.is_alive(), "FileIOWriterThread did not stop after an error."
+        writer.close()
+        os.remove('testFile.h5')
+        #
+        #The time-stamps are taken when the data packets are queued (not when the delayed writer thread writes them)
+        class FileIOWriterSlow(FileIOWriter):
+            def push_datapkt(self, *args, **kwargs):
+                time.sleep(0.2)
+                super().push_datapkt(*args, **kwargs)
+        sweep_vars = [(self.lab.VAR("myFreq"), np.arange(5))]
+        writer = FileIOWriterSlow('testFile.h5')
+        writer_thread = FileIOWriterThread(max_queue_size=8)
+        queue_times = []
+        for m in range(5):
+            queue_times += [np.datetime64(datetime.now(), 'us')]
+            writer_thread.push_datapkt(writer, data_pkts[m], sweep_vars)
+            time.sleep(0.05)
+        writer_thread.close()
+        writer.close()
+        tempRdr = FileIOReader('testFile.h5')
+        ts_lags = (tempRdr.get_time_stamps()[:,0,0] - np.array(queue_times)) / np.timedelta64(1, 'ms')
+        assert np.all(np.abs(ts_lags) < 40), "FileIOWriterThread did not time-stamp the data packets when they were queued."
+        tempRdr.release()
+        os.remove('testFile.h5')
+        #
+        #Run an experiment with asynchronous writes
+        exp = Experiment("test", self.lab.CONFIG('testConf'))
+        res = self.lab.run_single(exp, [(self.lab.VAR("myFreq"), np.arange(3))], async_writes=True, rec_params=[self.lab.VAR("testAmpl")])
+        arr = res.get_numpy_array()
+        assert arr.shape[0] == 3 and not np.any(np.isnan(arr)), "Asynchronous writes in an experiment did not write all the data."
+        res.release()
+        res = None
+        assert exp.last_rec_params.get_numpy_array().shape[0] == 3, "Asynchronous writes in an experiment did not write the recorded parameters."
+        exp.last_rec_params.release()
+        self.cleanup()
+
+    def test_LazyAllocation(self):
+        self.initialise()
+        #A 10^8 point dataset should not be materialised in RAM or on disk on writing the first data packet
+        sweep_vars = [(self.lab.VAR("myFreq"), np.arange(10000)), (self.lab.VAR("testAmpl"), np.arange(1000))]
+        data_pkt = {'parameters' : ['sample'], 'data' : {'rf_I' : np.random.rand(10), 'rf_Q' : np.random.rand(10)}}
+        writer = FileIOWriter('testFile.h5')
+        writer.push_datapkt(data_pkt, sweep_vars)
+        assert writer._dset.id.get_storage_size() < 10*1024**2, "FileIOWriter allocated the entire dataset on initialisation."
+        writer.close()
+        tempRdr = FileIOReader('testFile.h5')
+        assert tempRdr.dset.shape == (10**8, 2), "FileIOWriter created a dataset of the wrong size."
+        assert self.arr_equality(tempRdr.dset[:10], np.vstack([data_pkt['data']['rf_I'], data_pkt['data']['rf_Q']]).T), "FileIOWriter did not write the first data packet correctly."
+        assert np.all(np.isnan(tempRdr.dset[10:1000])), "Unwritten points in the dataset are not NaN."
+        assert np.all(tempRdr.dsetTS[10:1000] == b'NaT'), "Unwritten time-stamps are not NaT."
+        tempRdr.release()
+        os.remove('testFile.h5')
+        self.cleanup()
+
+    def test_CompactTimeStamps(self):
+        self.initialise()
+        sweep_vars = [(self.lab.VAR("myFreq"), np.arange(3)), (self.lab.VAR("testAmpl"), np.arange(2))]
+        data_pkt = {'parameters' : ['sample'], 'data' : {'rf_I' : np.random.rand(5), 'rf_Q' : np.random.rand(5)}}
+        for buffered in [False, True]:
+            ts_files = []
+            for compact in [False, True]:
+                writer = FileIOWriter('testFile.h5', compact_timestamps=compact, buffered=buffered)
+                for m in range(5):
+                    writer.push_datapkt(data_pkt, sweep_vars)
+                writer.close()
+                tempRdr = FileIOReader('testFile.h5')
+                if compact:
+                    assert tempRdr.dsetTS.shape == (6,), "Compact time-stamps are not stored once per data packet."
+                ts_files += [tempRdr.get_time_stamps()]
+                tempRdr.release()
+                os.remove('testFile.h5')
+            for ts in ts_files:
+                assert ts.shape == (3,2,5), "Time-stamps are returned in the wrong shape."
+                assert np.all(~np.isnat(ts[:2])) and np.all(~np.isnat(ts[2,0])), "Written time-stamps are not valid."
+                assert np.all(np.isnat(ts[2,1])), "Unwritten time-stamps are not NaT."
+                assert np.all(ts[:2,:,1:] == ts[:2,:,:1]), "Time-stamps are not the same across a data packet."
+            assert np.abs(ts_files[0][0,0,0] - ts_files[1][0,0,0]) < np.timedelta64(10,'s'), "Compact time-stamps do not match the legacy time-stamps."
+        #
+        #Run an experiment with compact time-stamps and check that FileIODirectory parses them
+        self.lab.group_open("test_group")
+        for m in range(2):
+            exp = Experiment("test", self.lab.CONFIG('testConf'))
+            res = self.lab.run_single(exp, [(self.lab.VAR("myFreq"), np.arange(3))], compact_timestamps=True)
+            time.sleep(1)
+        self.lab.group_close()
+        reader = FileIODirectory.fromReader(res)
+        assert np.all(~np.isnat(reader.get_time_stamps())), "FileIODirectory did not parse compact time-stamps."
+        assert reader.get_time_stamps().shape == reader.get_numpy_array().shape[:-1], "FileIODirectory did not parse compact time-stamps."
+        res.release()
+        res = None
+        self.cleanup()
+
+    def test_LazyArray(self):
+        data_array = np.random.rand(4,5,6,3)
+        param_names = ["power", "frequency", "flux"]
+        param_vals = [np.arange(4), np.arange(5), np.arange(6)]
+        FileIOWriter.write_file_direct('testFile.h5', data_array, param_names, param_vals, ['rf_I', 'rf_Q', 'rf_A'])
+        tempRdr = FileIOReader('testFile.h5')
+        lazy_arr = tempRdr.get_lazy_array()
+        assert lazy_arr.shape == data_array.shape, "The lazy array has the wrong shape."
+        assert self.arr_equality(np.asarray(lazy_arr), data_array), "The lazy array does not convert into the full array."
+        test_slices = [np.s_[2], np.s_[:,3], np.s_[...,1], np.s_[1,:,2,0], np.s_[1:3,::2,-1], np.s_[:,:,2:4], np.s_[::-1,1,:,1:],
+                       np.s_[3,4,5,2], np.s_[:,:,:,::2], np.s_[1:1]]
+        for cur_slice in test_slices:
+            assert self.arr_equality(lazy_arr[cur_slice], data_array[cur_slice]), f"The lazy array does not slice correctly for {cur_slice}."
+            assert lazy_arr[cur_slice].shape == data_array[cur_slice].shape, f"The lazy array does not slice correctly for {cur_slice}."
+        #Integer arrays index each axis independently
+        assert self.arr_equality(lazy_arr[[3,1],:,[0,5]], data_array[[3,1]][:,:,[0,5]]), "The lazy array does not slice correctly via integer arrays."
+        assert self.arr_equality(lazy_arr[...,[2,0]], data_array[...,[2,0]]), "The lazy array does not slice correctly via integer arrays."
+        tempRdr.release()
+        os.remove('testFile.h5')
+
     def test_WriteFileDirect(self):
         data_array = np.zeros( (2,3,4,2) )
         param_names = ["power", "frequency", "flux"]
@@ -19,6 +19,8 @@ from sqdtoolz.HAL.Processors.CPU.CPU_FIR import*
 from sqdtoolz.HAL.Processors.CPU.CPU_Mean import*
 
 import numpy as np
+import itertools
+import json
 import shutil
 import os.path
 
@@ -869,6 +871,141 @@ class TestSweeps(unittest.TestCase):
         shutil.rmtree('test_save_dir')
         self.cleanup()
 
+    def test_SweepChangedVarsOnly(self):
+        self.initialise()
+        self.lab.HAL('dum_acq').set_trigger_source(None)
+        self.lab.HAL('dum_acq').set_data_processor(None)
+        ExperimentConfiguration('testConf', self.lab, 1.0, ['ddg'], 'dum_acq')
+        #
+        #The lazy sweep iterator must follow the same ordering as the data file (last axis varying the fastest)
+        sweep_arrays = [np.arange(3), np.arange(4)*0.5, np.arange(2)+10]
+        grid_exp = np.array(list(itertools.product(*sweep_arrays)))
+        grid_act = np.array([[sweep_arrays[m][x] for m, x in enumerate(cur_inds)] for ind, first_changed, cur_inds in Experiment._iter_sweep_grid(sweep_arrays)])
+        assert self.arr_equality(grid_act, grid_exp), "The sweep iterator did not traverse the grid in the correct order."
+        #
+        num_sets = {'myFreq' : 0, 'myDura1' : 0}
+        def count_sets(var):
+            orig_set_raw = var.set_raw
+            def set_raw(value):
+                num_sets[var.Name] += 1
+                orig_set_raw(value)
+            return set_raw
+        self.lab.VAR('myFreq').set_raw = count_sets(self.lab.VAR('myFreq'))
+        self.lab.VAR('myDura1').set_raw = count_sets(self.lab.VAR('myDura1'))
+        exp = Experiment("test", self.lab.CONFIG('testConf'))
+        res = self.lab.run_single(exp, [(self.lab.VAR("myFreq"), np.arange(3)), (self.lab.VAR("myDura1"), np.arange(4))], rec_params=[self.lab.VAR('myFreq'), self.lab.VAR('myDura1')])
+        res.release()
+        assert num_sets == {'myFreq' : 3, 'myDura1' : 12}, "The sweep set variables on axes that did not change."
+        assert self.arr_equality(exp.last_rec_params.get_numpy_array().reshape(-1,2), np.array(list(itertools.product(np.arange(3), np.arange(4))))), "The sweep set the wrong variable values."
+        exp.last_rec_params.release()
+        time.sleep(1)
+        #
+        num_sets = {'myFreq' : 0, 'myDura1' : 0}
+        res = self.lab.run_single(exp, [(self.lab.VAR("myFreq"), np.arange(3)), (self.lab.VAR("myDura1"), np.arange(4))], set_all_sweep_vars=True)
+        res.release()
+        assert num_sets == {'myFreq' : 12, 'myDura1' : 12}, "The sweep did not set all variables on every point."
+        self.cleanup()
+
+    def test_ProcessorProfile(self):
+        self.initialise()
+        new_proc = ProcessorCPU('cpu_profile', self.lab)
+        new_proc.reset_pipeline()
+        new_proc.add_stage(CPU_Mean('sample'))
+        new_proc.add_stage_end(CPU_Mean('repetition'))
+        self.lab.HAL('dum_acq').set_trigger_source(None)
+        self.lab.HAL('dum_acq').set_data_processor(new_proc)
+        ExperimentConfiguration('testConf', self.lab, 1.0, ['ddg'], 'dum_acq')
+        #
+        #The profile is only saved when profiling the processor
+        exp = Experiment("test", self.lab.CONFIG('testConf'))
+        res = self.lab.run_single(exp, [(self.lab.VAR("myFreq"), np.arange(3))])
+        assert not os.path.isfile(res.folder_path + '/processor_profile.json'), "The processor profile was saved without profiling."
+        res.release()
+        time.sleep(1)
+        #
+        new_proc.enable_profiling(trace_memory=False)
+        res = self.lab.run_single(exp, [(self.lab.VAR("myFreq"), np.arange(3))])
+        with open(res.folder_path + '/processor_profile.json') as infile:
+            report = json.load(infile)
+        res.release()
+        time.sleep(1)
+        assert [(x['Pipeline'], x['Stage'], x['Calls']) for x in report['Summary']] == [('main', 'CPU_Mean', 3), ('end', 'CPU_Mean', 6)], "The saved processor profile does not cover the run."
+        assert all(x['BytesAllocated'] == None for x in report['Records']), "The processor profile traced the memory when not requested."
+        new_proc.disable_profiling()
+        self.lab.HAL('dum_acq').set_data_processor(None)
+        self.cleanup()
+
+    def test_ExperimentIndex(self):
+        self.initialise()
+        self.lab.HAL('dum_acq').set_trigger_source(None)
+        self.lab.HAL('dum_acq').set_data_processor(None)
+        ExperimentConfiguration('testConf', self.lab, 1.0, ['ddg'], 'dum_acq')
+        #
+        self.lab.VAR("myFreq").Value = 5
+        exp = Experiment("test", self.lab.CONFIG('testConf'))
+        res = self.lab.run_single(exp, [(self.lab.VAR("testAmpl"), np.arange(3))], rec_params=[self.lab.VAR("myFreq")])
+        res.release()
+        time.sleep(1)
+        self.lab.group_open("test_group")
+        for cur_freq in self.lab.VAR("myFreq").array([1,2]):
+            exp = Experiment("test2", self.lab.CONFIG('testConf'))
+            res = self.lab.run_single(exp)
+            res.release()
+            time.sleep(1)
+        self.lab.group_close()
+        #
+        expt_index = ExperimentIndex('test_save_dir/')
+        entries = expt_index.get_entries()
+        assert len(entries) == 3, "The experiment index did not record every experiment."
+        assert [x['Name'] for x in entries] == ['test', 'test2', 'test2'], "The experiment index recorded the wrong experiment names."
+        assert [x['Group'] for x in entries] == ['', 'test_group', 'test_group'], "The experiment index recorded the wrong groups."
+        assert entries[0]['Sweeps'] == ['testAmpl'] and entries[1]['Sweeps'] == [], "The experiment index recorded the wrong sweeping variables."
+        assert entries[0]['Shape'][0] == 3, "The experiment index recorded the wrong data shape."
+        assert entries[0]['RecParamsFile'] == 'rec_params.h5' and not 'RecParamsFile' in entries[1], "The experiment index recorded the wrong rec_params file."
+        for cur_entry in entries:
+            assert os.path.isfile(expt_index.get_folder_path(cur_entry) + cur_entry['DataFile']), "The experiment index recorded the wrong data file path."
+        assert expt_index.get_last_entry() == entries[-1], "The experiment index did not return the last entry."
+        assert list(expt_index.iter_entries_reversed(block_size=16)) == entries[::-1], "The experiment index did not read the entries in reverse."
+        #
+        #Experiments that raise an error are still recorded
+        class ExperimentFail(Experiment):
+            def _run(self, file_path, sweep_vars=[], **kwargs):
+                raise RuntimeError("Experiment failed.")
+        time.sleep(1)
+        with self.assertRaises(RuntimeError):
+            self.lab.run_single(ExperimentFail("test_fail", self.lab.CONFIG('testConf')))
+        fail_entry = expt_index.get_last_entry()
+        assert fail_entry['Name'] == 'test_fail' and not fail_entry['Completed'], "The experiment index did not record the failed experiment."
+        assert os.path.isdir(expt_index.get_folder_path(fail_entry)) and not 'DataFile' in fail_entry, "The experiment index recorded the wrong entry for the failed experiment."
+        entries = expt_index.get_entries()
+        #
+        #Partially written entries (e.g. from a crash) are ignored
+        with open(expt_index.FilePath, 'a') as outfile:
+            outfile.write('{"Name" : "tes')
+        assert expt_index.get_last_entry() == entries[-1], "The experiment index did not ignore a partially written entry."
+        #
+        #Cold reload via the index (i.e. without the last-state files)
+        for cur_file in ['_last_state.txt', '_last_vars.txt', '_last_exp_configs.txt']:
+            os.remove('test_save_dir/' + cur_file)
+        Path('test_save_dir/3099-09-09/123456-test').mkdir(parents=True, exist_ok=True)
+        self.lab.release_all_instruments()
+        self.lab = Laboratory('UnitTests\\UTestExperimentConfiguration.yaml', 'test_save_dir/')
+        self.lab.cold_reload_last_configuration()
+        assert self.lab.VAR("myFreq").Value == 2, "Variable incorrectly reloaded via the experiment index."
+        self.lab.VAR("myFreq").Value = 7
+        self.lab.update_variables_from_last_expt()
+        assert self.lab.VAR("myFreq").Value == 2, "Variable incorrectly reloaded via the experiment index."
+        #
+        #Folders missing from the index (e.g. legacy folders written before the index) are found by walking the save directory
+        with open(expt_index.FilePath, 'w') as outfile:
+            outfile.write(json.dumps(fail_entry) + '\n')
+        self.lab.VAR("myFreq").Value = 7
+        self.lab.update_variables_from_last_expt()
+        assert self.lab.VAR("myFreq").Value == 2, "Variable incorrectly reloaded when falling back from the experiment index."
+
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
 if __name__ == '__main__':
     # temp = TestColdReload()
     # temp.test_LabAndExpConfigs() #test_SPECs()
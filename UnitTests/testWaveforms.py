@@ -791,6 +791,349 @@ class TestSegments(unittest.TestCase):
         shutil.rmtree('test_save_dir')
         self.cleanup()
 
+    def test_LongSequence(self):
+        self.initialise()
+        awg_wfm = self.lab.HAL("Wfm1")
+        WFMT_ModulationIQ('IQmod', self.lab, 47e7)
+
+        #A long pulse-train with an elastic segment, zero-length segments and a repeated group
+        num_pulses = 500
+        segs = [WFS_Constant("SEQPAD", None, 10e-9, 0.0)]
+        for m in range(num_pulses):
+            segs += [WFS_Gaussian(f"pulse{m}", self.lab.WFMT('IQmod').apply(), 20e-9, 0.1 + m/num_pulses)]
+            segs += [WFS_Constant(f"wait{m}", None, (m % 3)*1e-9, 0.0)]
+        segs += [WFS_Group("grp", [WFS_Constant("g0", None, 3e-9, 0.5), WFS_Gaussian("g1", self.lab.WFMT('IQmod').apply(), 7e-9, 0.25)], num_repeats=4)]
+        segs += [WFS_Constant("pad", None, -1, 0.0)]
+        awg_wfm.set_waveform_segments(segs)
+        awg_wfm.set_total_time(12e-6)
+        wfms = awg_wfm.get_raw_waveforms()
+
+        #Compare against assembling the segments one at a time
+        segs[-1].Duration = 12e-6 - sum([x.Duration for x in segs[:-1]])
+        for cur_ch in range(2):
+            for cur_seg in segs:
+                cur_seg.reset_waveform_transforms(self.lab)
+            expected = []
+            t0 = 0
+            for cur_seg in segs:
+                if cur_seg.NumPts(1e9) == 0:
+                    continue
+                expected += [cur_seg.get_waveform(self.lab, 1e9, t0, cur_ch)]
+                t0 += expected[-1].size
+            expected = np.concatenate(expected)
+            assert wfms[cur_ch].size == 12000, "The assembled waveform has the wrong number of points."
+            assert self.arr_equality(wfms[cur_ch], expected), "The preallocated waveform assembly does not match the concatenated segments."
+        segs[-1].Duration = -1
+
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
+    def test_WaveformCache(self):
+        self.initialise()
+        awg_wfm = self.lab.HAL("Wfm1")
+        WFMT_ModulationIQ('IQmod', self.lab, 47e7)
+        cache = WaveformSegmentBase.WaveformCache
+        cache.clear()
+
+        class WFS_CountedConstant(WFS_Constant):
+            num_calls = 0
+            def _get_waveform(self, lab, fs, t0_ind, ch_index):
+                WFS_CountedConstant.num_calls += 1
+                return super()._get_waveform(lab, fs, t0_ind, ch_index)
+
+        #The phase arguments change the state of the WFMT along the waveform
+        awg_wfm.set_waveform_segments([WFS_CountedConstant("pad", None, 10e-9, 0.0),
+                                       WFS_Gaussian("p1", self.lab.WFMT('IQmod').apply(phase=0.3), 20e-9, 0.5),
+                                       WFS_CountedConstant("wait", None, 15e-9, 0.1),
+                                       WFS_Gaussian("p2", self.lab.WFMT('IQmod').apply(phase_offset=0.7), 20e-9, 0.5),
+                                       WFS_Gaussian("p3", self.lab.WFMT('IQmod').apply(), 20e-9, 0.5),
+                                       WFS_Group("grp", [WFS_CountedConstant("g0", self.lab.WFMT('IQmod').apply(), 5e-9, 0.2)], num_repeats=3),
+                                       WFS_CountedConstant("end", None, 10e-9, 0.0)])
+        def get_uncached_waveforms():
+            cache.MaxBytes = 0
+            ret_wfms = np.vstack(awg_wfm.get_raw_waveforms())
+            cache.MaxBytes = 128*2**20
+            return ret_wfms
+
+        wfms = np.vstack(awg_wfm.get_raw_waveforms())
+        num_calls = WFS_CountedConstant.num_calls
+        assert num_calls > 0 and cache.NumEntries > 0, "The waveform cache was not populated."
+        assert self.arr_equality(np.vstack(awg_wfm.get_raw_waveforms()), wfms), "The cached waveforms do not match."
+        assert WFS_CountedConstant.num_calls == num_calls, "The waveform cache did not reuse the unchanged segments."
+        assert self.arr_equality(get_uncached_waveforms(), wfms), "The cached waveforms do not match the uncached waveforms."
+        #
+        #Changing a segment only regenerates said segment (disabling the cache above emptied it)
+        awg_wfm.get_raw_waveforms()
+        num_calls = WFS_CountedConstant.num_calls
+        awg_wfm.get_waveform_segment("wait").Value = 0.3
+        wfms = np.vstack(awg_wfm.get_raw_waveforms())
+        assert WFS_CountedConstant.num_calls == num_calls + 2, "The waveform cache did not regenerate the changed segment."
+        assert self.arr_equality(get_uncached_waveforms(), wfms), "The cached waveforms do not match the uncached waveforms after changing a segment."
+        #Changing a child segment regenerates the group
+        awg_wfm.get_waveform_segment("grp").get_waveform_segment("g0").Value = 0.4
+        assert self.arr_equality(np.vstack(awg_wfm.get_raw_waveforms()), get_uncached_waveforms()), "The cached waveforms do not match the uncached waveforms after changing a child segment."
+        #Changing the WFMT regenerates the segments using it
+        self.lab.WFMT('IQmod').IQFrequency = 31e7
+        self.lab.WFMT('IQmod').IQdcOffset = (0.1, 0.2)
+        wfms = np.vstack(awg_wfm.get_raw_waveforms())
+        assert self.arr_equality(get_uncached_waveforms(), wfms), "The cached waveforms do not match the uncached waveforms after changing the WFMT."
+        #
+        #The cached waveforms are read-only
+        cur_wfm = awg_wfm.get_waveform_segment("p1").get_waveform(self.lab, 1e9, 10, 0)
+        with self.assertRaises(ValueError):
+            cur_wfm[0] = 1.0
+        #The memory budget is kept
+        cache.MaxBytes = 1000
+        awg_wfm.get_raw_waveforms()
+        assert cache.NumBytes <= 1000 and cache.NumEntries > 0, "The waveform cache did not keep within its memory budget."
+        cache.clear()
+        assert cache.NumEntries == 0 and cache.NumBytes == 0, "The waveform cache was not cleared."
+        cache.MaxBytes = 128*2**20
+
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
+    def test_AutoCompression(self):
+        self.initialise()
+        awg_wfm = self.lab.HAL("Wfm1")
+        dS = awg_wfm._awg_chan_list[0]._instr_awg.AutoCompressionSupport['MinSize']
+
+        def chunks_equal(seg1, mkrs1, seg2, mkrs2):
+            return np.array_equal(seg1, seg2) and all([np.array_equal(mkrs1[m], mkrs2[m]) for m in range(len(mkrs1))])
+        def naive_compression(wfms, mkrs):
+            #Reference linear search across all previous chunks
+            num_main_secs = int(np.floor(wfms[0].size / dS))
+            get_chunk = lambda ch, st, en: (wfms[ch][st:en], awg_wfm._extract_marker_segments(mkrs[ch], st, en))
+            seq_chunks = [[get_chunk(ch, 0, dS)] for ch in range(len(wfms))]
+            seq_ids = [0]
+            for m in range(1, num_main_secs):
+                cur_chunks = [get_chunk(ch, m*dS, (m+1)*dS) for ch in range(len(wfms))]
+                found_match = False
+                for ind in range(len(seq_chunks[0])):
+                    if all([chunks_equal(*cur_chunks[ch], *seq_chunks[ch][ind]) for ch in range(len(wfms))]):
+                        seq_ids += [ind]
+                        found_match = True
+                        break
+                if not found_match:
+                    seq_ids += [len(seq_chunks[0])]
+                    for ch in range(len(wfms)):
+                        seq_chunks[ch] += [cur_chunks[ch]]
+            if (m+1)*dS < wfms[0].size:
+                tails = [get_chunk(ch, m*dS, mkrs[ch][0].size) for ch in range(len(wfms))]
+                if found_match:
+                    seq_ids[-1] = len(seq_chunks[0])
+                    for ch in range(len(wfms)):
+                        seq_chunks[ch] += [(wfms[ch][m*dS:], tails[ch][1])]
+                else:
+                    for ch in range(len(wfms)):
+                        seq_chunks[ch][-1] = (wfms[ch][m*dS:], tails[ch][1])
+            return [{'waveforms' : [x[0] for x in seq_chunks[ch]], 'markers' : [x[1] for x in seq_chunks[ch]], 'seq_ids' : seq_ids} for ch in range(len(wfms))]
+        def check_compression(dict_wfm_data, expected, wfm, mkrs):
+            assert dict_wfm_data['seq_ids'] == expected['seq_ids'], "The auto-compression sequence table differs from the linear search."
+            assert len(dict_wfm_data['waveforms']) == len(expected['waveforms']), "The auto-compression gave the wrong number of segments."
+            for ind in range(len(expected['waveforms'])):
+                assert chunks_equal(dict_wfm_data['waveforms'][ind], dict_wfm_data['markers'][ind], expected['waveforms'][ind], expected['markers'][ind]), "The auto-compressed segments differ from the linear search."
+            assert np.array_equal(np.concatenate([dict_wfm_data['waveforms'][x] for x in dict_wfm_data['seq_ids']]), wfm), "The auto-compressed waveform does not reproduce the original waveform."
+            for m in range(len(mkrs)):
+                if mkrs[m].size > 0:
+                    assert np.array_equal(np.concatenate([dict_wfm_data['markers'][x][m] for x in dict_wfm_data['seq_ids']]), mkrs[m]), "The auto-compressed markers do not reproduce the original markers."
+
+        #Repeated patterns with some chunks that only differ in their markers or in the sign of zero (np.array_equal treats -0.0 as 0.0)
+        np.random.seed(7)
+        patterns = np.random.rand(4, dS)
+        patterns[0,:] = 0.0
+        for num_tail, last_repeated in [(0,True), (3,True), (5,False), (dS-1,True)]:
+            pat_inds = np.random.randint(4, size=60)
+            pat_inds[-1] = 1 if last_repeated else 4
+            wfm = np.concatenate([patterns[x] if x < 4 else np.random.rand(dS) for x in pat_inds] + [np.random.rand(num_tail)])
+            wfm[dS*np.where(pat_inds == 0)[0][1::2]] = -0.0
+            wfm2 = wfm[::-1]*0.5
+            mkrs = [np.zeros(wfm.size, dtype=np.int8), np.array([])]
+            mkrs[0][dS*np.where(pat_inds == 2)[0][::3]] = 1
+            mkrs2 = [np.ones(wfm.size, dtype=np.int8), np.zeros(wfm.size, dtype=np.int8)]
+            mkrs2[1][dS*np.where(pat_inds == 3)[0][::2]] = 1
+            #Each channel separately
+            for cur_wfm, cur_mkrs in [(wfm, mkrs), (wfm2, mkrs2)]:
+                dict_wfm_data = awg_wfm._program_auto_comp_basic(awg_wfm._awg_chan_list[0], cur_wfm, cur_mkrs)
+                check_compression(dict_wfm_data, naive_compression([cur_wfm], [cur_mkrs])[0], cur_wfm, cur_mkrs)
+                assert len(dict_wfm_data['waveforms']) < len(dict_wfm_data['seq_ids']), "The auto-compression did not compress the repeated chunks."
+            #Linked channels
+            dict_wfm_datas = awg_wfm._program_auto_comp_basic_linked(dS, [wfm, wfm2], [mkrs, mkrs2])
+            expected = naive_compression([wfm, wfm2], [mkrs, mkrs2])
+            for ch, (cur_wfm, cur_mkrs) in enumerate([(wfm, mkrs), (wfm2, mkrs2)]):
+                check_compression(dict_wfm_datas[ch], expected[ch], cur_wfm, cur_mkrs)
+
+        #Programming the AWG with auto-compression gives the same output
+        awg_wfm.set_waveform_segments([WFS_Constant("init", None, 16e-9, 0.0)] + [WFS_Constant(f"p{m}", None, 24e-9, 0.1*(m%3)) for m in range(20)] + [WFS_Constant("end", None, 8e-9, 0.0)])
+        wfms = awg_wfm.get_raw_waveforms()
+        for link_chans in [False, True]:
+            awg_wfm.AutoCompression = 'Basic'
+            awg_wfm.AutoCompressionLinkChannels = link_chans
+            awg_wfm.prepare_initial()
+            awg_wfm.prepare_final()
+            for ch in range(2):
+                dict_wfm_data = awg_wfm._cur_prog_waveforms[ch]
+                assert len(dict_wfm_data['waveforms']) < len(dict_wfm_data['seq_ids']), "The programmed waveform was not auto-compressed."
+                assert np.array_equal(np.concatenate([dict_wfm_data['waveforms'][x] for x in dict_wfm_data['seq_ids']]), wfms[ch]), "The programmed auto-compressed waveform is incorrect."
+            awg_wfm.AutoCompression = 'None'
+
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
+    def test_ChangeDetection(self):
+        self.initialise()
+        awg_wfm = self.lab.HAL("Wfm1")
+        WFMT_ModulationIQ('IQmod', self.lab, 47e7)
+        awg_wfm.set_waveform_segments([WFS_Constant("init", None, 16e-9, 0.0),
+                                       WFS_Gaussian("pulse", self.lab.WFMT('IQmod').apply(phase=0.0), 24e-9, 0.5),
+                                       WFS_Group("grp", [WFS_Constant("g0", None, 8e-9, 0.2), WFS_Gaussian("g1", self.lab.WFMT('IQmod').apply(), 8e-9, 0.3)], num_repeats=2),
+                                       WFS_Constant("pad", None, -1, 0.0)])
+        awg_wfm.set_total_time(200e-9)
+        awg_wfm.get_output_channel(0).marker(0).set_markers_to_segments(["pulse"])
+
+        #Count the waveform assemblies and the programmed channels
+        num_calls = {'assemble' : 0, 'program' : 0}
+        orig_assemble = awg_wfm._assemble_waveform_raw
+        def assemble():
+            num_calls['assemble'] += 1
+            return orig_assemble()
+        awg_wfm._assemble_waveform_raw = assemble
+        instr_awg = awg_wfm.get_output_channel(0)._instr_awg
+        orig_program = instr_awg.program_channel
+        def program_channel(chan_id, dict_wfm_data):
+            num_calls['program'] += 1
+            return orig_program(chan_id, dict_wfm_data)
+        instr_awg.program_channel = program_channel
+        def prepare(exp_assemble, exp_program, msg):
+            num_calls['assemble'] = num_calls['program'] = 0
+            awg_wfm.prepare_initial()
+            awg_wfm.prepare_final()
+            assert num_calls == {'assemble' : exp_assemble, 'program' : 2*exp_program}, msg
+        def check_programmed():
+            #Note that generating the waveforms sets the elastic segment (thereby changing the state)
+            wfms = orig_assemble()[0]
+            for ch in range(2):
+                dict_wfm_data = awg_wfm._cur_prog_waveforms[ch]
+                assert np.array_equal(np.concatenate([dict_wfm_data['waveforms'][x] for x in dict_wfm_data['seq_ids']]), wfms[ch]), "The programmed waveform is incorrect."
+
+        prepare(1, 1, "The waveforms must be programmed initially.")
+        prepare(0, 0, "The unchanged waveforms were regenerated.")
+        #Generating the waveforms elsewhere sets the elastic segment - this is harmless as the content hashes match
+        awg_wfm.get_raw_waveforms()
+        prepare(1, 0, "The waveforms were reprogrammed despite not changing.")
+        prepare(0, 0, "The unchanged waveforms were regenerated.")
+        #Setting a property to the same value forces a regeneration, but not a reprogramming
+        awg_wfm.get_waveform_segment("pulse").Amplitude = 0.5
+        prepare(1, 0, "The waveforms were reprogrammed despite not changing.")
+        #Changes in the segments, child segments, WFMT arguments, WFMTs, markers and the HAL itself
+        awg_wfm.get_waveform_segment("pulse").Amplitude = 0.4
+        prepare(1, 1, "Changing a segment did not reprogram the waveforms.")
+        check_programmed()
+        awg_wfm.get_waveform_segment("grp").get_waveform_segment("g0").Value = 0.1
+        prepare(1, 1, "Changing a child segment did not reprogram the waveforms.")
+        awg_wfm.get_waveform_segment("pulse").get_WFMT().phase = 0.3
+        prepare(1, 1, "Changing the WFMT arguments did not reprogram the waveforms.")
+        self.lab.WFMT('IQmod').IQFrequency = 31e7
+        prepare(1, 1, "Changing the WFMT did not reprogram the waveforms.")
+        prepare(0, 0, "The unchanged waveforms were regenerated after changing the WFMT.")
+        awg_wfm.get_output_channel(0).marker(0).set_markers_to_segments(["grp"])
+        prepare(1, 1, "Changing the markers did not reprogram the waveforms.")
+        awg_wfm.set_total_time(208e-9)
+        prepare(1, 1, "Changing the total time did not reprogram the waveforms.")
+        #Reloading the configuration forces a reprogramming
+        awg_wfm._set_current_config(awg_wfm._get_current_config(), self.lab)
+        prepare(1, 1, "The waveforms must be reprogrammed after setting the configuration.")
+        prepare(0, 0, "The unchanged waveforms were regenerated after setting the configuration.")
+        check_programmed()
+
+        instr_awg.program_channel = orig_program
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
+    def test_IncrementalUpload(self):
+        self.initialise()
+        awg_wfm = self.lab.HAL("Wfm1")
+        instr_awg = awg_wfm.get_output_channel(0)._instr_awg
+        #A long train of identical pulses
+        num_pulses = 40
+        segs = [WFS_Constant("init", None, 16e-9, 0.0)]
+        for m in range(num_pulses):
+            segs += [WFS_Gaussian(f"pulse{m}", None, 64e-9, 0.5), WFS_Constant(f"wait{m}", None, 16e-9, 0.0)]
+        awg_wfm.set_waveform_segments(segs)
+        awg_wfm.AutoCompression = 'Basic'
+        def prepare():
+            awg_wfm.prepare_initial()
+            awg_wfm.prepare_final()
+            wfms = awg_wfm.get_raw_waveforms()
+            for ch in range(2):
+                assert np.array_equal(instr_awg.get_resident_waveform(f'CH{ch+1}'), wfms[ch]), "The waveform resident on the AWG is incorrect."
+            return [instr_awg.get_upload_stats(f'CH{ch+1}') for ch in range(2)]
+
+        stats = prepare()
+        num_pts = awg_wfm.NumPts
+        for cur_stats in stats:
+            assert cur_stats['SequenceTable'] and cur_stats['NumPoints'] < num_pts, "The initial programming must upload the compressed segments and sequence table."
+            num_segs = len(cur_stats['Segments'])
+        #Changing one pulse only uploads its segments (i.e. 8 new segments of 8 points each)
+        awg_wfm.get_waveform_segment("pulse20").Amplitude = 0.3
+        for cur_stats in prepare():
+            assert cur_stats['Segments'] == list(range(num_segs, num_segs+8)), "Only the segments of the changed pulse should be uploaded."
+            assert cur_stats['NumPoints'] == 64 and cur_stats['SequenceTable'], "Only the changed pulse and the sequence table should be uploaded."
+        awg_wfm.get_waveform_segment("pulse20").Amplitude = 0.2
+        for cur_stats in prepare():
+            assert cur_stats['NumPoints'] == 64 and not cur_stats['SequenceTable'], "The unchanged sequence table was uploaded again."
+        #Reverting the change leaves the original segments resident - so only the sequence table is updated
+        awg_wfm.get_waveform_segment("pulse20").Amplitude = 0.5
+        for cur_stats in prepare():
+            assert cur_stats['Segments'] == [] and cur_stats['SequenceTable'], "Only the sequence table should be uploaded on reverting the change."
+        #Uncompressed waveforms are a single segment
+        awg_wfm.AutoCompression = 'None'
+        awg_wfm.get_waveform_segment("pulse3").Amplitude = 0.1
+        for cur_stats in prepare():
+            assert cur_stats['Segments'] == [0] and cur_stats['NumPoints'] == num_pts, "The uncompressed waveform should be uploaded in full."
+
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
+    def test_IncrementalUploadMergeSplit(self):
+        self.initialise()
+        awg_wfm = self.lab.HAL("Wfm1")
+        instr_awg = awg_wfm.get_output_channel(0)._instr_awg
+        #A long train of distinct pulses
+        num_pulses = 40
+        segs = [WFS_Constant("init", None, 16e-9, 0.0)]
+        for m in range(num_pulses):
+            segs += [WFS_Gaussian(f"pulse{m}", None, 64e-9, 0.1 + 0.02*m), WFS_Constant(f"wait{m}", None, 16e-9, 0.0)]
+        awg_wfm.set_waveform_segments(segs)
+        awg_wfm.AutoCompression = 'Basic'
+        def prepare():
+            awg_wfm.prepare_initial()
+            awg_wfm.prepare_final()
+            wfms = awg_wfm.get_raw_waveforms()
+            for ch in range(2):
+                assert np.array_equal(instr_awg.get_resident_waveform(f'CH{ch+1}'), wfms[ch]), "The waveform resident on the AWG is incorrect."
+            return [instr_awg.get_upload_stats(f'CH{ch+1}') for ch in range(2)]
+
+        prepare()
+        num_slots = instr_awg.get_num_resident_slots('CH1')
+        #Merging the chunks of two pulses (thereby shifting the indices of all subsequent unique chunks) only changes the sequence table
+        awg_wfm.get_waveform_segment("pulse2").Amplitude = awg_wfm.get_waveform_segment("pulse3").Amplitude
+        for cur_stats in prepare():
+            assert cur_stats['NumPoints'] == 0 and cur_stats['SequenceTable'], "Merging unique chunks should only update the sequence table."
+        #Splitting them again reuses the resident chunks
+        awg_wfm.get_waveform_segment("pulse2").Amplitude = 0.14
+        for cur_stats in prepare():
+            assert cur_stats['NumPoints'] == 0 and cur_stats['SequenceTable'], "Splitting unique chunks back into resident chunks should only update the sequence table."
+        #New chunks early in the sequence only upload the new chunks (into the slots no longer in use)
+        for cur_ampl in [0.95, 0.96, 0.97]:
+            awg_wfm.get_waveform_segment("pulse1").Amplitude = cur_ampl
+            for cur_stats in prepare():
+                assert cur_stats['NumPoints'] == 64, "Only the chunks of the changed pulse should be uploaded."
+        assert instr_awg.get_num_resident_slots('CH1') == num_slots, "The slots no longer in use were not reused."
+
+        shutil.rmtree('test_save_dir')
+        self.cleanup()
+
 class TestAWGChecks(unittest.TestCase):
     def initialise(self):
         self.lab = Laboratory('UnitTests\\UTestExperimentConfiguration.yaml', 'test_save_dir/')
@@ -222,61 +222,83 @@ class ACQ_M4i_Digitiser(M4i):
             }
         else:
             #Gather data and either pass it to the data-processor or just collate it under final_arr - note that it is sent to the processor as properly grouped under the ACQ
-            #data format specification.
-            cache_array = []
-            total_reps = 0
-            done = False
-            for cur_block in self.multiple_trigger_fifo_acquisition(total_frames, self.NumSamples, 1, self.NumSegments, notify_page_size_bytes=4096):
-                if len(cache_array) > 0:
-                    arr_blk = np.concatenate((cache_array, np.array(cur_block)))
-                else:
-                    arr_blk = np.array(cur_block)
-
-                if self.num_channels == 1:
-                    num_reps = int( arr_blk.size / (self.NumSegments*self.NumSamples) ) 
-                    if num_reps + total_reps <= self.NumRepetitions:
-                        total_reps += num_reps                
-                        cache_array = arr_blk[(num_reps*self.NumSegments*self.NumSamples):]
-                        if num_reps == 0:
-                            continue
-                        arr_blk = [arr_blk[0:(num_reps*self.NumSegments*self.NumSamples)].reshape(num_reps, self.NumSegments, self.NumSamples)]
-                    else:
-                        num_reps = self.NumRepetitions - total_reps
-                        if num_reps == 0:
-                            done = True
-                        arr_blk = [arr_blk[0:(num_reps*self.NumSegments*self.NumSamples)].reshape(num_reps, self.NumSegments, self.NumSamples)]
-                        done = True
-                else:
-                    num_reps = int( arr_blk.size / (self.NumSegments*self.NumSamples*2) )
-                    if num_reps + total_reps <= self.NumRepetitions:
-                        total_reps += num_reps
-                        cache_array = arr_blk[(num_reps*self.NumSegments*self.NumSamples*2):]
-                        if num_reps == 0:
-                            continue
-                        arr_blk = [
-                            arr_blk[0:(num_reps*self.NumSegments*self.NumSamples*2):2].reshape(num_reps, self.NumSegments, self.NumSamples),
-                            arr_blk[1:(num_reps*self.NumSegments*self.NumSamples*2):2].reshape(num_reps, self.NumSegments, self.NumSamples)
-                        ]
-                    else:
-                        num_reps = self.NumRepetitions - total_reps
-                        if num_reps == 0:
-                            done = True
-                        arr_blk = [
-                            arr_blk[0:(num_reps*self.NumSegments*self.NumSamples*2):2].reshape(num_reps, self.NumSegments, self.NumSamples),
-                            arr_blk[1:(num_reps*self.NumSegments*self.NumSamples*2):2].reshape(num_reps, self.NumSegments, self.NumSamples)
-                        ]
-                        done = True
-                
+            #data format specification. A processor running in single-precision is given the raw integer samples (casting them on the first arithmetic stage).
+            raw_samples = getattr(cur_processor, 'Precision', 'float64') != 'float64'
+            for arr_blk in self._get_repetition_blocks(total_frames):
                 cur_processor.push_data({
                     'parameters' : ['repetition', 'segment', 'sample'],
-                    'data' : { f'CH{m}' : arr_blk[m].astype(dtype=np.float64) for m in range(self.num_channels) },
+                    'data' : { f'CH{m}' : arr_blk[m] if raw_samples else arr_blk[m].astype(dtype=np.float64) for m in range(self.num_channels) },
                     'misc' : {'SampleRates' : [self.sample_rate.get()]*self.num_channels}
                 })
-                if done:
-                    break
         
             return cur_processor.get_all_data()
 
+    def get_data_blocks(self):
+        '''
+        Generator yielding the raw data in blocks of whole repetitions as they are read from the card's FIFO; the blocks are
+        formatted like the data packet returned by get_data (without a data processor) with the first dimension spanning the
+        repetitions in the current block.
+        '''
+        assert self.NumSamples > 32, "M4i requires the number of samples per segment to be at least 32."
+        assert self.NumSamples % 16 == 0, "M4i requires the number of samples per segment to be divisible by 16."
+        if self.enable_TS_SEQ_trig():
+            total_frames = (self.NumRepetitions+1)*self.NumSegments
+        else:
+            total_frames = (self.NumRepetitions)*self.NumSegments
+        for arr_blk in self._get_repetition_blocks(total_frames):
+            yield {
+                'parameters' : ['repetition', 'segment', 'sample'],
+                'data' : { f'ch{m}' : arr_blk[m] for m in range(self.num_channels) },
+                'misc' : {'SampleRates' : [self.sample_rate.get()]*self.num_channels}
+            }
+
+    def _get_repetition_blocks(self, total_frames):
+        #Collates the FIFO blocks into whole repetitions (carrying over any partial repetition into the next block) and yields a
+        #list of arrays (one per channel) of shape (num_reps, NumSegments, NumSamples); stops once NumRepetitions have been yielded.
+        cache_array = []
+        total_reps = 0
+        done = False
+        for cur_block in self.multiple_trigger_fifo_acquisition(total_frames, self.NumSamples, 1, self.NumSegments, notify_page_size_bytes=4096):
+            if len(cache_array) > 0:
+                arr_blk = np.concatenate((cache_array, np.array(cur_block)))
+            else:
+                arr_blk = np.array(cur_block)
+
+            if self.num_channels == 1:
+                num_reps = int( arr_blk.size / (self.NumSegments*self.NumSamples) ) 
+                if num_reps + total_reps <= self.NumRepetitions:
+                    total_reps += num_reps                
+                    cache_array = arr_blk[(num_reps*self.NumSegments*self.NumSamples):]
+                    if num_reps == 0:
+                        continue
+                    arr_blk = [arr_blk[0:(num_reps*self.NumSegments*self.NumSamples)].reshape(num_reps, self.NumSegments, self.NumSamples)]
+                else:
+                    num_reps = self.NumRepetitions - total_reps
+                    arr_blk = [arr_blk[0:(num_reps*self.NumSegments*self.NumSamples)].reshape(num_reps, self.NumSegments, self.NumSamples)]
+                    done = True
+            else:
+                num_reps = int( arr_blk.size / (self.NumSegments*self.NumSamples*2) )
+                if num_reps + total_reps <= self.NumRepetitions:
+                    total_reps += num_reps
+                    cache_array = arr_blk[(num_reps*self.NumSegments*self.NumSamples*2):]
+                    if num_reps == 0:
+                        continue
+                    arr_blk = [
+                        arr_blk[0:(num_reps*self.NumSegments*self.NumSamples*2):2].reshape(num_reps, self.NumSegments, self.NumSamples),
+                        arr_blk[1:(num_reps*self.NumSegments*self.NumSamples*2):2].reshape(num_reps, self.NumSegments, self.NumSamples)
+                    ]
+                else:
+                    num_reps = self.NumRepetitions - total_reps
+                    arr_blk = [
+                        arr_blk[0:(num_reps*self.NumSegments*self.NumSamples*2):2].reshape(num_reps, self.NumSegments, self.NumSamples),
+                        arr_blk[1:(num_reps*self.NumSegments*self.NumSamples*2):2].reshape(num_reps, self.NumSegments, self.NumSamples)
+                    ]
+                    done = True
+            
+            yield arr_blk
+            if done:
+                break
+
 from sqdtoolz.HAL.Processors.ProcessorCPU import*
 from sqdtoolz.HAL.Processors.CPU.CPU_DDC import*
 from sqdtoolz.HAL.Processors.CPU.CPU_FIR import*
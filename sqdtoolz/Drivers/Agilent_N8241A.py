@@ -1565,6 +1565,8 @@ class Agilent_N8241A(Instrument):
         #!!!NOTE!!!
         #Since the channels cannot be independently programmed, this function must be called after programming both channels (i.e. calling prepare_waveform_memory).
         #Just be aware of this during debugging.
+        #Also note that the waveforms cannot be updated in-place on this AWG (they can only be created in order); thus, the segments are
+        #always uploaded in full (i.e. the content hashes given in 'seg_hashes' cannot be used to only upload the changed segments).
 
         # if len(self._seq_wfms['ch1']) > 0:
         #     #TODO: Implement the update-flag discriminator here... (If it's even possible with this AWG?)
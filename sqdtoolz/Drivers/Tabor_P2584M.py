@@ -239,6 +239,13 @@ class TaborP2584M_AWG(InstrumentChannel):
         self._used_memory_segments = [None]*2
 
         self._sequence_lens = [None]*4
+        self._seg_keys = [None]*4
+
+        #Record of the segments resident in each memory bank (segment number => (segment-key, length) where the segment-key is given by
+        #(content-hash, amplitude, offset)) and the task tables resident on each channel - used to only upload the segments and task
+        #tables that have changed (the memory was cleared above)
+        self._resident_segs = [{}, {}]
+        self._resident_tasks = [None]*4
 
     @property
     def SampleRate(self):
@@ -279,6 +286,10 @@ class TaborP2584M_AWG(InstrumentChannel):
         """
         chan_ind = self._ch_list.index(chan_id)
         self._sequence_lens[chan_ind] = seg_lens
+        raw_data = kwargs.get('raw_data', None)
+        if raw_data is None:
+            raw_data = {}
+        self._seg_keys[chan_ind] = raw_data.get('seg_hashes', [None]*len(seg_lens))
         self._banks_setup = False
 
     def _setup_memory_banks(self):
@@ -290,36 +301,61 @@ class TaborP2584M_AWG(InstrumentChannel):
         if self._banks_setup:
             return
 
-        # Compute offsets of data if two channels sharing a memory banke are being used
-        # I.e. store it as CH1-Data, then CH2-Data. Similarly in the other memory bank, it's CH3-Data, then CH4-Data
-        if self._sequence_lens[0] != None:
-            self._seg_off_ch2 = len(self._sequence_lens[0])
-        else:
-            self._seg_off_ch2 = 0
-        if self._sequence_lens[2] != None:
-            self._seg_off_ch4 = len(self._sequence_lens[2])
-        else:
-            self._seg_off_ch4 = 0
-
-        #Settle Memory Bank 1 (shared among channels 1 and 2) and Memory Bank 2 (shared among channels 3 and 4)
-        seg_id = 1
-        reset_remaining = False
-        for cur_ch_ind in range(4):
-            if cur_ch_ind == 2:
-                seg_id = 1      #Going to the next memory bank now...
-                reset_remaining = False
-            if self._sequence_lens[cur_ch_ind] != None:
+        #The segments in each memory bank (Memory Bank 1 is shared among channels 1 and 2 while Memory Bank 2 is shared among channels
+        #3 and 4) are content-addressed; that is, segments already resident in the bank are reused and only the new segments are
+        #allocated (into segment numbers no longer in use or new segment numbers). The task tables then refer to these segment numbers.
+        self._seg_ids = [None]*4        #Segment number of each segment to program on a given channel
+        self._seg_uploads = [None]*4    #Indices of the segments to upload on a given channel
+        for cur_bank in range(2):
+            bank_chs = [2*cur_bank, 2*cur_bank+1]
+            prog_chs = [x for x in bank_chs if self._sequence_lens[x] != None]
+            if len(prog_chs) == 0:
+                continue
+            resident = self._resident_segs[cur_bank]
+            #Convert the content hashes into segment-keys (the data written onto memory depends on the amplitude and offset)
+            for cur_ch_ind in prog_chs:
+                cur_chnl = self._get_channel_output(self._ch_list[cur_ch_ind])
+                self._seg_keys[cur_ch_ind] = [None if x is None else (x, cur_chnl.Amplitude/2, cur_chnl.Offset) for x in self._seg_keys[cur_ch_ind]]
+            req_keys = set([x for cur_ch_ind in prog_chs for x in self._seg_keys[cur_ch_ind] if x is not None])
+            #The segments played by the other channel (not being reprogrammed) in this bank must be kept
+            kept_ids = set()
+            for cur_ch_ind in bank_chs:
+                if not cur_ch_ind in prog_chs and self._resident_tasks[cur_ch_ind] != None:
+                    kept_ids.update([x[0] for x in self._resident_tasks[cur_ch_ind]])
+            key_to_id = {v[0] : k for k, v in resident.items() if v[0] is not None}
+            free_ids = {}   #Free segment numbers by their defined lengths
+            for cur_id in sorted(resident.keys(), reverse=True):
+                if not cur_id in kept_ids and (resident[cur_id][0] is None or not resident[cur_id][0] in req_keys):
+                    free_ids.setdefault(resident[cur_id][1], []).append(cur_id)
+            next_id = max(resident.keys(), default=0) + 1
+            for cur_ch_ind in prog_chs:
                 #Select current channel
                 self._parent._set_cmd(':INST:CHAN', cur_ch_ind+1) #NOTE I'm assuming cur_ch_index is zero indexed adn the command is 1 indexed, hence the +1
-                for cur_len in self._sequence_lens[cur_ch_ind]:
-                    self._parent._set_cmd(':TRACe:SEL', seg_id) # Select segment for clearing
-                    cur_mem_len = self._parent._get_cmd(':TRAC:DEF:LENG?') # Find length of segment
-                    if reset_remaining or cur_mem_len == '' or cur_len != int(cur_mem_len):
+                self._seg_ids[cur_ch_ind] = []
+                self._seg_uploads[cur_ch_ind] = []
+                for m, (cur_len, cur_key) in enumerate(zip(self._sequence_lens[cur_ch_ind], self._seg_keys[cur_ch_ind])):
+                    if cur_key is not None and cur_key in key_to_id:
+                        self._seg_ids[cur_ch_ind] += [key_to_id[cur_key]]
+                        continue
+                    #Prefer a free segment of the same length as it need not be redefined
+                    if len(free_ids.get(cur_len, [])) > 0:
+                        seg_id = free_ids[cur_len].pop()
+                    elif sum([len(x) for x in free_ids.values()]) > 0:
+                        seg_id = next(x for x in free_ids.values() if len(x) > 0).pop()
                         self._parent._set_cmd(':TRAC:DEL', seg_id) # Clear the current segment
-                        reset_remaining = True #NOTE UNSURE OF THIS LOGIC
-                    self._parent._send_cmd(f':TRAC:DEF {seg_id}, {cur_len}') # Specify a segment and its corresponding length
-                    seg_id += 1
-            self._sequence_lens[cur_ch_ind] = None
+                        self._parent._send_cmd(f':TRAC:DEF {seg_id}, {cur_len}') # Specify a segment and its corresponding length
+                    else:
+                        seg_id = next_id
+                        next_id += 1
+                        assert seg_id <= self._max_seg_number, f"The number of segments in the memory bank exceeds the maximum of {self._max_seg_number}."
+                        self._parent._send_cmd(f':TRAC:DEF {seg_id}, {cur_len}') # Specify a segment and its corresponding length
+                    #The segment has no valid data until it is uploaded
+                    resident[seg_id] = (None, cur_len)
+                    if cur_key is not None:
+                        key_to_id[cur_key] = seg_id
+                    self._seg_ids[cur_ch_ind] += [seg_id]
+                    self._seg_uploads[cur_ch_ind] += [m]
+                self._sequence_lens[cur_ch_ind] = None
 
         self._banks_setup = True
 
@@ -333,33 +369,33 @@ class TaborP2584M_AWG(InstrumentChannel):
         cur_chnl = self._get_channel_output(chan_id)
 
         self._setup_memory_banks()
-
-        # Setup segment offsets
-        if chan_ind == 1:
-            seg_offset = self._seg_off_ch2
-        elif chan_ind == 3:
-            seg_offset = self._seg_off_ch4
-        else:
-            seg_offset = 0
+        assert self._seg_ids[chan_ind] != None, f"The waveform memory for {chan_id} must be prepared (via prepare_waveform_memory) before programming."
+        seg_ids = self._seg_ids[chan_ind]
 
         #Select channel
         self._parent._set_cmd(':INST:CHAN', chan_ind+1)
 
-        #Program the memory banks
-        for m in range(len(dict_wfm_data['waveforms'])):
+        #Program the memory banks (only the segments that are not already resident in memory)
+        cur_amp = cur_chnl.Amplitude/2
+        cur_off = cur_chnl.Offset   #Don't compensate for offset... # NOTE: this used to be multiplied by 0
+        for m in self._seg_uploads[chan_ind]:
             cur_data = dict_wfm_data['waveforms'][m]
-            cur_amp = cur_chnl.Amplitude/2
-            cur_off = cur_chnl.Offset   #Don't compensate for offset... # NOTE: this used to be multiplied by 0
             cur_data = (cur_data - cur_off)/cur_amp
             assert (max(cur_data) < np.abs(cur_chnl.Amplitude + cur_chnl.Offset)), "The Amplitude and Offset are too large, output will be saturated"
-            self._send_data_to_memory(m+1 + seg_offset, cur_data, dict_wfm_data['markers'][m])
-        #Program the task table...
+            self._send_data_to_memory(seg_ids[m], cur_data, dict_wfm_data['markers'][m])
+            self._resident_segs[chan_ind // 2][seg_ids[m]] = (self._seg_keys[chan_ind][m], cur_data.size)
+        self._seg_ids[chan_ind] = None
+        #Program the task table (only if it has changed)...
         task_list = []
-        for m, seg_id in enumerate(dict_wfm_data['seq_ids']):
-            task_list += [AWG_TaborP2584M_task(seg_id+1 + seg_offset, 1, (m+1)+1)]
+        for m, seg_ind in enumerate(dict_wfm_data['seq_ids']):
+            task_list += [AWG_TaborP2584M_task(seg_ids[seg_ind], 1, (m+1)+1)]
         task_list[0].trig_src = cur_chnl.trig_src()     #First task is triggered off the TRIG source
         task_list[-1].next_task_ind = 1                 #Last task maps back onto the first task
-        self._program_task_table(chan_ind+1, task_list)
+        task_rows = [(x.seg_num, x.num_cycles, x.next_task_ind, x.trig_src) for x in task_list]
+        if task_rows != self._resident_tasks[chan_ind]:
+            self._resident_tasks[chan_ind] = None
+            self._program_task_table(chan_ind+1, task_list)
+            self._resident_tasks[chan_ind] = task_rows
         
         self._parent._set_cmd('FUNC:MODE', 'TASK')
         # Ensure all previous commands have been executed
@@ -95,3 +95,15 @@ class DummyACQ(Instrument):
             return ret_val
 
         return np.array([[np.random.rand(self.NumSamples)]*self.NumSegments])
+
+    def get_data_blocks(self, block_reps = 4):
+        for cur_rep in range(0, self.NumRepetitions, block_reps):
+            num_reps = min(block_reps, self.NumRepetitions - cur_rep)
+            yield {
+                'parameters' : ['repetition', 'segment', 'sample'],
+                'data' : {
+                            'ch1' : np.random.rand(num_reps, self.NumSegments, self.NumSamples),
+                            'ch2' : np.random.rand(num_reps, self.NumSegments, self.NumSamples),
+                            },
+                'misc' : {'SampleRates' : [self.SampleRate]*2}
+            }
@@ -67,6 +67,9 @@ class DummyAWG(Instrument):
         self._num_samples = 10
         self._sample_rate = 10e9
         self._trigger_edge = 1
+        #Emulated waveform memory (the segments and sequence table resident on each channel)
+        self._resident_memory = {}
+        self._upload_stats = {}
 
         # Output channels added to both the module for snapshots and internal Trigger Sources for the DDG HAL...
         for ch_name in ['CH1', 'CH2', 'CH3', 'CH4']:
@@ -110,4 +113,50 @@ class DummyAWG(Instrument):
     def program_channel(self, chan_id, dict_wfm_data):
         # print(dict_wfm_data['waveforms'][0])
         print("Programmed Dummy AWG!")
-        pass
+        #Memory slots are content-addressed: only the segments (identified by their content hashes) that are not already resident are
+        #uploaded - into free slots or slots holding segments that are no longer required. The sequence table then refers to the slots.
+        seg_hashes = dict_wfm_data.get('seg_hashes', [None]*len(dict_wfm_data['waveforms']))
+        cur_mem = self._resident_memory.get(chan_id, {'slots' : [], 'seq_slots' : []})
+        slots = cur_mem['slots'][:]
+        hash_to_slot = {x[0] : ind for ind, x in enumerate(slots) if x is not None and x[0] is not None}
+        req_hashes = set(seg_hashes)
+        free_slots = [ind for ind, x in enumerate(slots) if x is None or x[0] is None or not x[0] in req_hashes][::-1]
+        seg_slots = []
+        upload_segs = []
+        for m, cur_hash in enumerate(seg_hashes):
+            if cur_hash is not None and cur_hash in hash_to_slot:
+                seg_slots += [hash_to_slot[cur_hash]]
+                continue
+            if len(free_slots) > 0:
+                cur_slot = free_slots.pop()
+            else:
+                cur_slot = len(slots)
+                slots += [None]
+            slots[cur_slot] = (cur_hash, dict_wfm_data['waveforms'][m], dict_wfm_data['markers'][m])
+            if cur_hash is not None:
+                hash_to_slot[cur_hash] = cur_slot
+            seg_slots += [cur_slot]
+            upload_segs += [m]
+        seq_slots = [seg_slots[x] for x in dict_wfm_data['seq_ids']]
+        self._upload_stats[chan_id] = {
+            'Segments' : upload_segs,
+            'NumPoints' : sum([dict_wfm_data['waveforms'][m].size for m in upload_segs]),
+            'SequenceTable' : seq_slots != cur_mem['seq_slots']
+            }
+        self._resident_memory[chan_id] = {'slots' : slots, 'seq_slots' : seq_slots}
+
+    def get_upload_stats(self, chan_id):
+        '''
+        Returns a dictionary of what was uploaded in the last call to program_channel for the given channel: the indices of the uploaded
+        segments (Segments), the total number of uploaded points (NumPoints) and whether the sequence table was written (SequenceTable).
+        '''
+        return self._upload_stats.get(chan_id, None)
+
+    def get_resident_waveform(self, chan_id):
+        #Returns the waveform output by the channel (i.e. the resident segments played in the order of the sequence table)
+        cur_mem = self._resident_memory[chan_id]
+        return np.concatenate([cur_mem['slots'][x][1] for x in cur_mem['seq_slots']])
+
+    def get_num_resident_slots(self, chan_id):
+        #Returns the number of memory slots (segments) allocated on the channel
+        return len(self._resident_memory[chan_id]['slots'])
@@ -47,10 +47,34 @@ class Experiment:
         data_file_index = kwargs.get('data_file_index', -1)
         if data_file_index >= 0:
             data_file_name = f'data{data_file_index}.h5'
+            profile_file_name = f'processor_profile{data_file_index}.json'
         else:
             data_file_name = 'data.h5'
+            profile_file_name = 'processor_profile.json'
+        #If profiling the data processor, the report covering just this run is saved alongside the data file
+        data_processor = self._expt_config.get_data_processor()
+        save_profile = getattr(data_processor, 'ProfilingEnabled', False)
+        if save_profile:
+            data_processor.clear_profile()
         store_timestamps = kwargs.get('store_timestamps', True)
-        data_file = FileIOWriter(file_path + data_file_name, store_timestamps=store_timestamps)
+        writer_args = {
+            'compact_timestamps' : kwargs.get('compact_timestamps', False),
+            'buffered' : kwargs.get('buffered_writes', False),
+            'flush_time' : kwargs.get('buffer_flush_time', 5.0),
+            'flush_size' : kwargs.get('buffer_flush_size', 64*1024**2)
+        }
+        data_file = FileIOWriter(file_path + data_file_name, store_timestamps=store_timestamps, **writer_args)
+        #Streaming mode: raw repetition blocks go straight from the ACQ into the data file without building the full data packet
+        stream_data = kwargs.get('stream_data', False)
+        if stream_data:
+            assert self._expt_config.supports_data_blocks(), "Streaming data requires an ACQ with no data processor whose driver supports get_data_blocks."
+            assert not writer_args['buffered'], "Cannot use stream_data with buffered_writes."
+        #Asynchronous mode: data packets are written onto disk by a background thread while the next sweeping point is prepared
+        if kwargs.get('async_writes', False):
+            assert not stream_data, "Cannot use stream_data with async_writes."
+            writer_thread = FileIOWriterThread(kwargs.get('async_queue_size', 8))
+        else:
+            writer_thread = None
         
         rec_params = kwargs.get('rec_params')
         if len(rec_params) > 0:
@@ -58,7 +82,12 @@ class Experiment:
                 rec_param_file_name = f'rec_params{data_file_index}.h5'
             else:
                 rec_param_file_name = 'rec_params.h5'
-            rec_data_file = FileIOWriter(file_path + rec_param_file_name, store_timestamps=store_timestamps)
+            rec_data_file = FileIOWriter(file_path + rec_param_file_name, store_timestamps=store_timestamps, **writer_args)
+
+        #Every HAL is activated on each sweeping point, but only the HALs whose properties have changed are re-prepared
+        skip_unchanged_HALs = kwargs.get('skip_unchanged_HALs', True)
+        #By default, only the sweeping variables whose values change between sweeping points are set
+        set_all_sweep_vars = kwargs.get('set_all_sweep_vars', False)
 
         if not kwargs.get('skip_init_instruments', False):
             self._expt_config.init_instruments()
@@ -72,10 +101,9 @@ class Experiment:
             if not kill_signal():
                 self._expt_config.prepare_instruments()
                 if not kill_signal():
-                    data = self._expt_config.get_data()
-                    data_file.push_datapkt(data, sweep_vars)
+                    self._get_and_push_data(writer_thread, data_file, stream_data, sweep_vars)
                     if len(rec_params) > 0:
-                        rec_data_file.push_datapkt(self._prepare_rec_params(rec_params), sweep_vars)
+                        self._push_datapkt(writer_thread, rec_data_file, self._prepare_rec_params(rec_params), sweep_vars)
                     time.sleep(delay)
             #################################
         else:
@@ -100,41 +128,38 @@ class Experiment:
 
             if not kill_signal():
                 sweep_arrays = [x[1] for x in sweep_vars2]
-                sweep_grids = np.meshgrid(*sweep_arrays)
-                sweep_grids = np.array(sweep_grids)
-                axes = np.arange(len(sweep_grids.shape))
-                try:
-                    axes[2] = 1
-                    axes[1] = 2
-                except IndexError:
-                    pass
-                sweep_grids = np.transpose(sweep_grids, axes=axes).reshape(len(sweep_arrays),-1).T
+                num_points = int(np.prod([x.size for x in sweep_arrays]))
                 
                 #sweep_vars2 is given as a list of tuples formatted as (parameter, sweep-values in an numpy-array)
-                for ind_coord, cur_coord in enumerate(sweep_grids):
-                    #Set the values
-                    for ind, cur_val in enumerate(cur_coord):
-                        sweep_vars2[ind][0].set_raw(cur_val)
+                for ind_coord, first_changed, cur_inds in self._iter_sweep_grid(sweep_arrays):
+                    #Set the values - only the axes that changed from the previous point (unless all must be set on every point)
+                    if set_all_sweep_vars:
+                        first_changed = 0
+                    for ind in range(first_changed, len(sweep_arrays)):
+                        sweep_vars2[ind][0].set_raw(sweep_arrays[ind][cur_inds[ind]])
 
                     if kill_signal():
                         break
                     
                     #Now prepare the instrument
                     # self._expt_config.check_conformance() #TODO: Write this
-                    self._expt_config.prepare_instruments()
+                    self._expt_config.prepare_instruments(skip_unchanged = skip_unchanged_HALs)
                     time.sleep(delay)
 
                     if kill_signal():
                         break
 
-                    data = self._expt_config.get_data()
-                    data_file.push_datapkt(data, sweep_vars2, sweepEx)
+                    self._get_and_push_data(writer_thread, data_file, stream_data, sweep_vars2, sweepEx)
                     if len(rec_params) > 0:
-                        rec_data_file.push_datapkt(self._prepare_rec_params(rec_params), sweep_vars2, sweepEx)
+                        self._push_datapkt(writer_thread, rec_data_file, self._prepare_rec_params(rec_params), sweep_vars2, sweepEx)
                     if not disable_progress_bar:
-                        ping_iteration((ind_coord+1)/sweep_grids.shape[0])
+                        ping_iteration((ind_coord+1)/num_points)
 
+        if writer_thread is not None:
+            writer_thread.close()
         data_file.close()
+        if save_profile:
+            data_processor.save_profile_report(file_path + profile_file_name)
         if len(rec_params) > 0:
             rec_data_file.close()
             self.last_rec_params = FileIOReader(file_path + rec_param_file_name)
@@ -142,6 +167,39 @@ class Experiment:
 
         return FileIOReader(file_path + data_file_name)
 
+    @staticmethod
+    def _iter_sweep_grid(sweep_arrays):
+        '''
+        Odometer-style iterator over the grid of sweeping values with the last axis varying the fastest. Yields the index of each
+        point, the first axis whose value changed from the previous point (i.e. it and all inner axes changed) and the current index
+        along each axis. The grid is never materialised in memory.
+        '''
+        sizes = [x.size for x in sweep_arrays]
+        cur_inds = [0]*len(sizes)
+        yield 0, 0, cur_inds
+        for ind_coord in range(1, int(np.prod(sizes))):
+            cur_axis = len(sizes) - 1
+            cur_inds[cur_axis] += 1
+            while cur_inds[cur_axis] == sizes[cur_axis]:
+                cur_inds[cur_axis] = 0
+                cur_axis -= 1
+                cur_inds[cur_axis] += 1
+            yield ind_coord, cur_axis, cur_inds
+
+    def _get_and_push_data(self, writer_thread, data_file, stream_data, sweep_vars, sweepEx = {}):
+        if stream_data:
+            num_reps, data_blocks = self._expt_config.get_data_blocks()
+            data_file.push_datapkt_blocks(data_blocks, num_reps, sweep_vars, sweepEx)
+        else:
+            data = self._expt_config.get_data()
+            self._push_datapkt(writer_thread, data_file, data, sweep_vars, sweepEx)
+
+    def _push_datapkt(self, writer_thread, data_file, data_pkt, sweep_vars, sweepEx = {}):
+        if writer_thread is None:
+            data_file.push_datapkt(data_pkt, sweep_vars, sweepEx)
+        else:
+            writer_thread.push_datapkt(data_file, data_pkt, sweep_vars, sweepEx)
+
     def _prepare_rec_params(self, rec_params):
         return {
                 'parameters' : [],
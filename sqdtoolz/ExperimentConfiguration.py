@@ -8,6 +8,7 @@ import copy
 class ExperimentConfiguration:
     def __init__(self, name, lab, duration, list_HALs, hal_ACQ = None, list_spec_names = [], **kwargs):
         self._name = name
+        self._prepared_versions = {}
         #Just register it to the labotarory - doesn't matter if it already exists as everything here needs to be reinitialised
         #to the new configuration anyway...
         lab._register_CONFIG(self)
@@ -235,6 +236,7 @@ class ExperimentConfiguration:
         return ret_trans_vars
 
     def init_instruments(self):
+        self._prepared_versions = {}
         cur_spec_targets = []
         #Get all parameters all ExperimentSpecifications will set
         for cur_spec in self._list_spec_names:
@@ -267,24 +269,40 @@ class ExperimentConfiguration:
     def commit(self):
         self.save_config()
 
-    def prepare_instruments(self):
+    def prepare_instruments(self, skip_unchanged = False):
+        '''
+        Activates and prepares all HALs in this configuration. If skip_unchanged is True, the preparation of HALs whose state has not
+        changed since they were last prepared (i.e. no properties have been set since) is skipped. Note that all HALs are still
+        activated as their outputs may have been switched off elsewhere (e.g. via another configuration).
+        '''
         #TODO: Write rest of this with error checking
 
         list_hals = self._list_HALs[:]
         if self._hal_ACQ is not None:
             list_hals += [self._hal_ACQ]
 
+        #The HALs to prepare are chosen before activating them as the activation itself may set properties (e.g. Output)
+        if skip_unchanged:
+            prep_hals = [x for x in list_hals if x._get_state_version() is None or self._prepared_versions.get(x.Name, None) != x._get_state_version()]
+        else:
+            prep_hals = list_hals
+
         for cur_hal in list_hals:
             if cur_hal is not None and not cur_hal.ManualActivation:
                 cur_hal.activate()
         
-        for cur_hal in list_hals:
+        for cur_hal in prep_hals:
             #TODO: Write concurrence/change checks to better optimise AWG...
             cur_hal.prepare_initial()
-        for cur_hal in list_hals:
+        for cur_hal in prep_hals:
             cur_hal.prepare_final()
 
+        #Record the states after activation and preparation (as they may set properties)
+        for cur_hal in list_hals:
+            self._prepared_versions[cur_hal.Name] = cur_hal._get_state_version()
+
     def makesafe_instruments(self):
+        self._prepared_versions = {}
         list_hals = self._list_HALs[:]
         if self._hal_ACQ is not None:
             list_hals += [self._hal_ACQ]
@@ -301,6 +319,21 @@ class ExperimentConfiguration:
             return {'parameters':['None'],
                     'data':{'dummy_ch': np.array([0])}}
 
+    def get_data_processor(self):
+        if self._hal_ACQ is None:
+            return None
+        return self._hal_ACQ.data_processor
+
+    def supports_data_blocks(self):
+        return self._hal_ACQ is not None and self._hal_ACQ.SupportsDataBlocks
+
+    def get_data_blocks(self):
+        '''
+        Returns the total number of repetitions and a generator yielding the data in blocks of repetitions (see ACQ.get_data_blocks).
+        '''
+        assert self.supports_data_blocks(), "The ACQ in this configuration cannot stream data blocks."
+        return self._hal_ACQ.NumRepetitions, self._hal_ACQ.get_data_blocks()
+
     def get_trigger_edges(self, obj_trigger_input):
         assert isinstance(obj_trigger_input, TriggerInput), "The argument obj_trigger_input must be a TriggerInput object; that is, a genuine digital trigger input."
 
@@ -78,6 +78,19 @@ class ACQ(TriggerInputCompatible, TriggerInput, HALbase):
     def get_data(self):
         return self._instr_acq.get_data(data_processor = self.data_processor)
 
+    @property
+    def SupportsDataBlocks(self):
+        #Raw repetition blocks can only be streamed when there is no data processor (e.g. averaging) acting on the full data
+        return self.data_processor is None and hasattr(self._instr_acq, 'get_data_blocks')
+
+    def get_data_blocks(self):
+        '''
+        Returns a generator yielding the raw data in blocks of repetitions. Each block is formatted like the data packet returned by
+        get_data, but with the first (repetition) dimension only spanning the repetitions in the given block.
+        '''
+        assert self.SupportsDataBlocks, f"ACQ {self.Name} cannot stream data blocks; it must have no data processor and the instrument driver must implement get_data_blocks."
+        return self._instr_acq.get_data_blocks()
+
     def set_trigger_source(self, trig_src_obj):
         assert isinstance(trig_src_obj, TriggerOutput) or trig_src_obj == None, "Must supply a valid Trigger Output object (i.e. digital trigger output like a marker)."
         self._trig_src_obj = trig_src_obj
@@ -5,8 +5,12 @@ from sqdtoolz.HAL.AWGOutputChannel import*
 import matplotlib.patches as patches
 import matplotlib.pyplot as plt
 from sqdtoolz.HAL.WaveformSegments import*
+import hashlib
 
 class WaveformAWG(HALbase, TriggerOutputCompatible, TriggerInputCompatible):
+    #Bookkeeping of the programmed waveforms (does not change the state of the waveform)
+    _VOLATILE_ATTRIBUTES = ('_cur_prog_waveforms', '_prog_hashes', '_prog_state', '_dont_reprogram', 'cur_wfms_to_commit', '_hashes_to_commit', '_state_to_commit')
+
     def __init__(self, hal_name, lab, awg_channel_tuples, sample_rate, total_time=-1, global_factor = 1.0):
         HALbase.__init__(self, hal_name)
         if not lab._HAL_exists(hal_name):
@@ -37,7 +41,7 @@ class WaveformAWG(HALbase, TriggerOutputCompatible, TriggerInputCompatible):
             self._total_time = total_time
         
         self._lab = lab
-        self._cur_prog_waveforms = [None]*len(awg_channel_tuples)
+        self._reset_programmed_state(len(awg_channel_tuples))
         lab._register_HAL(self)
 
     @classmethod
@@ -257,14 +261,8 @@ class WaveformAWG(HALbase, TriggerOutputCompatible, TriggerInputCompatible):
             #Reset any waveform modulation commands for a new sequence construction...
             for cur_wfm_seg in self._wfm_segment_list:
                 cur_wfm_seg.reset_waveform_transforms(self._lab)
-            t0 = 0
-            #Concatenate the individual waveform segments
-            for cur_wfm_seg in self._wfm_segment_list:
-                if cur_wfm_seg.NumPts(self.SampleRate) == 0:
-                    continue
-                #TODO: Preallocate - this is a bit inefficient...
-                final_wfms[cur_ch] = np.concatenate((final_wfms[cur_ch], cur_wfm_seg.get_waveform(self._lab, self._sample_rate, t0, cur_ch)))
-                t0 = final_wfms[cur_ch].size
+            #Concatenate the individual waveform segments (written directly into a preallocated array)
+            final_wfms[cur_ch] = WaveformSegmentBase._assemble_segments(self._wfm_segment_list, self._lab, self._sample_rate, 0, cur_ch)
             #Scale the waveform via the global scale-factor...
             final_wfms[cur_ch] *= self._global_factor
             assert self.NumPts == final_wfms[cur_ch].size, "The sample-rate and segment-lengths yield segment points that exceed the total waveform size. Ensure that there is sufficient freedom in the elastic segment size to compensate."
@@ -351,7 +349,7 @@ class WaveformAWG(HALbase, TriggerOutputCompatible, TriggerInputCompatible):
 
         #This function is called via init_instruments in the ExperimentConfiguration class right at the BEGINNING of an Experiment
         #run - it's dangerous to assume concurrence with previous waveforms here...
-        self._cur_prog_waveforms = [None]*len(self._awg_chan_list)
+        self._reset_programmed_state(len(self._awg_chan_list))
 
     def _set_current_config_waveforms(self, list_wfm_dict_config):
         '''
@@ -390,6 +388,26 @@ class WaveformAWG(HALbase, TriggerOutputCompatible, TriggerInputCompatible):
                 axs[ind].plot(t_vals, cur_wfm)
         return fig
 
+    def _get_state_version(self):
+        '''
+        Returns a signature of everything that determines the programmed waveforms: the properties of this HAL, the waveform segments
+        (and their WFMT arguments), the WFMTs used by the segments and the markers. It is calculated in O(segments) without generating
+        any waveforms.
+        '''
+        wfmt_names = set()
+        seg_versions = tuple((x, x._get_state_version(wfmt_names)) for x in self._wfm_segment_list)
+        wfmt_versions = []
+        for cur_name in sorted(wfmt_names):
+            cur_wfmt = self._lab.WFMT(cur_name, True)
+            wfmt_versions += [(cur_wfmt, None if cur_wfmt is None else cur_wfmt._get_state_version())]
+        mkr_versions = tuple((x, x._get_state_version()) for cur_ch in self._awg_chan_list for x in cur_ch._awg_mark_list)
+        return (HALbase._get_state_version(self), seg_versions, tuple(wfmt_versions), mkr_versions)
+
+    def _reset_programmed_state(self, num_channels):
+        self._cur_prog_waveforms = [None]*num_channels
+        self._prog_hashes = [None]*num_channels
+        self._prog_state = None
+
     def activate(self):
         for cur_awg_chan in self._awg_chan_list:
             cur_awg_chan.Output = True
@@ -405,6 +423,11 @@ class WaveformAWG(HALbase, TriggerOutputCompatible, TriggerInputCompatible):
         """
         Method to prepare waveforms and load them into memory of AWG intsrument
         """
+        #If nothing has been set since the waveforms were last programmed, there's no need to even generate the waveforms...
+        if self._prog_state is not None and self._get_state_version() == self._prog_state:
+            self._dont_reprogram = True
+            return
+
         #Prepare the waveform
         final_wfms, elastic_ind = self._assemble_waveform_raw()
 
@@ -424,17 +447,14 @@ class WaveformAWG(HALbase, TriggerOutputCompatible, TriggerInputCompatible):
                 mkr_list = [np.array([])]
             final_mkrs += [mkr_list]
 
-        #Check if there are any changes in the waveforms - if not, then there's no need to reprogram...
-        self._dont_reprogram = True
-        for m in range(len(self._cur_prog_waveforms)):
-            if self._cur_prog_waveforms[m] is not None:
-                if not self._check_changes_wfm_data(self._cur_prog_waveforms[m], final_wfms[m], final_mkrs[m]):
-                    self._dont_reprogram = False
-                    break
-            else:
-                self._dont_reprogram = False
-                break
+        #Check if there are any changes in the waveforms (via the content hashes of the programmed waveforms) - if not, then there's
+        #no need to reprogram... The state is taken after generating the waveforms as the generation itself may set properties (e.g.
+        #the duration of the elastic segment).
+        self._hashes_to_commit = [self._get_wfm_data_hash(final_wfms[m], final_mkrs[m]) for m in range(len(self._awg_chan_list))]
+        self._state_to_commit = self._get_state_version()
+        self._dont_reprogram = self._hashes_to_commit == self._prog_hashes
         if self._dont_reprogram:
+            self._prog_state = self._state_to_commit
             return
 
         #For the case where the sequencing table must be the same for all channels (e.g. channels on the Agilent N8241A), the sequencing is
@@ -451,6 +471,7 @@ class WaveformAWG(HALbase, TriggerOutputCompatible, TriggerInputCompatible):
             dict_wfm_datas = self._program_auto_comp_basic_linked(dict_auto_comps[0]['MinSize'], final_wfms, final_mkrs)
             for ind, cur_awg_chan in enumerate(self._awg_chan_list):
                 dict_wfm_data = dict_wfm_datas[ind]
+                dict_wfm_data['seg_hashes'] = self._get_segment_hashes(dict_wfm_data)
                 seg_lens = [x.size for x in dict_wfm_data['waveforms']]
                 cur_awg_chan._instr_awg.prepare_waveform_memory(cur_awg_chan._instr_awg_chan.short_name, seg_lens, raw_data=dict_wfm_data)
                 self.cur_wfms_to_commit.append(dict_wfm_data)
@@ -464,11 +485,12 @@ class WaveformAWG(HALbase, TriggerOutputCompatible, TriggerInputCompatible):
                     #UNCOMPRESSED
                     #Just program the AWG via over a single waveform    
                     #Don't compress if disabled, unsupported or if the waveform size is too small to compress
-                    dict_wfm_data = {'waveforms' : [final_wfms[ind]], 'markers' : [mkr_list], 'seq_ids' : [0]}
+                    dict_wfm_data = {'waveforms' : [final_wfms[ind]], 'markers' : [mkr_list], 'seq_ids' : [0], 'seg_hashes' : [self._hashes_to_commit[ind]]}
                 elif self.AutoCompression == 'Basic':
                     #BASIC COMPRESSION
                     #The basic compression algorithm is to chop up the waveform into its minimum set of bite-sized pieces and to find repetitive aspects
                     dict_wfm_data = self._program_auto_comp_basic(cur_awg_chan, final_wfms[ind], mkr_list)
+                    dict_wfm_data['seg_hashes'] = self._get_segment_hashes(dict_wfm_data)
                     
                 seg_lens = [x.size for x in dict_wfm_data['waveforms']]
                 cur_awg_chan._instr_awg.prepare_waveform_memory(cur_awg_chan._instr_awg_chan.short_name, seg_lens, raw_data=dict_wfm_data)
@@ -483,19 +505,17 @@ class WaveformAWG(HALbase, TriggerOutputCompatible, TriggerInputCompatible):
                 cur_awg_chan._instr_awg.program_channel(cur_awg_chan._instr_awg_chan.short_name, self.cur_wfms_to_commit[ind])
                 #Set it AFTER the programming in case there is an error etc...
                 self._cur_prog_waveforms[ind] = self.cur_wfms_to_commit[ind]
+                self._prog_hashes[ind] = self._hashes_to_commit[ind]
+            self._prog_state = self._state_to_commit
 
-    def _check_changes_wfm_data(self, dict_wfm_data, final_wfm, final_mkrs):
-        #Check waveform equality (works for sequenced/autocompressed version as well)
-        prog_wfm = np.concatenate([dict_wfm_data['waveforms'][x] for x in dict_wfm_data['seq_ids']])
-        if not np.array_equal(prog_wfm, final_wfm):
-            return False
-        #Check markers...
-        for m in range(len(final_mkrs)):
-            prog_mkrs = np.concatenate([dict_wfm_data['markers'][x][m] for x in dict_wfm_data['seq_ids']])
-            if not np.array_equal(prog_mkrs, final_mkrs[m]):
-                return False
-        return True
-        
+    def _get_wfm_data_hash(self, final_wfm, final_mkrs):
+        #Content hash of a channel's waveform and markers (compared against that of the programmed waveform to check for changes)
+        return self._get_chunk_hash([self._get_hashable_array(final_wfm)] + [self._get_hashable_array(x) for x in final_mkrs])
+
+    def _get_segment_hashes(self, dict_wfm_data):
+        #Content hashes of the individual segments - given to the AWG drivers (as 'seg_hashes') so that they only need to upload the
+        #segments that differ from those already resident in the AWG memory
+        return [self._get_wfm_data_hash(x, y) for x, y in zip(dict_wfm_data['waveforms'], dict_wfm_data['markers'])]
 
     def _extract_marker_segments(self, mkr_list_overall, slice_start, slice_end):
         cur_mkrs = []
@@ -506,33 +526,55 @@ class WaveformAWG(HALbase, TriggerOutputCompatible, TriggerInputCompatible):
                 cur_mkrs += [ mkr_list_overall[sub_mkr][:] ]    #Copy over the empty array...
         return cur_mkrs
 
+    @staticmethod
+    def _get_hashable_array(arr):
+        #np.array_equal treats -0.0 and 0.0 as equal - so map them onto the same bytes before hashing (adding 0.0 turns -0.0 into 0.0)
+        if np.issubdtype(arr.dtype, np.inexact):
+            return arr + 0.0
+        return arr
+
+    @staticmethod
+    def _get_chunk_hash(arrays):
+        #Hash of the contents of the given arrays (the compressed chunks are found by first looking up the chunks with the same hash)
+        cur_hash = hashlib.blake2b(digest_size=16)
+        for cur_arr in arrays:
+            cur_hash.update(cur_arr.size.to_bytes(8, 'little'))
+            cur_hash.update(np.ascontiguousarray(cur_arr).tobytes())
+        return cur_hash.digest()
+
+    @staticmethod
+    def _chunks_equal(seg1, mkrs1, seg2, mkrs2):
+        if not np.array_equal(seg1, seg2):
+            return False
+        for mkr in range(len(mkrs1)):
+            if not np.array_equal(mkrs1[mkr], mkrs2[mkr]):
+                return False
+        return True
+
     def _program_auto_comp_basic(self, cur_awg_chan, final_wfm_for_chan, mkr_list):
-        #TODO: Add flags for changed/requires-update to ensure that segments in sequence are not unnecessary programmed repeatedly...
-        #TODO: Improve algorithm (a winter research project for a Winter Student!)
         dict_auto_comp = cur_awg_chan._instr_awg.AutoCompressionSupport
         dS = dict_auto_comp['MinSize']
         num_main_secs = int(np.floor(final_wfm_for_chan.size / dS))
+        #The previous unique chunks that match the current chunk are found via a dictionary of their hashes (lists of indices in
+        #seq_segs as there could be hash collisions); the match is then verified by comparing the actual arrays.
+        hash_wfm = self._get_hashable_array(final_wfm_for_chan)
+        hash_mkrs = [self._get_hashable_array(x) for x in mkr_list]
         seq_segs = [final_wfm_for_chan[0:dS]]
         seq_mkrs = [self._extract_marker_segments(mkr_list, 0, dS)]
         seq_ids  = [0]
+        seq_hashes = {self._get_chunk_hash([hash_wfm[0:dS]] + self._extract_marker_segments(hash_mkrs, 0, dS)) : [0]}
         for m in range(1,num_main_secs):
             cur_seg = final_wfm_for_chan[(m*dS):((m+1)*dS)]
             cur_mkrs = self._extract_marker_segments(mkr_list, m*dS, (m+1)*dS)
+            cur_hash = self._get_chunk_hash([hash_wfm[(m*dS):((m+1)*dS)]] + self._extract_marker_segments(hash_mkrs, m*dS, (m+1)*dS))
             found_match = False
-            for ind, cur_seq_seg in enumerate(seq_segs):
-                #Check main waveform array
-                if np.array_equal(cur_seg, cur_seq_seg):
-                    #Check the sub-markers
-                    mkrs_match = True
-                    for mkr in range(len(cur_mkrs)):
-                        if not np.array_equal(seq_mkrs[ind][mkr], cur_mkrs[mkr]):
-                            mkrs_match = False
-                            break
-                    if mkrs_match:
-                        seq_ids += [ind]
-                        found_match = True
-                        break
+            for ind in seq_hashes.get(cur_hash, []):
+                if self._chunks_equal(cur_seg, cur_mkrs, seq_segs[ind], seq_mkrs[ind]):
+                    seq_ids += [ind]
+                    found_match = True
+                    break
             if not found_match:
+                seq_hashes.setdefault(cur_hash, []).append(len(seq_segs))
                 seq_ids += [len(seq_segs)]
                 seq_segs += [cur_seg]
                 seq_mkrs += [cur_mkrs]
@@ -550,42 +592,32 @@ class WaveformAWG(HALbase, TriggerOutputCompatible, TriggerInputCompatible):
         return {'waveforms' : seq_segs, 'markers' : seq_mkrs, 'seq_ids' : seq_ids}
 
     def _program_auto_comp_basic_linked(self, minSize, final_wfms, final_mkrs):
-        #TODO: Add flags for changed/requires-update to ensure that segments in sequence are not unnecessary programmed repeatedly...
-        #TODO: Improve algorithm (a winter research project for a Winter Student!)
         num_channels = len(final_wfms)
         dS = minSize
         num_main_secs = int(np.floor(final_wfms[0].size / dS))
+        #As with _program_auto_comp_basic, the matching chunks are found via their hashes (taken across all channels)
+        hash_wfms = [self._get_hashable_array(x) for x in final_wfms]
+        hash_mkrs = [[self._get_hashable_array(x) for x in mkr_list] for mkr_list in final_mkrs]
+        get_hash = lambda st, en: self._get_chunk_hash([y for cur_ch in range(num_channels) for y in [hash_wfms[cur_ch][st:en]] + self._extract_marker_segments(hash_mkrs[cur_ch], st, en)])
         #The following variables are representative across all channels.
         seq_segs = [[final_wfm_for_chan[0:dS]] for final_wfm_for_chan in final_wfms]                #Slice: channel, waveform-segment, waveform-pts
         seq_mkrs = [[self._extract_marker_segments(mkr_list, 0, dS)] for mkr_list in final_mkrs]    #Slice: channel, marker-segment, marker-index, marker-pts
         seq_ids  = [0]
+        seq_hashes = {get_hash(0, dS) : [0]}
         for m in range(1,num_main_secs):
             #Extract current dS slice of the final waveforms and markers across all channels
             cur_seg = [final_wfm_for_chan[(m*dS):((m+1)*dS)] for final_wfm_for_chan in final_wfms]
             cur_mkrs = [self._extract_marker_segments(mkr_list, m*dS, (m+1)*dS) for mkr_list in final_mkrs]
-            #Check for a match in a previous segment
-            for seg_ind in range(len(seq_segs[0])):     #Loop through all previous segments
-                found_match = True
-                for cur_ch in range(num_channels):   #For each segment to check, check across all channels
-                    #Check main waveform array
-                    if np.array_equal(cur_seg[cur_ch], seq_segs[cur_ch][seg_ind]):
-                        #Check the sub-markers
-                        mkrs_match = True
-                        for mkr in range(len(cur_mkrs[cur_ch])):
-                            if not np.array_equal(seq_mkrs[cur_ch][seg_ind][mkr], cur_mkrs[cur_ch][mkr]):
-                                mkrs_match = False
-                                break
-                        #If for the current channel, the markers do not match, move onto the next segment...
-                        if not mkrs_match:
-                            found_match = False
-                            break
-                    else:
-                        found_match = False
-                        break
-                if found_match:
+            cur_hash = get_hash(m*dS, (m+1)*dS)
+            #Check for a match in a previous segment (with the same hash) across all channels
+            found_match = False
+            for seg_ind in seq_hashes.get(cur_hash, []):
+                if all(self._chunks_equal(cur_seg[cur_ch], cur_mkrs[cur_ch], seq_segs[cur_ch][seg_ind], seq_mkrs[cur_ch][seg_ind]) for cur_ch in range(num_channels)):
                     seq_ids += [seg_ind]
+                    found_match = True
                     break
             if not found_match:
+                seq_hashes.setdefault(cur_hash, []).append(len(seq_segs[0]))
                 seq_ids += [len(seq_segs[0])]
                 for cur_ch in range(num_channels):
                     seq_segs[cur_ch] += [cur_seg[cur_ch]]
@@ -594,7 +626,7 @@ class WaveformAWG(HALbase, TriggerOutputCompatible, TriggerInputCompatible):
             #Reverse it if it was matched against some other segment previously...
             cur_mkrs = [self._extract_marker_segments(mkr_list, m*dS, mkr_list[0].size) for mkr_list in final_mkrs]
             if found_match:
-                seq_ids[-1] = len(seq_segs)
+                seq_ids[-1] = len(seq_segs[0])
                 for cur_ch in range(num_channels):
                     seq_segs[cur_ch] += [final_wfms[cur_ch][(m*dS):]]
                     seq_mkrs[cur_ch] += [cur_mkrs[cur_ch]]
@@ -99,10 +99,10 @@ class AWGOutputChannel(TriggerInput, LockableProperties):
             #Stretch the plot to occupy the range: [0,1]
             min_y = np.min(cur_y)
             if (min_y < 0):
-                cur_y -= min_y
+                cur_y = cur_y - min_y
             max_y = np.max(cur_y)
             if (max_y > 0):
-                cur_y /= max_y
+                cur_y = cur_y / max_y
             #Downsample the points if necessary to speed up plotting...
             cur_dict['yPoints'] = signal.resample(cur_y, resolution)
             seg_dicts.append(cur_dict)
@@ -65,6 +65,13 @@ class HALbase(LockableProperties):
         for cur_prop in list_prop_names:
             ret_dict[cur_prop] = getattr(self, cur_prop)
 
+    def _get_state_version(self):
+        '''
+        Returns a counter that changes whenever the state of the HAL changes (i.e. whenever a property is set). Returns None if the
+        state cannot be tracked; such HALs are always re-prepared.
+        '''
+        return LockableProperties._get_state_version(self)
+
     def activate(self):
         pass
 
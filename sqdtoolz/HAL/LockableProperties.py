@@ -1,4 +1,7 @@
 class LockableProperties:
+    #Attributes that hold transient bookkeeping (e.g. the running phase of a WFMT) and thus do not bump the state version when set
+    _VOLATILE_ATTRIBUTES = ()
+
     def __init__(self):
         self._locked_props = []
 
@@ -7,6 +10,14 @@ class LockableProperties:
             super().__setattr__(prop, value)
         elif not prop in self._locked_props:
             super().__setattr__(prop, value)
+        else:
+            return
+        #Every attribute set bumps the state version (used to skip re-preparing objects that have not changed)
+        if not prop in self._VOLATILE_ATTRIBUTES:
+            super().__setattr__('_state_version', self.__dict__.get('_state_version', 0) + 1)
+
+    def _get_state_version(self):
+        return self.__dict__.get('_state_version', 0)
     
     def _property_lock(self, prop):
         if not hasattr(self, '_locked_props'):
@@ -19,4 +30,4 @@ class LockableProperties:
         except ValueError:
             pass
     def _property_lock_clearall(self):
-        self._locked_props.clear()
\ No newline at end of file
+        self._locked_props.clear()
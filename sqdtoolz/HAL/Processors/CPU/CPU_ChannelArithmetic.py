@@ -1,5 +1,6 @@
 from sqdtoolz.HAL.Processors.ProcessorCPU import ProcNodeCPU
 import operator
+import numpy as np
 
 class CPU_ChannelArithmetic(ProcNodeCPU):
     def __init__(self, channels, operation='+', discard_inputs=True):
@@ -15,11 +16,19 @@ class CPU_ChannelArithmetic(ProcNodeCPU):
         self.channels = channels
         self.operation = operation
         self.discard_inputs = discard_inputs
+        #If True, the result is written into the first input array (set by ProcessorCPU when no other channel can share its memory)
+        self._in_place = False
 
     @classmethod
     def fromConfigDict(cls, config_dict):
         return cls(config_dict['Channels'], config_dict['Operation'], config_dict['DiscardInputs'])
 
+    @classmethod
+    def fromStage(cls, stage, in_place):
+        ret_obj = cls(stage.channels, stage.operation, stage.discard_inputs)
+        ret_obj._in_place = in_place
+        return ret_obj
+
     def process_data(self, data_pkt, **kwargs):
         opsMap = {
             '+' : operator.add,
@@ -28,6 +37,13 @@ class CPU_ChannelArithmetic(ProcNodeCPU):
             '/' : operator.truediv,  # use operator.div for Python 2
             '%' : operator.mod,
         }
+        ufuncsMap = {
+            '+' : np.add,
+            '-' : np.subtract,
+            '*' : np.multiply,
+            '/' : np.true_divide,
+            '%' : np.mod,
+        }
 
         init_keys = [x for x in data_pkt['data'].keys()]
         ch_key1 = init_keys[self.channels[0]]
@@ -41,7 +57,12 @@ class CPU_ChannelArithmetic(ProcNodeCPU):
         else:
             cur_data1 = data_pkt['data'][ch_key1]
             cur_data2 = data_pkt['data'][ch_key2]
-        data_pkt['data'][f'{ch_key1}_{self.operation}_{ch_key2}'] = opsMap[self.operation](cur_data1, cur_data2)
+        cur_data1 = self._get_working_array(cur_data1, **kwargs)
+        cur_data2 = self._get_working_array(cur_data2, **kwargs)
+        if self.discard_inputs and self._can_write_into(cur_data1, cur_data2):
+            data_pkt['data'][f'{ch_key1}_{self.operation}_{ch_key2}'] = ufuncsMap[self.operation](cur_data1, cur_data2, out=cur_data1)
+        else:
+            data_pkt['data'][f'{ch_key1}_{self.operation}_{ch_key2}'] = opsMap[self.operation](cur_data1, cur_data2)
 
         sample_rates = data_pkt['misc'].pop('SampleRates', None)
         assert sample_rates[self.channels[0]] == sample_rates[self.channels[1]], 'Sample rates of channels being added are not the same'
@@ -53,7 +74,7 @@ class CPU_ChannelArithmetic(ProcNodeCPU):
                 sample_rates = []
             else:
                 inds = operator.itemgetter(*sample_rates_to_keep)(sample_rates)
-                if type(inds) == int:
+                if len(sample_rates_to_keep) == 1:
                     inds = [inds]   #It returns a singleton instead of a tuple...
                 else:
                     inds = list(inds)
@@ -63,6 +84,12 @@ class CPU_ChannelArithmetic(ProcNodeCPU):
 
         return data_pkt
 
+    def _can_write_into(self, arr1, arr2):
+        #The (discarded) first input can only hold the result if it is a writeable floating-point array of the result's type and shape
+        if not self._in_place or not isinstance(arr1, np.ndarray) or not arr1.flags.writeable or not np.issubdtype(arr1.dtype, np.inexact):
+            return False
+        return np.result_type(arr1, arr2) == arr1.dtype and np.broadcast(arr1, arr2).shape == arr1.shape
+
     def _get_current_config(self):
         return {
             'Type'  : self.__class__.__name__,
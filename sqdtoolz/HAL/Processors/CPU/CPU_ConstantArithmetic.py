@@ -39,9 +39,9 @@ class CPU_ConstantArithmetic(ProcNodeCPU):
         #Process means on a per-channel basis
         for ch_ind, cur_ch in enumerate(data_pkt['data'].keys()):
             if self.channels == None:
-                data_pkt['data'][cur_ch] = self.perform_arithmetic(data_pkt['data'][cur_ch], self.operation, self.constant)
+                data_pkt['data'][cur_ch] = self.perform_arithmetic(self._get_working_array(data_pkt['data'][cur_ch], **kwargs), self.operation, self.constant)
             elif ch_ind in self.channels:
-                data_pkt['data'][cur_ch] = self.perform_arithmetic(data_pkt['data'][cur_ch], self.operation, self.constant)
+                data_pkt['data'][cur_ch] = self.perform_arithmetic(self._get_working_array(data_pkt['data'][cur_ch], **kwargs), self.operation, self.constant)
 
         return data_pkt
 
@@ -5,7 +5,7 @@ class CPU_DDC(ProcNodeCPU):
     def __init__(self, ddc_freqs):
         #DDC variables
         self._ddc_freqs = ddc_freqs
-        #A data store of current cosine|sine CuPy arrays used for DDC with each entry formatted as: (num-samples, sample-rate, ddc-frequency, cosine-array, sine-array)
+        #A data store of current cosine|sine arrays used for DDC with each entry formatted as: (num-samples, sample-rate, ddc-frequency, dtype, cosine-array, sine-array)
         self._ddc_cossin_arrays = []
 
     @classmethod
@@ -21,7 +21,7 @@ class CPU_DDC(ProcNodeCPU):
         #Process DDC on a per-channel basis
         init_keys = [x for x in data_pkt['data'].keys()]
         if len(self._ddc_cossin_arrays) == 0:
-            self._ddc_cossin_arrays = [(0, 0, 0, None, None) for x in init_keys]
+            self._ddc_cossin_arrays = [(0, 0, 0, None, None, None) for x in init_keys]
         init_sample_rates = data_pkt['misc'].pop('SampleRates', None)
         final_sample_rates = []
         for ch_ind, cur_ch in enumerate(init_keys):
@@ -30,14 +30,11 @@ class CPU_DDC(ProcNodeCPU):
             sample_rate = init_sample_rates[ch_ind]
 
             if ddc_frequency != None and ddc_frequency != 0:
-                if self._ddc_cossin_arrays[ch_ind][0] != num_samples or self._ddc_cossin_arrays[ch_ind][1] != sample_rate or self._ddc_cossin_arrays[ch_ind][2] != ddc_frequency:
-                    omega = 2*np.pi*ddc_frequency/sample_rate
-                    self._ddc_cossin_arrays[ch_ind] = (
-                        num_samples, sample_rate, ddc_frequency, 2.0*np.cos(omega*np.arange(num_samples)), -2.0*np.sin(omega*np.arange(num_samples)) )
+                cur_cos, cur_sin = self._get_ddc_carriers(ch_ind, num_samples, sample_rate, ddc_frequency, kwargs.get('dtype', None))
                 #Perform the actual DDC...
-                cur_data_cpu = data_pkt['data'].pop(cur_ch)
-                data_pkt['data'][f'{cur_ch}_I'] = np.multiply(cur_data_cpu, self._ddc_cossin_arrays[ch_ind][3])
-                data_pkt['data'][f'{cur_ch}_Q'] = np.multiply(cur_data_cpu, self._ddc_cossin_arrays[ch_ind][4])
+                cur_data_cpu = self._get_working_array(data_pkt['data'].pop(cur_ch), **kwargs)
+                data_pkt['data'][f'{cur_ch}_I'] = np.multiply(cur_data_cpu, cur_cos)
+                data_pkt['data'][f'{cur_ch}_Q'] = np.multiply(cur_data_cpu, cur_sin)
                 final_sample_rates += [sample_rate]*2
                 del cur_data_cpu    #Perhaps necessary - well it's no time for caution...
             else:
@@ -45,6 +42,17 @@ class CPU_DDC(ProcNodeCPU):
         data_pkt['misc']['SampleRates'] = final_sample_rates
         return data_pkt
 
+    def _get_ddc_carriers(self, ch_ind, num_samples, sample_rate, ddc_frequency, dtype = None):
+        #Returns the (cached) cosine and sine arrays (in the given working precision) used to demodulate the given channel
+        if len(self._ddc_cossin_arrays) <= ch_ind:
+            self._ddc_cossin_arrays += [(0, 0, 0, None, None, None)]*(ch_ind + 1 - len(self._ddc_cossin_arrays))
+        if self._ddc_cossin_arrays[ch_ind][0] != num_samples or self._ddc_cossin_arrays[ch_ind][1] != sample_rate or self._ddc_cossin_arrays[ch_ind][2] != ddc_frequency or self._ddc_cossin_arrays[ch_ind][3] != dtype:
+            omega = 2*np.pi*ddc_frequency/sample_rate
+            cur_dtype = np.float64 if dtype == None else dtype
+            self._ddc_cossin_arrays[ch_ind] = (
+                num_samples, sample_rate, ddc_frequency, dtype, (2.0*np.cos(omega*np.arange(num_samples))).astype(cur_dtype), (-2.0*np.sin(omega*np.arange(num_samples))).astype(cur_dtype) )
+        return self._ddc_cossin_arrays[ch_ind][4], self._ddc_cossin_arrays[ch_ind][5]
+
     def _get_current_config(self):
         return {
             'Type'  : self.__class__.__name__,
@@ -1,13 +1,22 @@
 from sqdtoolz.HAL.Processors.ProcessorCPU import ProcNodeCPU
+import numpy as np
 
 class CPU_Duplicate(ProcNodeCPU):
     def __init__(self, reps):
         self.reps = reps
+        #If True, the duplicated channels refer to the same array (set by ProcessorCPU when no later stage modifies its inputs in-place)
+        self._alias = False
 
     @classmethod
     def fromConfigDict(cls, config_dict):
         return cls(config_dict['Repetitions'])
 
+    @classmethod
+    def fromStage(cls, stage, alias):
+        ret_obj = cls(stage.reps)
+        ret_obj._alias = alias
+        return ret_obj
+
     def process_data(self, data_pkt, **kwargs):
         #duplicate data on a per-channel basis
         init_keys = [x for x in data_pkt['data'].keys()]
@@ -18,8 +27,10 @@ class CPU_Duplicate(ProcNodeCPU):
             sample_rate = init_sample_rates[ch_ind]
             if self.reps[ch_ind] > 1:
                 cur_data_cpu = data_pkt['data'].pop(cur_ch)
+                #Integer data (e.g. raw digitiser samples) is still copied as multiplying by 1.0 casts it onto floats
+                alias = self._alias and isinstance(cur_data_cpu, np.ndarray) and np.issubdtype(cur_data_cpu.dtype, np.inexact)
                 for rep_idx in range(self.reps[ch_ind]):
-                    data_pkt['data'][f'{cur_ch}_{rep_idx}'] = cur_data_cpu * 1.0
+                    data_pkt['data'][f'{cur_ch}_{rep_idx}'] = cur_data_cpu if alias else cur_data_cpu * 1.0
                     final_sample_rates.append(sample_rate)
                 del cur_data_cpu    #Perhaps necessary - well it's no time for caution...
             else:
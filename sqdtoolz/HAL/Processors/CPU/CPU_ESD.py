@@ -1,54 +1,42 @@
 from sqdtoolz.HAL.Processors.ProcessorCPU import*
+from sqdtoolz.HAL.Processors.CPU.CPU_FFT import CPU_FFT
 import numpy as np
 
 class CPU_ESD(ProcNodeCPU):
-    def __init__(self, ind_IQ = (0,1)):
+    def __init__(self, ind_IQ = (0,1), one_sided = False, workers = -1):
         '''
         Takes the Energy-Spectral-Density of a given trace of time values. See: https://en.wikipedia.org/wiki/Spectral_density.
 
         Inputs:
             - ind_IQ - Tuple of the IQ indices. Default is 0 and 1 (i.e. assuming first and second channels are I and Q).
+            - one_sided - If True, only the non-negative frequencies are returned for a single (i.e. real) input channel (note that
+                          the values are not doubled). Otherwise, the full spectrum is returned (the default).
+            - workers - Number of threads used in the FFT (as given to scipy.fft). Default is -1 (i.e. all CPU cores).
         '''
-        self._ind_IQ = ind_IQ
+        self._fft = CPU_FFT(ind_IQ, one_sided, workers)
 
     @classmethod
     def fromConfigDict(cls, config_dict):
-        return cls(config_dict['IQindices'])
+        return cls(config_dict['IQindices'], config_dict.get('OneSided', False), config_dict.get('Workers', -1))
 
     def process_data(self, data_pkt, **kwargs):
-        cur_chs = [x for x in data_pkt['data'].keys()]
-        assert len(cur_chs) == 2 or len(cur_chs) == 1, "The incoming data-packet must either have 1 channel or 2 channels (for I and Q)."
+        arr_fft, num_samples, is_real = self._fft._get_spectrum(data_pkt, **kwargs)
 
-        cur_iq_arrays = []
-        for m in range(len(cur_chs)):
-            cur_iq_arrays.append( data_pkt['data'].pop(cur_chs[self._ind_IQ[m]]) )
-
-        if len(cur_chs) == 1:
-            cur_iq_data_complex = cur_iq_arrays[0]
-        else:
-            cur_iq_data_complex = cur_iq_arrays[0] + 1j*cur_iq_arrays[1]
-        
-        #Calculate FFT over the last inner-most axis/index:
-        num_samples = cur_iq_data_complex.shape[-1]
-        #Assuming that the sample rates are the same across both channels!
-        sample_rate = data_pkt['misc']['SampleRates'][0]
-
-        freqs = np.fft.fftfreq(num_samples, 1.0/sample_rate)
-        arr_fft = np.fft.fft(cur_iq_data_complex)
-
-        data_pkt['data']['esd'] = np.abs(arr_fft)**2
-
-        #Remove the parameter as it no longer exists after the averaging...
-        data_pkt['parameters'][-1] = 'fft_frequency'
-        if 'parameter_values' in data_pkt:
-            data_pkt['parameter_values']['fft_frequency'] = freqs
-        else:
-            data_pkt['parameter_values'] = {'fft_frequency' : freqs}
+        #Calculate |X|^2 by squaring the real and imaginary parts in place
+        arr_parts = arr_fft.view(np.finfo(arr_fft.dtype).dtype).reshape(arr_fft.shape + (2,))
+        np.square(arr_parts, out=arr_parts)
+        arr_esd = np.add(arr_parts[..., 0], arr_parts[..., 1])
+        if is_real and not self._fft._one_sided:
+            arr_esd = CPU_FFT._get_two_sided(arr_esd, num_samples)
+        data_pkt['data']['esd'] = arr_esd
 
+        self._fft._set_freqs(data_pkt, num_samples, is_real)
         return data_pkt
 
     def _get_current_config(self):
         return {
             'Type'  : self.__class__.__name__,
-            'IQindices' : self._ind_IQ
+            'IQindices' : self._fft._ind_IQ,
+            'OneSided' : self._fft._one_sided,
+            'Workers' : self._fft._workers
         }
@@ -1,55 +1,102 @@
 from sqdtoolz.HAL.Processors.ProcessorCPU import*
 import numpy as np
+import scipy.fft
 
 class CPU_FFT(ProcNodeCPU):
-    def __init__(self, ind_IQ = (0,1)):
+    def __init__(self, ind_IQ = (0,1), one_sided = False, workers = -1):
         '''
         Takes the FFT of a given trace of time values.
 
         Inputs:
             - ind_IQ - Tuple of the IQ indices. Default is 0 and 1 (i.e. assuming first and second channels are I and Q).
+            - one_sided - If True, only the non-negative frequencies are returned for a single (i.e. real) input channel. Otherwise,
+                          the full spectrum is returned (the default). Note that the FFT of a real input channel is always taken
+                          via a real FFT (with the negative frequencies filled in via symmetry).
+            - workers - Number of threads used in the FFT (as given to scipy.fft). Default is -1 (i.e. all CPU cores).
         '''
         self._ind_IQ = ind_IQ
+        self._one_sided = one_sided
+        self._workers = workers
+        #A data store of the frequency axes with each entry keyed by: (num-samples, sample-rate, one-sided)
+        self._freq_arrays = {}
 
     @classmethod
     def fromConfigDict(cls, config_dict):
-        return cls(config_dict['IQindices'])
+        return cls(config_dict['IQindices'], config_dict.get('OneSided', False), config_dict.get('Workers', -1))
 
     def process_data(self, data_pkt, **kwargs):
+        arr_fft, num_samples, is_real = self._get_spectrum(data_pkt, **kwargs)
+
+        if is_real and not self._one_sided:
+            data_pkt['data']['fft_real'] = self._get_two_sided(np.real(arr_fft), num_samples)
+            data_pkt['data']['fft_imag'] = self._get_two_sided(np.imag(arr_fft), num_samples, -1)
+        else:
+            data_pkt['data']['fft_real'] = np.real(arr_fft)
+            data_pkt['data']['fft_imag'] = np.imag(arr_fft)
+
+        self._set_freqs(data_pkt, num_samples, is_real)
+        return data_pkt
+
+    def _get_spectrum(self, data_pkt, **kwargs):
+        '''
+        Removes the I (and Q) channels from the data packet and returns the tuple (spectrum, num-samples, is-real). The spectrum
+        is the full complex FFT if given both I and Q (or a single complex channel). If just given a real channel, the spectrum is
+        the real FFT (i.e. only the non-negative frequencies).
+        '''
         cur_chs = [x for x in data_pkt['data'].keys()]
         assert len(cur_chs) == 2 or len(cur_chs) == 1, "The incoming data-packet must either have 1 channel or 2 channels (for I and Q)."
 
         cur_iq_arrays = []
         for m in range(len(cur_chs)):
-            cur_iq_arrays.append( data_pkt['data'].pop(cur_chs[self._ind_IQ[m]]) )
+            cur_iq_arrays.append( self._get_working_array(data_pkt['data'].pop(cur_chs[self._ind_IQ[m]]), **kwargs) )
 
-        if len(cur_chs) == 1:
-            cur_iq_data_complex = cur_iq_arrays[0]
-        else:
-            cur_iq_data_complex = cur_iq_arrays[0] + 1j*cur_iq_arrays[1]
-        
         #Calculate FFT over the last inner-most axis/index:
-        num_samples = cur_iq_data_complex.shape[-1]
-        #Assuming that the sample rates are the same across both channels!
-        sample_rate = data_pkt['misc']['SampleRates'][0]
+        num_samples = cur_iq_arrays[0].shape[-1]
+        if len(cur_chs) == 1:
+            #Only a real channel has the symmetric spectrum required for the real FFT (e.g. a DDC output is already complex)
+            if np.isrealobj(cur_iq_arrays[0]):
+                return scipy.fft.rfft(cur_iq_arrays[0], workers=self._workers), num_samples, True
+            return scipy.fft.fft(cur_iq_arrays[0], workers=self._workers), num_samples, False
+
+        #Fill the complex array directly (rather than via I + 1j*Q which creates an extra temporary array)
+        cur_iq_data_complex = np.empty(cur_iq_arrays[0].shape, dtype=np.result_type(cur_iq_arrays[0].dtype, cur_iq_arrays[1].dtype, np.complex64))
+        cur_iq_data_complex.real = cur_iq_arrays[0]
+        cur_iq_data_complex.imag = cur_iq_arrays[1]
+        return scipy.fft.fft(cur_iq_data_complex, workers=self._workers, overwrite_x=True), num_samples, False
 
-        freqs = np.fft.fftfreq(num_samples, 1.0/sample_rate)
-        arr_fft = np.fft.fft(cur_iq_data_complex)
+    @staticmethod
+    def _get_two_sided(arr_half, num_samples, neg_sign = 1):
+        #Fills in the negative frequencies of a real FFT via the (Hermitian) symmetry: X[N-k] = conj(X[k])
+        num_half = arr_half.shape[-1]
+        ret_arr = np.empty(arr_half.shape[:-1] + (num_samples,), dtype=arr_half.dtype)
+        ret_arr[..., :num_half] = arr_half
+        ret_arr[..., num_half:] = arr_half[..., num_samples-num_half:0:-1]
+        if neg_sign == -1:
+            np.negative(ret_arr[..., num_half:], out=ret_arr[..., num_half:])
+        return ret_arr
 
-        data_pkt['data']['fft_real'] = np.real(arr_fft)
-        data_pkt['data']['fft_imag'] = np.imag(arr_fft)
+    def _set_freqs(self, data_pkt, num_samples, is_real):
+        #Assuming that the sample rates are the same across both channels!
+        sample_rate = data_pkt['misc']['SampleRates'][0]
+        one_sided = self._one_sided and is_real
+        cur_key = (num_samples, sample_rate, one_sided)
+        if not cur_key in self._freq_arrays:
+            if one_sided:
+                self._freq_arrays[cur_key] = scipy.fft.rfftfreq(num_samples, 1.0/sample_rate)
+            else:
+                self._freq_arrays[cur_key] = scipy.fft.fftfreq(num_samples, 1.0/sample_rate)
 
         #Remove the parameter as it no longer exists after the averaging...
         data_pkt['parameters'][-1] = 'fft_frequency'
         if 'parameter_values' in data_pkt:
-            data_pkt['parameter_values']['fft_frequency'] = freqs
+            data_pkt['parameter_values']['fft_frequency'] = self._freq_arrays[cur_key]
         else:
-            data_pkt['parameter_values'] = {'fft_frequency' : freqs}
-
-        return data_pkt
+            data_pkt['parameter_values'] = {'fft_frequency' : self._freq_arrays[cur_key]}
 
     def _get_current_config(self):
         return {
             'Type'  : self.__class__.__name__,
-            'IQindices' : self._ind_IQ
+            'IQindices' : self._ind_IQ,
+            'OneSided' : self._one_sided,
+            'Workers' : self._workers
         }
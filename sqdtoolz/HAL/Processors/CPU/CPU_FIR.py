@@ -4,6 +4,9 @@ import scipy.ndimage
 import scipy.signal
 
 class CPU_FIR(ProcNodeCPU):
+    #Filters with at least this many taps are applied via FFTs (overlap-add) instead of a direct convolution
+    FFT_MIN_TAPS = 64
+
     def __init__(self, fir_specs = [{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}]):
         '''
         A general FIR filter applied across different channels in the input dataset.
@@ -13,10 +16,13 @@ class CPU_FIR(ProcNodeCPU):
             - Taps - Number of taps to use in the FIR filter
             - fc   - Cutoff frequency of the filter
             - Win  - The filter window (e.g. 'hamming') as fed into the function scipy.signal.firwin
+            - Decimation - (Optional) Integer factor by which to downsample the filtered signal (default is 1). The filtering is then
+                           done via a polyphase filter (i.e. only the retained samples are calculated) and the sample rate of the
+                           channel is updated accordingly.
         '''
         self._fir_specs = fir_specs
-        #A data store of current fir_filter_specs
-        self._fir_arrays = []
+        #A data store of the designed filter coefficients with each entry keyed by: (filter-type, sample-rate, cutoff, taps, window)
+        self._fir_arrays = {}
 
     @classmethod
     def fromConfigDict(cls, config_dict):
@@ -30,36 +36,88 @@ class CPU_FIR(ProcNodeCPU):
 
         #Process FIR on a per-channel basis
         init_keys = [x for x in data_pkt['data'].keys()]
-        if len(self._fir_arrays) == 0:
-            self._fir_arrays = [(None, None, None, None, None, None) for x in init_keys]
         for ch_ind, cur_ch in enumerate(init_keys):
-            cur_data_gpu = data_pkt['data'][cur_ch]
-            sample_rate = data_pkt['misc']['SampleRates'][ch_ind]
-            filter_type = self._fir_specs[ch_ind]['Type']
-            taps = self._fir_specs[ch_ind]['Taps']
-            if taps is None:
-                taps = cur_data_gpu.shape[-1]
-            window = self._fir_specs[ch_ind]['Win']
-            cutoff = self._fir_specs[ch_ind]['fc']
-            if cutoff is None:
-                cutoff = 1/cur_data_gpu.shape[-1]
-            if self._fir_arrays[ch_ind][0] != sample_rate or self._fir_arrays[ch_ind][1] != filter_type or \
-               self._fir_arrays[ch_ind][2] != taps or self._fir_arrays[ch_ind][3] != window or self._fir_arrays[ch_ind][4] != cutoff:
-                nyq_rate = sample_rate*0.5
-                freq_cutoff_norm = cutoff/nyq_rate
-                if filter_type == 'low':
-                    fir_coeffs = np.array(scipy.signal.firwin(taps, freq_cutoff_norm, window=window))
-                else:
-                    fir_coeffs = 1.0 - np.array(scipy.signal.firwin(taps, freq_cutoff_norm, window=window))
-                self._fir_arrays[ch_ind] = (sample_rate,filter_type,taps,window,cutoff, fir_coeffs)
-            data_pkt['data'][cur_ch] = self.apply_fir(cur_data_gpu, self._fir_arrays[ch_ind][5])
+            cur_data_gpu = self._get_working_array(data_pkt['data'][cur_ch], **kwargs)
+            fir_coeffs = self._get_fir_coeffs(ch_ind, data_pkt['misc']['SampleRates'][ch_ind], cur_data_gpu.shape[-1])
+            decimation = self.get_decimation(ch_ind)
+            data_pkt['data'][cur_ch] = self.apply_fir(cur_data_gpu, fir_coeffs, decimation)
+            if decimation > 1:
+                data_pkt['misc']['SampleRates'][ch_ind] = data_pkt['misc']['SampleRates'][ch_ind] / decimation
             del cur_data_gpu #Perhaps necessary - well it's no time for caution...
 
         return data_pkt
 
-    def apply_fir(self, data, fir_coeffs):
+    def get_decimation(self, ch_ind):
+        return int(self._fir_specs[ch_ind].get('Decimation', 1))
+
+    def _get_fir_coeffs(self, ch_ind, sample_rate, num_samples):
+        #Returns the (cached) filter coefficients for the given channel
+        filter_type = self._fir_specs[ch_ind]['Type']
+        taps = self._fir_specs[ch_ind]['Taps']
+        if taps is None:
+            taps = num_samples
+        window = self._fir_specs[ch_ind]['Win']
+        cutoff = self._fir_specs[ch_ind]['fc']
+        if cutoff is None:
+            cutoff = 1/num_samples
+        cur_key = (filter_type, sample_rate, cutoff, taps, window)
+        if not cur_key in self._fir_arrays:
+            nyq_rate = sample_rate*0.5
+            freq_cutoff_norm = cutoff/nyq_rate
+            if filter_type == 'low':
+                fir_coeffs = np.array(scipy.signal.firwin(taps, freq_cutoff_norm, window=window))
+            else:
+                fir_coeffs = 1.0 - np.array(scipy.signal.firwin(taps, freq_cutoff_norm, window=window))
+            self._fir_arrays[cur_key] = fir_coeffs
+        return self._fir_arrays[cur_key]
+
+    @staticmethod
+    def get_summed_fir_weights(fir_coeffs, num_samples):
+        '''
+        Returns the weights w such that summing the filtered data across the samples (i.e. last axis) equals data @ w. The weights
+        only differ from the sum of the coefficients near the edges (due to the boundary conditions); so only the edges are probed.
+        '''
+        num_edge = fir_coeffs.size + 1
+        if num_samples <= 4*num_edge:
+            return scipy.ndimage.convolve1d(np.eye(num_samples), fir_coeffs).sum(axis=-1)
+        probes = np.eye(4*num_edge)
+        weights = np.full(num_samples, np.sum(fir_coeffs))
+        weights[:num_edge] = scipy.ndimage.convolve1d(probes[:num_edge], fir_coeffs).sum(axis=-1)
+        weights[num_samples-num_edge:] = scipy.ndimage.convolve1d(probes[-num_edge:], fir_coeffs).sum(axis=-1)
+        return weights
+
+    def apply_fir(self, data, fir_coeffs, decimation = 1):
+        '''
+        Filters the data across the last axis (with the same centring and reflected boundaries as scipy.ndimage.convolve1d) and
+        returns every decimation-th sample of the filtered data.
+        '''
+        if decimation > 1:
+            return self._apply_fir_polyphase(data, fir_coeffs, decimation)
+        if fir_coeffs.size >= CPU_FIR.FFT_MIN_TAPS:
+            return self._apply_fir_fft(data, fir_coeffs)
         return scipy.ndimage.convolve1d(data, fir_coeffs)
 
+    @staticmethod
+    def _pad_reflect(data, num_left, num_right):
+        return np.pad(data, [(0,0)]*(data.ndim-1) + [(num_left, num_right)], mode='symmetric')
+
+    def _apply_fir_fft(self, data, fir_coeffs):
+        num_taps = fir_coeffs.size
+        padded = CPU_FIR._pad_reflect(data, (num_taps-1)//2, num_taps//2)
+        fir_coeffs = fir_coeffs.astype(np.result_type(data.dtype, np.float32), copy=False).reshape((1,)*(data.ndim-1) + (num_taps,))
+        return scipy.signal.oaconvolve(padded, fir_coeffs, mode='valid', axes=-1).astype(data.dtype, copy=False)
+
+    def _apply_fir_polyphase(self, data, fir_coeffs, decimation):
+        #The (full) convolution calculated by upfirdn starts num_taps-1 samples before the first retained sample - so pad the start
+        #such that said sample falls onto a multiple of the decimation factor
+        num_taps = fir_coeffs.size
+        extra = (-(num_taps-1)) % decimation
+        padded = CPU_FIR._pad_reflect(data, (num_taps-1)//2 + extra, num_taps//2)
+        start = (num_taps - 1 + extra) // decimation
+        num_out = -(-data.shape[-1] // decimation)
+        fir_coeffs = fir_coeffs.astype(np.result_type(data.dtype, np.float32), copy=False)
+        return scipy.signal.upfirdn(fir_coeffs, padded, down=decimation, axis=-1)[..., start:start+num_out].astype(data.dtype, copy=False)
+
     def _get_current_config(self):
         return {
             'Type'  : self.__class__.__name__,
@@ -0,0 +1,115 @@
+from sqdtoolz.HAL.Processors.ProcessorCPU import*
+from sqdtoolz.HAL.Processors.CPU.CPU_DDC import CPU_DDC
+from sqdtoolz.HAL.Processors.CPU.CPU_FIR import CPU_FIR
+from sqdtoolz.HAL.Processors.CPU.CPU_Mean import CPU_Mean
+from sqdtoolz.HAL.Processors.CPU.CPU_Integrate import CPU_Integrate
+import numpy as np
+
+class CPU_FusedDDC(ProcNodeCPU):
+    def __init__(self, ddc_freqs, fir_specs, index_parameter_name = 'sample', reduction = 'mean'):
+        '''
+        Fused version of the standard readout chain: CPU_DDC, CPU_FIR and then CPU_Mean (or CPU_Integrate) across the samples. The
+        output is the same as running the three stages; however, the demodulation, filtering and summation are linear in the data
+        and are thus, combined into a single set of weights per output channel. Each output channel is then computed in one pass
+        over the raw data without allocating any intermediate arrays. Note that ProcessorCPU automatically fuses this chain.
+
+        Inputs:
+            - ddc_freqs - DDC frequencies as given to CPU_DDC.
+            - fir_specs - FIR filter specifications as given to CPU_FIR.
+            - index_parameter_name - Name of the parameter to reduce across (must be the last parameter - typically 'sample').
+            - reduction - Either 'mean' (CPU_Mean) or 'sum' (CPU_Integrate).
+        '''
+        assert reduction == 'mean' or reduction == 'sum', "The reduction must either be 'mean' or 'sum'."
+        self._ddc = CPU_DDC(ddc_freqs)
+        self._fir = CPU_FIR(fir_specs)
+        if reduction == 'mean':
+            self._reduce = CPU_Mean(index_parameter_name)
+        else:
+            self._reduce = CPU_Integrate(index_parameter_name)
+        self._reduction = reduction
+        #A data store of the current combined weights with each entry formatted as: (FIR-coefficients, carrier-array, num-samples, weights)
+        self._weight_arrays = []
+
+    @classmethod
+    def fromConfigDict(cls, config_dict):
+        return cls(config_dict['Frequencies'], config_dict['FIRspecs'], config_dict['Parameter'], config_dict['Reduction'])
+
+    @classmethod
+    def fromStages(cls, ddc_stage, fir_stage, reduce_stage):
+        #Shares the stage objects (and thus, their cached carriers and filter coefficients)
+        ret_obj = cls.__new__(cls)
+        ret_obj._ddc = ddc_stage
+        ret_obj._fir = fir_stage
+        ret_obj._reduce = reduce_stage
+        ret_obj._reduction = 'mean' if isinstance(reduce_stage, CPU_Mean) else 'sum'
+        ret_obj._weight_arrays = []
+        return ret_obj
+
+    @staticmethod
+    def can_fuse(stages):
+        #A mean that also gives the variance is not linear in the data and cannot be fused; a decimating filter drops samples before the reduction
+        if not (len(stages) == 3 and type(stages[0]) is CPU_DDC and type(stages[1]) is CPU_FIR and type(stages[2]) in [CPU_Mean, CPU_Integrate]):
+            return False
+        return not getattr(stages[2], '_variance', False) and all(int(x.get('Decimation', 1)) == 1 for x in stages[1]._fir_specs)
+
+    def process_data(self, data_pkt, **kwargs):
+        #Only the reduction across the last axis can be fused - otherwise, just run the individual stages
+        if data_pkt['parameters'][-1] != self._reduce._param_name:
+            for cur_proc in [self._ddc, self._fir, self._reduce]:
+                data_pkt = cur_proc.process_data(data_pkt, **kwargs)
+            return data_pkt
+
+        assert 'misc' in data_pkt, "The data packet does not have miscellaneous data under the key 'misc'"
+        assert 'SampleRates' in data_pkt['misc'], "The data packet does not have SampleRate under the entry 'misc'"
+        ddc_freqs = self._ddc._ddc_freqs
+        assert len(ddc_freqs) >= len(data_pkt['data'].keys()), f"The dataset has more channels ({len(data_pkt['data'].keys())}) than specified number of DDC frequencies ({len(ddc_freqs)})."
+
+        #Get the output channels in the same order as given by CPU_DDC (i.e. demodulated channels are appended to the end)
+        init_keys = [x for x in data_pkt['data'].keys()]
+        init_sample_rates = data_pkt['misc'].pop('SampleRates', None)
+        final_sample_rates = []
+        chs_passed, chs_ddc = [], []
+        for ch_ind, cur_ch in enumerate(init_keys):
+            num_samples = data_pkt['data'][cur_ch].shape[-1]
+            sample_rate = init_sample_rates[ch_ind]
+            if ddc_freqs[ch_ind] != None and ddc_freqs[ch_ind] != 0:
+                cur_cos, cur_sin = self._ddc._get_ddc_carriers(ch_ind, num_samples, sample_rate, ddc_freqs[ch_ind], kwargs.get('dtype', None))
+                chs_ddc += [(f'{cur_ch}_I', cur_ch, cur_cos), (f'{cur_ch}_Q', cur_ch, cur_sin)]
+                final_sample_rates += [sample_rate]*2
+            else:
+                chs_passed += [(cur_ch, cur_ch, None)]
+                final_sample_rates.append(sample_rate)
+        final_chs = chs_passed + chs_ddc
+        assert len(self._fir._fir_specs) >= len(final_chs), f"The dataset has more channels ({len(final_chs)}) than specified number of FIR filters ({len(self._fir._fir_specs)})."
+
+        final_data = {}
+        for ch_ind, (cur_ch, src_ch, cur_carrier) in enumerate(final_chs):
+            cur_data = self._get_working_array(data_pkt['data'][src_ch], **kwargs)
+            fir_coeffs = self._fir._get_fir_coeffs(ch_ind, final_sample_rates[ch_ind], cur_data.shape[-1])
+            final_data[cur_ch] = np.matmul(cur_data, self._get_working_array(self._get_weights(ch_ind, fir_coeffs, cur_carrier, cur_data.shape[-1]), **kwargs))
+        data_pkt['data'] = final_data
+        data_pkt['misc']['SampleRates'] = final_sample_rates
+        data_pkt['parameters'].pop(-1)
+        return data_pkt
+
+    def _get_weights(self, ch_ind, fir_coeffs, carrier, num_samples):
+        if len(self._weight_arrays) <= ch_ind:
+            self._weight_arrays += [(None, None, 0, None)]*(ch_ind + 1 - len(self._weight_arrays))
+        cur_entry = self._weight_arrays[ch_ind]
+        if cur_entry[0] is not fir_coeffs or cur_entry[1] is not carrier or cur_entry[2] != num_samples:
+            weights = CPU_FIR.get_summed_fir_weights(fir_coeffs, num_samples)
+            if carrier is not None:
+                weights = weights * carrier
+            if self._reduction == 'mean':
+                weights = weights / num_samples
+            self._weight_arrays[ch_ind] = (fir_coeffs, carrier, num_samples, weights)
+        return self._weight_arrays[ch_ind][3]
+
+    def _get_current_config(self):
+        return {
+            'Type'  : self.__class__.__name__,
+            'Frequencies' : self._ddc._ddc_freqs[:],
+            'FIRspecs' : self._fir._fir_specs,
+            'Parameter' : self._reduce._param_name,
+            'Reduction' : self._reduction
+        }
@@ -25,7 +25,7 @@ class CPU_Integrate(ProcNodeCPU):
 
         #Process sums on a per-channel basis
         for ch_ind, cur_ch in enumerate(data_pkt['data'].keys()):
-            data_pkt['data'][cur_ch] = np.sum(data_pkt['data'][cur_ch], axis=axis_num)
+            data_pkt['data'][cur_ch] = np.sum(self._get_working_array(data_pkt['data'][cur_ch], **kwargs), axis=axis_num)
 
         #Remove the parameter as it no longer exists after the averaging...
         data_pkt['parameters'].pop(axis_num)
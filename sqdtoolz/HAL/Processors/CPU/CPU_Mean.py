@@ -2,18 +2,21 @@ from sqdtoolz.HAL.Processors.ProcessorCPU import*
 import numpy as np
 
 class CPU_Mean(ProcNodeCPU):
-    def __init__(self, index_parameter_name):
+    def __init__(self, index_parameter_name, variance = False):
         '''
         General function that averages each channel across some parameter - e.g. over repetition or over all the samples. 
 
         Inputs:
             - index_parameter_name - Name of the parameter in which to average across.
+            - variance - If True, the (population) variance across the parameter is given as an extra channel for every input
+                         channel (named with the suffix '_var' and appended after all the averaged channels).
         '''
         self._param_name = index_parameter_name
+        self._variance = variance
 
     @classmethod
     def fromConfigDict(cls, config_dict):
-        return cls(config_dict['Parameter'])
+        return cls(config_dict['Parameter'], config_dict.get('Variance', False))
 
     def process_data(self, data_pkt, **kwargs):
         assert self._param_name in data_pkt['parameters'], f"The indexing parameter '{self._param_name}' is not in the current dataset."
@@ -24,16 +27,80 @@ class CPU_Mean(ProcNodeCPU):
         assert (not end_stage) or axis_num > 0, "Cannot and should not take the mean across the first variable unless it is in the end-stages."
 
         #Process means on a per-channel basis
-        for ch_ind, cur_ch in enumerate(data_pkt['data'].keys()):
+        init_keys = [x for x in data_pkt['data'].keys()]
+        for cur_ch in init_keys:
+            data_pkt['data'][cur_ch] = self._get_working_array(data_pkt['data'][cur_ch], **kwargs)
+        if self._variance:
+            variances = {f'{cur_ch}_var' : np.var(data_pkt['data'][cur_ch], axis=axis_num) for cur_ch in init_keys}
+        for ch_ind, cur_ch in enumerate(init_keys):
             data_pkt['data'][cur_ch] = np.mean(data_pkt['data'][cur_ch], axis=axis_num)
+        if self._variance:
+            self._append_variances(data_pkt, variances)
 
         #Remove the parameter as it no longer exists after the averaging...
         data_pkt['parameters'].pop(axis_num)
 
         return data_pkt
 
+    def _append_variances(self, data_pkt, variances):
+        data_pkt['data'].update(variances)
+        if 'misc' in data_pkt and 'SampleRates' in data_pkt['misc']:
+            data_pkt['misc']['SampleRates'] = data_pkt['misc']['SampleRates'] + data_pkt['misc']['SampleRates'][:len(variances)]
+
+    def can_accumulate(self, data_pkt):
+        return len(data_pkt['parameters']) > 0 and data_pkt['parameters'][0] == self._param_name and all(type(x) is np.ndarray for x in data_pkt['data'].values())
+
+    def accumulate(self, data_pkt, accum = None):
+        '''
+        Folds a data packet (i.e. a block across the first parameter) into the running accumulators accum (None for the first
+        block) and returns the updated accumulators. Only the running sum (and sum of squared deviations if calculating the
+        variance) is kept in double precision; thus, the memory does not grow with the number of blocks. The result is given by
+        get_accumulated.
+        '''
+        block_sums = {cur_ch : np.sum(cur_data, axis=0, dtype=np.result_type(cur_data.dtype, np.float64)) for cur_ch, cur_data in data_pkt['data'].items()}
+        block_size = next(iter(data_pkt['data'].values())).shape[0]
+        if self._variance:
+            #Sum of squared deviations within the current block
+            block_M2s = {cur_ch : np.sum(self._abs_sqr(cur_data - block_sums[cur_ch]/block_size), axis=0) for cur_ch, cur_data in data_pkt['data'].items()}
+        if accum == None:
+            #The result is returned in the precision of the data (where integer data is averaged into floating point values)
+            dtypes = {cur_ch : cur_data.dtype if np.issubdtype(cur_data.dtype, np.inexact) else np.dtype(np.float64) for cur_ch, cur_data in data_pkt['data'].items()}
+            data_pkt['data'] = None
+            accum = {'data_pkt' : data_pkt, 'count' : block_size, 'sums' : block_sums, 'dtypes' : dtypes}
+            if self._variance:
+                accum['M2s'] = block_M2s
+            return accum
+        if self._variance:
+            #Combine with the previous blocks via the parallel form of Welford's algorithm (Chan et al.)
+            prev_count = accum['count']
+            new_count = prev_count + block_size
+            for cur_ch in block_sums:
+                delta = block_sums[cur_ch]/block_size - accum['sums'][cur_ch]/prev_count
+                accum['M2s'][cur_ch] += block_M2s[cur_ch] + self._abs_sqr(delta) * (prev_count*block_size/new_count)
+        for cur_ch in block_sums:
+            accum['sums'][cur_ch] += block_sums[cur_ch]
+        accum['count'] += block_size
+        return accum
+
+    @staticmethod
+    def _abs_sqr(arr):
+        if np.iscomplexobj(arr):
+            return np.square(np.abs(arr))
+        return np.square(arr)
+
+    def get_accumulated(self, accum, **kwargs):
+        data_pkt = accum['data_pkt']
+        data_pkt['data'] = {cur_ch : self._get_working_array((cur_sum / accum['count']).astype(accum['dtypes'][cur_ch]), **kwargs) for cur_ch, cur_sum in accum['sums'].items()}
+        if self._variance:
+            self._append_variances(data_pkt, {f'{cur_ch}_var' : self._get_working_array((cur_M2 / accum['count']).astype(np.finfo(accum['dtypes'][cur_ch]).dtype), **kwargs) for cur_ch, cur_M2 in accum['M2s'].items()})
+        data_pkt['parameters'].pop(0)
+        return data_pkt
+
     def _get_current_config(self):
-        return {
+        ret_dict = {
             'Type'  : self.__class__.__name__,
             'Parameter' : self._param_name
         }
+        if self._variance:
+            ret_dict['Variance'] = True
+        return ret_dict
@@ -17,13 +17,14 @@ class CPU_MeanBlock(ProcNodeCPU):
     def fromConfigDict(cls, config_dict):
         return cls(config_dict['Parameter'], config_dict['BlockFac'])
 
-    def process_data(self, data_pkt):
+    def process_data(self, data_pkt, **kwargs):
         assert self._param_name in data_pkt['parameters'], f"The indexing parameter '{self._param_name}' is not in the current dataset."
 
         axis_num = data_pkt['parameters'].index(self._param_name)
 
         #Process means on a per-channel basis
         for ch_ind, cur_ch in enumerate(data_pkt['data'].keys()):
+            data_pkt['data'][cur_ch] = self._get_working_array(data_pkt['data'][cur_ch], **kwargs)
             temp = list(data_pkt['data'][cur_ch].shape)
 
             if self._block_fac > temp[axis_num]:
@@ -1,4 +1,5 @@
 from  sqdtoolz.HAL.DataProcessor import DataProcessor
+from sqdtoolz.HAL.Processors.ProcessorProfiler import ProcessorProfiler
 from multiprocessing.pool import ThreadPool
 import queue
 import numpy as np
@@ -13,6 +14,20 @@ class ProcNodeCPU:
     def _get_current_config(self):
         raise NotImplementedError()
 
+    @staticmethod
+    def _get_working_array(arr, **kwargs):
+        '''
+        Returns the data array cast onto the working precision of the processor as given by the keyword argument dtype (e.g.
+        np.float32). Integer data (e.g. raw digitiser samples) is cast onto said precision, while complex data is cast onto the
+        corresponding complex type. The array is returned as is if no precision is given.
+        '''
+        dtype = kwargs.get('dtype', None)
+        if dtype == None or not isinstance(arr, np.ndarray):
+            return arr
+        if np.iscomplexobj(arr):
+            return arr.astype(np.result_type(dtype, np.complex64), copy=False)
+        return arr.astype(dtype, copy=False)
+
 from sqdtoolz.HAL.Processors.CPU.CPU_DDC import*
 from sqdtoolz.HAL.Processors.CPU.CPU_FIR import*
 from sqdtoolz.HAL.Processors.CPU.CPU_Integrate import*
@@ -27,10 +42,21 @@ from sqdtoolz.HAL.Processors.CPU.CPU_MeanBlock import*
 
 from sqdtoolz.HAL.Processors.CPU.CPU_FFT import*
 from sqdtoolz.HAL.Processors.CPU.CPU_ESD import*
+from sqdtoolz.HAL.Processors.CPU.CPU_FusedDDC import*
 
 
 class ProcessorCPU(DataProcessor):
-    def __init__(self, proc_name, lab, pipeline_main = [], pipeline_end = []):
+    PRECISIONS = {'float64' : None, 'float32' : np.float32}
+
+    def __init__(self, proc_name, lab, pipeline_main = [], pipeline_end = [], precision = 'float64'):
+        '''
+        CPU processor that runs the main pipeline on every pushed data block and the end-stage pipeline on the collated data.
+
+        Inputs:
+            - precision - Either 'float64' (default) or 'float32'. In the single-precision mode, the stages process (and output) the
+                          data in float32/complex64 and raw integer samples from the digitiser are only cast on the first arithmetic
+                          stage; thus, halving the memory traffic at the cost of precision.
+        '''
         super().__init__(proc_name, lab)
         self.tp_CPU = ThreadPool(processes=1)
         self.cur_async_handle = None
@@ -39,6 +65,11 @@ class ProcessorCPU(DataProcessor):
         self.pipeline_end = pipeline_end
         self.cur_data_queue = queue.Queue()
         self.cur_data_processed = []
+        self.cur_data_accum = None
+        self._exec_pipeline_ids = None
+        self._exec_pipeline = []
+        self.Precision = precision
+        self._profiler = None
 
     @classmethod
     def fromConfigDict(cls, config_dict, lab):
@@ -56,24 +87,100 @@ class ProcessorCPU(DataProcessor):
             cur_proc_type = globals()[cur_proc_type]
             new_proc = cur_proc_type.fromConfigDict(cur_proc)
             pipeline_end.append(new_proc)
-        return cls(config_dict['Name'], lab, pipeline_main, pipeline_end)
+        return cls(config_dict['Name'], lab, pipeline_main, pipeline_end, precision=config_dict.get('Precision', 'float64'))
+
+    @property
+    def Precision(self):
+        return self._precision
+    @Precision.setter
+    def Precision(self, precision):
+        assert precision in ProcessorCPU.PRECISIONS, f"The precision must be one of: {list(ProcessorCPU.PRECISIONS.keys())}"
+        self._precision = precision
+
+    def enable_profiling(self, trace_memory = True):
+        '''
+        Records the wall time, bytes allocated (if trace_memory is True) and the input/output channel shapes and data types of
+        every stage call (see get_profile_report). Note that tracing the memory slows down the processing.
+        '''
+        self.disable_profiling()
+        self._profiler = ProcessorProfiler(trace_memory)
+        self._profiler.start()
+
+    def disable_profiling(self):
+        if self._profiler != None:
+            self._profiler.stop()
+            self._profiler = None
+
+    @property
+    def ProfilingEnabled(self):
+        return self._profiler != None
+
+    def get_profile_report(self):
+        '''
+        Returns the profiling report as a dictionary with the keys:
+            - Summary - List of the totals (i.e. number of calls, total/mean time and maximum bytes allocated) for each stage
+            - Records - List of every stage call
+        The stages are identified by their pipeline ('main' or 'end') and their index within said pipeline; note that the indices
+        of the main pipeline are those of the executed stages (i.e. after planning the pipeline - see _plan_stages).
+        '''
+        assert self._profiler != None, "Profiling has not been enabled on this processor."
+        return self._profiler.get_report()
+
+    def save_profile_report(self, file_path):
+        assert self._profiler != None, "Profiling has not been enabled on this processor."
+        self._profiler.save_report(file_path)
+
+    def clear_profile(self):
+        if self._profiler != None:
+            self._profiler.clear()
+
+    def _run_stage(self, pipeline_name, stage_ind, cur_proc, func, data_pkt):
+        #Runs func(data_pkt) for the given stage (recording the call if profiling)
+        if self._profiler == None:
+            return func(data_pkt)
+        return self._profiler.run_stage(pipeline_name, stage_ind, cur_proc, func, data_pkt)
+
+    def _get_stage_kwargs(self):
+        #Keyword arguments passed onto every stage (i.e. the working precision)
+        if ProcessorCPU.PRECISIONS[self._precision] == None:
+            return {}
+        return {'dtype' : ProcessorCPU.PRECISIONS[self._precision]}
 
     def push_data(self, data_pkt):
         self.cur_data_queue.put(data_pkt)
-        #Start a new thread - otherwise, the thread will automatically check and pop the new array for processing
-        # if self.cur_async_handle == None:
-        #     self.cur_async_handle = self.tp_CPU.apply_async(self._process_all)
-        # elif self.cur_async_handle.ready():
-        #     self.cur_async_handle = self.tp_CPU.apply_async(self._process_all)
-        # self._process_all()
+        #Process the main pipeline on a background thread while the acquisition continues. A new task is only started if the
+        #previous one has finished; otherwise, the running task picks up the new data packet (or it is processed in get_all_data).
+        #A failed task is kept so that its error is raised in get_all_data.
+        if self.cur_async_handle == None:
+            self.cur_async_handle = self.tp_CPU.apply_async(self._process_all)
+        elif self.cur_async_handle.ready() and self.cur_async_handle.successful():
+            self.cur_async_handle = self.tp_CPU.apply_async(self._process_all)
 
     def get_all_data(self):
-        #Wait until ready
-        # while not self.ready():
-        #     continue
+        #Wait until ready (re-raising any error encountered in the background processing)
+        if self.cur_async_handle != None:
+            cur_handle = self.cur_async_handle
+            self.cur_async_handle = None
+            try:
+                cur_handle.get()
+            except Exception:
+                #Discard the partially processed data so that it does not leak into the next acquisition
+                self.cur_data_queue = queue.Queue()
+                self.cur_data_processed = []
+                self.cur_data_accum = None
+                raise
         #Empty the queue just in case...
         self._process_all()
 
+        if self.cur_data_accum != None:
+            #The first end-stage (i.e. the mean across the first parameter) has already been folded into the accumulators
+            cur_accum = self.cur_data_accum
+            self.cur_data_accum = None
+            ret_data = self._run_stage('end', 0, self.pipeline_end[0], lambda x: self.pipeline_end[0].get_accumulated(x, **self._get_stage_kwargs()), cur_accum)
+            for m, cur_proc in enumerate(self.pipeline_end[1:]):
+                ret_data = self._run_stage('end', m+1, cur_proc, lambda x: cur_proc.process_data(x, end_stage=True, **self._get_stage_kwargs()), ret_data)
+            return ret_data
+
         if len(self.cur_data_processed) == 0:
             return None
 
@@ -92,8 +199,8 @@ class ProcessorCPU(DataProcessor):
                 ret_data['data'][cur_ch] = dataarrays[0]
 
         #Run the processes that are to occur on the entire collated dataset
-        for cur_proc in self.pipeline_end:
-            ret_data = cur_proc.process_data(ret_data, end_stage=True)
+        for m, cur_proc in enumerate(self.pipeline_end):
+            ret_data = self._run_stage('end', m, cur_proc, lambda x: cur_proc.process_data(x, end_stage=True, **self._get_stage_kwargs()), ret_data)
 
         if len(self.cur_data_processed) > 1:
             for cur_arr in self.cur_data_processed[1:]:
@@ -112,11 +219,83 @@ class ProcessorCPU(DataProcessor):
             cur_data = self.cur_data_queue.get()
             
             #Run the processes
-            for cur_proc in self.pipeline:
-                cur_data = cur_proc.process_data(cur_data)
+            stage_kwargs = self._get_stage_kwargs()
+            for m, cur_proc in enumerate(self._get_exec_pipeline()):
+                cur_data = self._run_stage('main', m, cur_proc, lambda x: cur_proc.process_data(x, **stage_kwargs), cur_data)
             
-            self.cur_data_processed.append(cur_data)
+            self._collect_processed(cur_data)
+
+    def _collect_processed(self, cur_data):
+        #If the end-stages start with a mean across the first parameter (e.g. repetition), the processed blocks are folded into
+        #running accumulators instead of being stored and concatenated; thus, the memory does not scale with the repetitions.
+        if self.cur_data_accum == None and len(self.cur_data_processed) == 0:
+            if len(self.pipeline_end) > 0 and type(self.pipeline_end[0]) is CPU_Mean and self.pipeline_end[0].can_accumulate(cur_data):
+                self.cur_data_accum = self._run_stage('end', 0, self.pipeline_end[0], lambda x: self.pipeline_end[0].accumulate(x), cur_data)
+                return
+        elif self.cur_data_accum != None:
+            self.cur_data_accum = self._run_stage('end', 0, self.pipeline_end[0], lambda x: self.pipeline_end[0].accumulate(x, self.cur_data_accum), cur_data)
+            return
+        self.cur_data_processed.append(cur_data)
+
 
+    def _get_exec_pipeline(self):
+        #The stages that are actually executed are only rebuilt when the stages in the main pipeline change
+        cur_ids = [id(x) for x in self.pipeline]
+        if self._exec_pipeline_ids != cur_ids:
+            self._exec_pipeline = ProcessorCPU._plan_stages(self.pipeline)
+            self._exec_pipeline_ids = cur_ids
+        return self._exec_pipeline
+
+    @staticmethod
+    def _plan_stages(stages):
+        '''
+        Compiles the main pipeline into the list of stages that are actually executed (the given stage objects are not modified):
+            - A CPU_Slice with a single slice is moved ahead of the CPU_ConstantArithmetic stages preceding it (i.e. the arithmetic
+              is only done on the sliced data).
+            - The DDC-FIR-Mean readout chain is fused (see _fuse_stages).
+            - A CPU_ChannelArithmetic that discards its inputs writes its result into the first input if no earlier stage can make
+              channels share memory (i.e. CPU_Duplicate or CPU_Slice).
+            - A CPU_Duplicate gives the same array on the duplicated channels if no later stage modifies its inputs in-place.
+        '''
+        ret_stages = []
+        for cur_stage in stages:
+            if type(cur_stage) is CPU_Slice and len(cur_stage.slices) == 1:
+                m = len(ret_stages)
+                while m > 0 and type(ret_stages[m-1]) is CPU_ConstantArithmetic:
+                    m -= 1
+                ret_stages.insert(m, cur_stage)
+            else:
+                ret_stages.append(cur_stage)
+        ret_stages = ProcessorCPU._fuse_stages(ret_stages)
+
+        shares_memory = False
+        for m, cur_stage in enumerate(ret_stages):
+            if type(cur_stage) in [CPU_Duplicate, CPU_Slice]:
+                shares_memory = True
+            elif type(cur_stage) is CPU_ChannelArithmetic and cur_stage.discard_inputs and not shares_memory:
+                ret_stages[m] = CPU_ChannelArithmetic.fromStage(cur_stage, True)
+        modifies_inputs = False
+        for m in range(len(ret_stages)-1, -1, -1):
+            cur_stage = ret_stages[m]
+            if type(cur_stage) is CPU_ConstantArithmetic or (type(cur_stage) is CPU_ChannelArithmetic and cur_stage._in_place):
+                modifies_inputs = True
+            elif type(cur_stage) is CPU_Duplicate and not modifies_inputs:
+                ret_stages[m] = CPU_Duplicate.fromStage(cur_stage, True)
+        return ret_stages
+
+    @staticmethod
+    def _fuse_stages(stages):
+        #Replaces the standard readout chain (i.e. DDC, FIR and then a Mean/Integrate) with a single fused stage
+        ret_stages = []
+        m = 0
+        while m < len(stages):
+            if CPU_FusedDDC.can_fuse(stages[m:m+3]):
+                ret_stages.append(CPU_FusedDDC.fromStages(*stages[m:m+3]))
+                m += 3
+            else:
+                ret_stages.append(stages[m])
+                m += 1
+        return ret_stages
 
     def reset_pipeline(self):
         self.pipeline.clear()
@@ -150,13 +329,15 @@ class ProcessorCPU(DataProcessor):
             'Name' : self.Name,
             'Type'  : self.__class__.__name__,
             'Pipeline' : [x._get_current_config() for x in self.pipeline],
-            'PipelineEnd' : [x._get_current_config() for x in self.pipeline_end]
+            'PipelineEnd' : [x._get_current_config() for x in self.pipeline_end],
+            'Precision' : self._precision
         }
 
     def _set_current_config(self, dict_config, lab):
         assert dict_config['Type'] == self.__class__.__name__, f"Dictionary specifies wrong processor class type ({self.__class__.__name__})."
         #Delete everything...
         self.reset_pipeline()
+        self.Precision = dict_config.get('Precision', 'float64')
         for cur_proc in dict_config['Pipeline']:
             cur_proc_type = cur_proc['Type']
             assert cur_proc_type in globals(), cur_proc_type + " is not in the current namespace. Need to perhaps include this class in this file..."
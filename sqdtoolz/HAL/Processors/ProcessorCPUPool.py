@@ -0,0 +1,222 @@
+from sqdtoolz.HAL.Processors.ProcessorCPU import*
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import multiprocessing
+import json
+import os
+
+class ProcessorCPUPool(ProcessorCPU):
+    def __init__(self, proc_name, lab, pipeline_main = [], pipeline_end = [], num_workers = None, precision = 'float64'):
+        '''
+        CPU processor that shards the pushed data blocks across a pool of worker processes. Each data block is split along its first
+        parameter (e.g. repetitions) into roughly one shard per worker; each worker runs the same main pipeline as ProcessorCPU on its
+        shard and the end-stage pipeline is run in this process on the collated data. The data arrays are passed to and from the
+        workers via shared memory (i.e. they are not pickled) and the processed shards are concatenated back along the first parameter
+        in the order in which they were pushed; thus, as the main pipeline acts on each repetition separately, the output is identical
+        to that of ProcessorCPU.
+
+        Inputs:
+            - num_workers - Number of worker processes (defaults to the number of CPU cores).
+            - precision   - Working precision of the stages as given in ProcessorCPU.
+        '''
+        super().__init__(proc_name, lab, pipeline_main, pipeline_end, precision)
+        if getattr(self, '_executor', None) != None:
+            self._executor.shutdown()
+        self._executor = None
+        self._num_workers = num_workers
+        self._pending = []
+
+    @classmethod
+    def fromConfigDict(cls, config_dict, lab):
+        ret_obj = super().fromConfigDict(config_dict, lab)
+        ret_obj.NumWorkers = config_dict.get('NumWorkers', None)
+        return ret_obj
+
+    @property
+    def NumWorkers(self):
+        return self._num_workers
+    @NumWorkers.setter
+    def NumWorkers(self, num_workers):
+        if num_workers != self._num_workers:
+            self.shutdown()
+        self._num_workers = num_workers
+
+    def _get_executor(self):
+        if self._executor == None:
+            #Spawn (rather than fork) the workers as this process typically has live instrument threads and connections
+            num_workers = self._num_workers if self._num_workers else os.cpu_count()
+            self._executor = ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def shutdown(self):
+        '''
+        Shuts down the worker processes (they are restarted on pushing new data).
+        '''
+        if self._executor != None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def push_data(self, data_pkt):
+        #The stages are sent as their configuration so that each worker builds (and caches) its own copy of the pipeline
+        pipeline_config = json.dumps([x._get_current_config() for x in self.pipeline])
+        misc_pkt = {k:v for k,v in data_pkt.items() if k != 'data'}
+        trace_memory = self._profiler.TraceMemory if self._profiler != None else None
+        cur_arrs = {cur_ch : np.asarray(cur_arr) for cur_ch, cur_arr in data_pkt['data'].items()}
+        cur_shards = []
+        for cur_slice in self._get_shard_slices(cur_arrs):
+            shm_blocks = []
+            shm_descs = {}
+            for cur_ch, cur_arr in cur_arrs.items():
+                cur_arr = cur_arr[cur_slice]
+                cur_shm = shared_memory.SharedMemory(create=True, size=max(cur_arr.nbytes, 1))
+                np.ndarray(cur_arr.shape, dtype=cur_arr.dtype, buffer=cur_shm.buf)[...] = cur_arr
+                shm_descs[cur_ch] = (cur_shm.name, cur_arr.shape, cur_arr.dtype.str)
+                shm_blocks.append(cur_shm)
+            cur_future = self._get_executor().submit(_process_shared_packet, pipeline_config, shm_descs, misc_pkt, self._get_stage_kwargs(), trace_memory)
+            cur_shards.append((cur_future, shm_blocks))
+        self._pending.append((misc_pkt.get('parameters', [None])[0], cur_shards))
+
+    def _get_shard_slices(self, cur_arrs):
+        #The data is only split along the first parameter if all channels share it (otherwise, the block is sent whole)
+        num_workers = self._num_workers if self._num_workers else os.cpu_count()
+        lens = set(x.shape[0] if x.ndim > 0 else 0 for x in cur_arrs.values())
+        if len(lens) != 1:
+            return [Ellipsis]
+        num_rows = lens.pop()
+        num_shards = min(num_workers, num_rows)
+        if num_shards <= 1:
+            return [Ellipsis]
+        bounds = np.linspace(0, num_rows, num_shards+1).astype(int)
+        return [slice(bounds[m], bounds[m+1]) for m in range(num_shards)]
+
+    def ready(self):
+        return all(x[0].done() for cur_pkt in self._pending for x in cur_pkt[1])
+
+    def _process_all(self):
+        pending = self._pending
+        self._pending = []
+        try:
+            for first_param, cur_shards in pending:
+                shard_data = []
+                shard_records = []
+                for cur_future, shm_blocks in cur_shards:
+                    out_descs, cur_data, cur_records = cur_future.result()
+                    cur_data['data'] = {cur_ch : _collect_shared_array(cur_desc) for cur_ch, cur_desc in out_descs.items()}
+                    _release_shared_blocks(shm_blocks)
+                    shard_data.append(cur_data)
+                    shard_records.append(cur_records)
+                if self._profiler != None:
+                    self._profiler.add_records(_merge_shard_records(shard_records))
+                for cur_data in _concatenate_shards(shard_data, first_param):
+                    self._collect_processed(cur_data)
+        except Exception:
+            #Discard the remaining blocks (and any outputs already written by the workers) before raising the error
+            for first_param, cur_shards in pending:
+                for cur_future, shm_blocks in cur_shards:
+                    try:
+                        out_descs = cur_future.result()[0]
+                        for cur_desc in out_descs.values():
+                            _collect_shared_array(cur_desc)
+                    except Exception:
+                        pass
+                    _release_shared_blocks(shm_blocks)
+            self.cur_data_processed = []
+            self.cur_data_accum = None
+            raise
+
+    def _get_current_config(self):
+        ret_dict = super()._get_current_config()
+        ret_dict['NumWorkers'] = self._num_workers
+        return ret_dict
+
+    def _set_current_config(self, dict_config, lab):
+        super()._set_current_config(dict_config, lab)
+        self.NumWorkers = dict_config.get('NumWorkers', None)
+
+def _release_shared_blocks(shm_blocks):
+    for cur_shm in shm_blocks:
+        try:
+            cur_shm.close()
+            cur_shm.unlink()
+        except FileNotFoundError:
+            #Already released (e.g. when cleaning up after an error)
+            pass
+
+def _concatenate_shards(shard_data, first_param):
+    #The processed shards are joined back into a single block along the first parameter; if a stage has reduced the first parameter
+    #(i.e. the shards cannot be joined), they are passed on as separate blocks (just like separately pushed blocks)
+    if len(shard_data) == 1 or shard_data[0].get('parameters', [None])[0] != first_param:
+        return shard_data
+    for cur_ch in shard_data[0]['data']:
+        if not all(type(x['data'][cur_ch]) is np.ndarray and x['data'][cur_ch].ndim > 0 for x in shard_data):
+            return shard_data
+    ret_data = shard_data[0]
+    ret_data['data'] = {cur_ch : np.concatenate([x['data'][cur_ch] for x in shard_data]) for cur_ch in ret_data['data']}
+    return [ret_data]
+
+def _merge_shard_records(shard_records):
+    #The profiler records of the shards are merged into one record per stage call on the entire data block (i.e. the wall time is
+    #that of the slowest shard as they run concurrently, the bytes allocated are summed across the workers and the shapes are joined)
+    ret_records = []
+    for cur_records in zip(*shard_records):
+        cur_record = dict(cur_records[0])
+        cur_record['Time'] = max(x['Time'] for x in cur_records)
+        if all(x['BytesAllocated'] != None for x in cur_records):
+            cur_record['BytesAllocated'] = sum(x['BytesAllocated'] for x in cur_records)
+        for cur_key in ['InputShapes', 'OutputShapes']:
+            cur_record[cur_key] = {}
+            for cur_ch, cur_shape in cur_records[0][cur_key].items():
+                if len(cur_shape) > 0 and all(len(x[cur_key].get(cur_ch, [])) == len(cur_shape) for x in cur_records):
+                    cur_shape = [sum(x[cur_key][cur_ch][0] for x in cur_records)] + cur_shape[1:]
+                cur_record[cur_key][cur_ch] = cur_shape
+        ret_records.append(cur_record)
+    return ret_records
+
+def _collect_shared_array(cur_desc):
+    #Outputs that are not arrays (e.g. a full reduction to a scalar) are simply returned by the worker
+    if cur_desc[0] != 'shm':
+        return cur_desc[1]
+    cur_shm = shared_memory.SharedMemory(name=cur_desc[1])
+    ret_arr = np.ndarray(cur_desc[2], dtype=cur_desc[3], buffer=cur_shm.buf).copy()
+    _release_shared_blocks([cur_shm])
+    return ret_arr
+
+#Pipelines built in the worker process (keyed by their configuration)
+_worker_pipelines = {}
+
+def _process_shared_packet(pipeline_config, shm_descs, data_pkt, stage_kwargs, trace_memory = None):
+    if not pipeline_config in _worker_pipelines:
+        _worker_pipelines.clear()
+        _worker_pipelines[pipeline_config] = ProcessorCPU._plan_stages([globals()[x['Type']].fromConfigDict(x) for x in json.loads(pipeline_config)])
+
+    shm_blocks = [shared_memory.SharedMemory(name=x[0]) for x in shm_descs.values()]
+    data_pkt['data'] = {cur_ch : np.ndarray(cur_desc[1], dtype=cur_desc[2], buffer=shm_blocks[m].buf) for m, (cur_ch, cur_desc) in enumerate(shm_descs.items())}
+    #The stage calls are profiled in the worker (if enabled) with the records returned alongside the data
+    profiler = ProcessorProfiler(trace_memory) if trace_memory != None else None
+    if profiler != None:
+        profiler.start()
+    for m, cur_proc in enumerate(_worker_pipelines[pipeline_config]):
+        if profiler == None:
+            data_pkt = cur_proc.process_data(data_pkt, **stage_kwargs)
+        else:
+            data_pkt = profiler.run_stage('main', m, cur_proc, lambda x: cur_proc.process_data(x, **stage_kwargs), data_pkt)
+    if profiler != None:
+        profiler.stop()
+
+    out_descs = {}
+    for cur_ch, cur_arr in data_pkt.pop('data').items():
+        if type(cur_arr) is np.ndarray:
+            cur_shm = shared_memory.SharedMemory(create=True, size=max(cur_arr.nbytes, 1))
+            np.ndarray(cur_arr.shape, dtype=cur_arr.dtype, buffer=cur_shm.buf)[...] = cur_arr
+            out_descs[cur_ch] = ('shm', cur_shm.name, cur_arr.shape, cur_arr.dtype.str)
+            cur_shm.close()
+        else:
+            out_descs[cur_ch] = ('obj', cur_arr)
+    cur_arr = None
+    for cur_shm in shm_blocks:
+        try:
+            cur_shm.close()
+        except BufferError:
+            #A stage still holds a view of the input block; it is released on garbage collection
+            pass
+    return out_descs, data_pkt, profiler.records if profiler != None else []
@@ -0,0 +1,111 @@
+import numpy as np
+import tracemalloc
+import time
+import json
+
+class ProcessorProfiler:
+    def __init__(self, trace_memory = True):
+        '''
+        Records the wall time, bytes allocated and the input/output channel shapes and data types of every stage call in a
+        processing pipeline. The memory is traced via tracemalloc (which is process-wide; thus, allocations made by other threads
+        during a stage call are also counted) and adds some overhead to the processing.
+
+        Inputs:
+            - trace_memory - If True, the peak bytes allocated during every stage call is recorded.
+        '''
+        self._trace_memory = trace_memory
+        self._started_tracing = False
+        self.records = []
+        self._num_calls = {}
+
+    @property
+    def TraceMemory(self):
+        return self._trace_memory
+
+    def start(self):
+        if self._trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def clear(self):
+        self.records = []
+        self._num_calls = {}
+
+    def run_stage(self, pipeline_name, stage_ind, stage, func, data_pkt):
+        '''
+        Runs func(data_pkt) (i.e. the given stage operating on the data packet) while recording a new entry. The pipeline_name and
+        stage_ind identify the stage in the report.
+        '''
+        cur_record = {
+            'Pipeline' : pipeline_name,
+            'StageIndex' : stage_ind,
+            'Stage' : stage.__class__.__name__,
+            'Call' : self._num_calls.get((pipeline_name, stage_ind), 0)
+        }
+        self._num_calls[(pipeline_name, stage_ind)] = cur_record['Call'] + 1
+        cur_record['InputShapes'], cur_record['InputDtypes'] = ProcessorProfiler._get_channel_info(data_pkt)
+
+        trace_memory = self._trace_memory and tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.reset_peak()
+            init_mem = tracemalloc.get_traced_memory()[0]
+        start_time = time.perf_counter()
+        ret_val = func(data_pkt)
+        cur_record['Time'] = time.perf_counter() - start_time
+        cur_record['BytesAllocated'] = tracemalloc.get_traced_memory()[1] - init_mem if trace_memory else None
+
+        cur_record['OutputShapes'], cur_record['OutputDtypes'] = ProcessorProfiler._get_channel_info(ret_val)
+        self.records.append(cur_record)
+        return ret_val
+
+    def add_records(self, records):
+        #Appends records made by another profiler (e.g. in a worker process) while renumbering the calls
+        for cur_record in records:
+            cur_key = (cur_record['Pipeline'], cur_record['StageIndex'])
+            cur_record['Call'] = self._num_calls.get(cur_key, 0)
+            self._num_calls[cur_key] = cur_record['Call'] + 1
+            self.records.append(cur_record)
+
+    @staticmethod
+    def _get_channel_info(data_pkt):
+        if not isinstance(data_pkt, dict) or not isinstance(data_pkt.get('data', None), dict):
+            return {}, {}
+        shapes = {cur_ch : list(np.shape(cur_data)) for cur_ch, cur_data in data_pkt['data'].items()}
+        dtypes = {cur_ch : np.asarray(cur_data).dtype.name if isinstance(cur_data, np.ndarray) else type(cur_data).__name__ for cur_ch, cur_data in data_pkt['data'].items()}
+        return shapes, dtypes
+
+    @staticmethod
+    def get_summary(records):
+        '''
+        Returns a list of the totals across all calls for each stage (ordered by the main and then end-stage pipelines).
+        '''
+        summary = {}
+        for cur_record in records:
+            cur_key = (cur_record['Pipeline'], cur_record['StageIndex'])
+            if not cur_key in summary:
+                summary[cur_key] = {'Pipeline' : cur_record['Pipeline'], 'StageIndex' : cur_record['StageIndex'], 'Stage' : cur_record['Stage'],
+                                    'Calls' : 0, 'TotalTime' : 0.0, 'MaxBytesAllocated' : None}
+            cur_summary = summary[cur_key]
+            cur_summary['Calls'] += 1
+            cur_summary['TotalTime'] += cur_record['Time']
+            if cur_record['BytesAllocated'] != None:
+                cur_summary['MaxBytesAllocated'] = max(cur_summary['MaxBytesAllocated'] or 0, cur_record['BytesAllocated'])
+        ret_list = sorted(summary.values(), key=lambda x: (x['Pipeline'] != 'main', x['StageIndex']))
+        for cur_summary in ret_list:
+            cur_summary['MeanTime'] = cur_summary['TotalTime'] / cur_summary['Calls']
+        return ret_list
+
+    def get_report(self):
+        return {
+            'Summary' : ProcessorProfiler.get_summary(self.records),
+            'Records' : self.records[:]
+        }
+
+    def save_report(self, file_path):
+        with open(file_path, 'w') as outfile:
+            json.dump(self.get_report(), outfile, indent=4)
@@ -2,8 +2,133 @@ from optparse import AmbiguousOptionError
 import numpy as np
 from sqdtoolz.HAL.WaveformTransformations import*
 from sqdtoolz.HAL.HALbase import LockableProperties
+from collections import OrderedDict
+import hashlib
+
+class WaveformSegmentCache:
+    #Attributes that do not affect the generated waveform
+    IGNORED_ATTRIBUTES = ['_name', '_lab', 'Parent', '_locked_props', '_state_version']
+
+    def __init__(self, max_bytes = 128*2**20):
+        '''
+        Least-recently-used cache of the waveforms returned by WaveformSegmentBase.get_waveform. Each entry is keyed by a fingerprint
+        of the segment's parameters (including any child segments), the sample rate, the initial time index, the channel index and
+        the state of every WFMT used by the segment (or its children). The WFMT states after generating the waveform are stored
+        alongside so that they are restored on a cache hit (e.g. the running phase of WFMT_ModulationIQ). The cached waveforms
+        are returned as read-only arrays.
+
+        Inputs:
+            - max_bytes - Memory budget of the cached waveforms (the least-recently-used entries are evicted beyond this size).
+                          Setting it to zero disables the cache.
+        '''
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._num_bytes = 0
+
+    @property
+    def MaxBytes(self):
+        return self._max_bytes
+    @MaxBytes.setter
+    def MaxBytes(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._evict()
+
+    @property
+    def NumBytes(self):
+        return self._num_bytes
+
+    @property
+    def NumEntries(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self._num_bytes = 0
+
+    def _evict(self):
+        while self._num_bytes > self._max_bytes and len(self._entries) > 0:
+            cur_wfm = self._entries.popitem(last=False)[1][0]
+            self._num_bytes -= cur_wfm.nbytes
+
+    def get_key(self, wfm_seg, lab, fs, t0_ind, ch_index):
+        '''
+        Returns the cache key for the given arguments of get_waveform along with the names of the WFMTs used by the segment. The key
+        is None if the cache is disabled or if the segment has parameters that cannot be fingerprinted.
+        '''
+        if self._max_bytes <= 0:
+            return None, []
+        wfmt_names = set()
+        seg_fp = WaveformSegmentCache._get_fingerprint(wfm_seg, wfmt_names)
+        if seg_fp is None:
+            return None, []
+        wfmt_names = sorted(wfmt_names)
+        wfmt_fps = []
+        for cur_name in wfmt_names:
+            cur_wfmt = lab.WFMT(cur_name, True)
+            if cur_wfmt is None:
+                return None, []
+            cur_fp = WaveformSegmentCache._get_fingerprint(cur_wfmt, set())
+            if cur_fp is None:
+                return None, []
+            wfmt_fps.append(cur_fp)
+        return (seg_fp, fs, t0_ind, ch_index, tuple(wfmt_fps)), wfmt_names
+
+    def get(self, key):
+        #Returns the tuple (waveform, WFMT-states) or None if there is no such entry
+        if key is None or not key in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key, wfm, wfmt_states):
+        if key is None or wfm.nbytes > self._max_bytes:
+            return
+        if key in self._entries:
+            self._num_bytes -= self._entries.pop(key)[0].nbytes
+        self._entries[key] = (wfm, wfmt_states)
+        self._num_bytes += wfm.nbytes
+        self._evict()
+
+    @staticmethod
+    def get_wfmt_state(wfmt):
+        return {k:v for k,v in wfmt.__dict__.items() if not k in WaveformSegmentCache.IGNORED_ATTRIBUTES}
+
+    @staticmethod
+    def _get_fingerprint(obj, wfmt_names):
+        #Returns a hashable fingerprint of the object (collecting the names of any WFMTs) or None if it cannot be fingerprinted
+        if obj is None or isinstance(obj, (bool, int, float, complex, str, np.number, np.bool_)):
+            return obj
+        if isinstance(obj, np.ndarray):
+            return ('ndarray', obj.dtype.str, obj.shape, hashlib.blake2b(np.ascontiguousarray(obj).tobytes(), digest_size=16).digest())
+        if isinstance(obj, (list, tuple)):
+            ret_list = []
+            for cur_val in obj:
+                cur_fp = WaveformSegmentCache._get_fingerprint(cur_val, wfmt_names)
+                if cur_fp is None and cur_val is not None:
+                    return None
+                ret_list.append(cur_fp)
+            return tuple(ret_list)
+        if isinstance(obj, dict):
+            obj_items = obj.items()
+        elif isinstance(obj, WaveformTransformationArgs):
+            wfmt_names.add(obj.wfmt_name)
+            obj_items = [('wfmt_name', obj.wfmt_name), ('kwargs', obj.kwargs)]
+        elif isinstance(obj, (WaveformSegmentBase, WaveformTransformation)):
+            obj_items = [(k,v) for k,v in obj.__dict__.items() if not k in WaveformSegmentCache.IGNORED_ATTRIBUTES]
+        else:
+            return None
+        ret_list = [obj.__class__.__name__]
+        for cur_key, cur_val in sorted(obj_items, key=lambda x: str(x[0])):
+            cur_fp = WaveformSegmentCache._get_fingerprint(cur_val, wfmt_names)
+            if cur_fp is None and cur_val is not None:
+                return None
+            ret_list.append((cur_key, cur_fp))
+        return tuple(ret_list)
 
 class WaveformSegmentBase(LockableProperties):
+    #Cache of the generated waveforms shared across all segments (see WaveformSegmentCache)
+    WaveformCache = WaveformSegmentCache()
+
     def __init__(self, name, transform_func, duration):
         self._name = name
         if transform_func:
@@ -37,6 +162,16 @@ class WaveformSegmentBase(LockableProperties):
     def get_WFMT(self):
         return self._transform_func
 
+    def _get_state_version(self, wfmt_names = None):
+        '''
+        Returns a signature that changes whenever a property of this segment (or of its children) or an argument of its WFMT is set.
+        The names of the WFMTs used are added to the set wfmt_names (if given) as the WFMT objects themselves are tracked by the
+        parent WaveformAWG. Note that in-place modifications of arrays held by the segment are not tracked (set the property instead).
+        '''
+        if wfmt_names is None:
+            wfmt_names = set()
+        return (LockableProperties._get_state_version(self), WaveformSegmentCache._get_fingerprint(self._transform_func, wfmt_names))
+
     def reset_waveform_transforms(self, lab):
         if self._transform_func:
             return lab.WFMT(self._transform_func.wfmt_name).initialise_for_new_waveform()
@@ -53,8 +188,17 @@ class WaveformSegmentBase(LockableProperties):
             - ch_index - Dimension/index of the waveform; useful when the modification function is a function of dimnension
                          in ND waveforms.
         
-        Returns a numpy array of points representing the total waveform.
+        Returns a numpy array of points representing the total waveform. Note that the array is read-only as it may be cached (see
+        WaveformSegmentCache).
         '''
+        #Reuse the waveform if the segment, sample-rate, position and WFMT states are unchanged
+        cache_key, wfmt_names = WaveformSegmentBase.WaveformCache.get_key(self, lab, fs, t0_ind, ch_index)
+        cache_entry = WaveformSegmentBase.WaveformCache.get(cache_key)
+        if cache_entry != None:
+            for cur_name, cur_state in zip(wfmt_names, cache_entry[1]):
+                lab.WFMT(cur_name).__dict__.update(cur_state)
+            return cache_entry[0]
+
         cur_wfm = self._get_waveform(lab, fs, t0_ind, ch_index)
         #Transform if necessary:      
         if self._transform_func:
@@ -65,13 +209,40 @@ class WaveformSegmentBase(LockableProperties):
                     none_keys += [cur_key]
             for cur_none_key in none_keys:
                 kwargs.pop(cur_none_key)
-            return lab.WFMT(self._transform_func.wfmt_name).modify_waveform(cur_wfm, fs, t0_ind, ch_index, **kwargs)
-        else:
-            return cur_wfm
+            cur_wfm = lab.WFMT(self._transform_func.wfmt_name).modify_waveform(cur_wfm, fs, t0_ind, ch_index, **kwargs)
+
+        #The returned array is a read-only view so that the cached waveform (or any array held by the segment) is not modified
+        cur_wfm = np.asarray(cur_wfm).view()
+        cur_wfm.flags.writeable = False
+        if cache_key != None:
+            WaveformSegmentBase.WaveformCache.put(cache_key, cur_wfm, [WaveformSegmentCache.get_wfmt_state(lab.WFMT(x)) for x in wfmt_names])
+        return cur_wfm
 
     def _get_waveform(self, lab, fs, t0_ind, ch_index):
         raise NotImplementedError()
 
+    @staticmethod
+    def _assemble_segments(wfm_segs, lab, fs, t0_ind, ch_index, num_repeats = 1):
+        '''
+        Returns the concatenated waveforms of the given list of segments (repeated num_repeats times). The segment lengths are first
+        calculated (via NumPts; thus, any elastic segment must already have its duration set) to preallocate the output array into
+        which each segment's waveform is written directly. Segments with zero points are skipped.
+        '''
+        seg_lens = [x.NumPts(fs) for x in wfm_segs]
+        final_wfm = np.empty(sum(seg_lens) * num_repeats)
+        t0 = 0
+        for m in range(num_repeats):
+            for cur_wfm_seg, cur_len in zip(wfm_segs, seg_lens):
+                if cur_len == 0:
+                    continue
+                cur_wfm = cur_wfm_seg.get_waveform(lab, fs, t0_ind + t0, ch_index)
+                if t0 + cur_wfm.size > final_wfm.size:
+                    #The segment gave more points than given by NumPts (e.g. rounding in a nested group) - so just grow the array
+                    final_wfm = np.concatenate((final_wfm[:t0], np.empty(cur_wfm.size + final_wfm.size - t0)))
+                final_wfm[t0:t0+cur_wfm.size] = cur_wfm
+                t0 += cur_wfm.size
+        return final_wfm[:t0]
+
     def _get_current_config(self):
         '''
         Gets the current JSON-style configuration that can be used to reinstantiate this class. Note that the inherited
@@ -158,6 +329,11 @@ class WFS_Group(WaveformSegmentBase):
     def NumRepeats(self, const_val):
         self._num_repeats = const_val
 
+    def _get_state_version(self, wfmt_names = None):
+        if wfmt_names is None:
+            wfmt_names = set()
+        return (WaveformSegmentBase._get_state_version(self, wfmt_names), tuple((x, x._get_state_version(wfmt_names)) for x in self._wfm_segs))
+
     def get_waveform_segment(self, wfm_segment_name):
         the_seg = None
         for cur_seg in self._wfm_segs:
@@ -246,15 +422,7 @@ class WFS_Group(WaveformSegmentBase):
             self._wfm_segs[elas_seg_ind].Duration = elastic_time    #Negate the -1 segment
 
         #Concatenate the individual waveform segments
-        final_wfm = np.array([])
-        t0 = 0
-        for m in range(self._num_repeats):
-            for cur_wfm_seg in self._wfm_segs:
-                if cur_wfm_seg.NumPts(fs) == 0:
-                    continue
-                #TODO: Preallocate - this is a bit inefficient...
-                final_wfm = np.concatenate((final_wfm, cur_wfm_seg.get_waveform(lab, fs, t0_ind + t0, ch_index)))
-                t0 = final_wfm.size
+        final_wfm = WaveformSegmentBase._assemble_segments(self._wfm_segs, lab, fs, t0_ind, ch_index, self._num_repeats)
 
         #Reset segment to be elastic
         if elas_seg_ind != -1:
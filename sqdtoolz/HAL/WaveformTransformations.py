@@ -87,6 +87,9 @@ class WaveformTransformation(LockableProperties):
         raise NotImplementedError()
 
 class WFMT_ModulationIQ(WaveformTransformation):
+    #The running phase is updated when generating waveforms (it is not a setting)
+    _VOLATILE_ATTRIBUTES = ('_cur_t0',)
+
     def __init__(self, name, lab, iq_frequency, **kwargs):
         super().__init__(name)
         if lab._register_WFMT(self):
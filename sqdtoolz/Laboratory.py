@@ -13,6 +13,9 @@ from sqdtoolz.HAL.ACQvna import*
 from sqdtoolz.HAL.GENatten import*
 from sqdtoolz.HAL.GENsmu import*
 from sqdtoolz.HAL.Processors.ProcessorCPU import*
+from sqdtoolz.HAL.Processors.ProcessorCPUPool import ProcessorCPUPool
+from sqdtoolz.Utilities.ExperimentIndex import ExperimentIndex
+from sqdtoolz.Utilities.FileIO import FileIOReader
 try:
     from sqdtoolz.HAL.Processors.ProcessorGPU import*
 except ModuleNotFoundError:
@@ -44,6 +47,7 @@ class Laboratory:
         self._group_dir = {'Dir':"", 'InitDir':"", 'SweepQueue':[], 'ExptIndex' : -1}
 
         Path(self._save_dir).mkdir(parents=True, exist_ok=True)
+        self._expt_index = ExperimentIndex(self._save_dir)
 
         self._using_VS_Code = using_VS_Code
         self._cur_message = ''
@@ -78,13 +82,31 @@ class Laboratory:
             return None
         return None
 
+    def _get_last_expt_dirs(self):
+        #Candidate experiment directories in reverse chronological order - taken from the index if it exists. If none of the indexed
+        #folders suit the caller (e.g. legacy folders written before the index), it falls back to walking through all the folders.
+        indexed_dirs = set()
+        if self._expt_index.exists():
+            for cur_entry in self._expt_index.iter_entries_reversed():
+                cur_dir = self._expt_index.get_folder_path(cur_entry).rstrip('/')
+                indexed_dirs.add(cur_dir)
+                yield cur_dir
+        #Walk gives a tuple: (dirpath, dirnames, filenames)
+        dirs = [x[0] for x in os.walk(self._save_dir)]
+        dirs.sort()
+        for cur_dir in dirs[::-1]:
+            if not cur_dir.replace('\\','/') in indexed_dirs:
+                yield cur_dir
+
     def update_variables_from_last_expt(self, file_name = ''):
         if file_name == '':
-            #TODO: Stress test this with say 100000 directories
-            dirs = [x[0] for x in os.walk(self._save_dir)]  #Walk gives a tuple: (dirpath, dirnames, filenames)
-            cur_dir = dirs[-1].replace('\\','/')
-            if os.path.isfile(cur_dir + "/laboratory_parameters.txt"):
-                filepath = cur_dir + "/laboratory_parameters.txt"
+            filepath = ''
+            for cur_dir in self._get_last_expt_dirs():
+                cur_dir = cur_dir.replace('\\','/')
+                if os.path.isfile(cur_dir + "/laboratory_parameters.txt"):
+                    filepath = cur_dir + "/laboratory_parameters.txt"
+                    break
+            assert filepath != '', "No previous experiment with a laboratory_parameters.txt file was found."
         else:
             filepath = file_name
         with open(filepath) as json_file:
@@ -112,10 +134,9 @@ class Laboratory:
                 dirs = [folder_dir]
             else:
                 #Go through the directories in reverse chronological order (presuming data-stamped folders)
-                dirs = [x[0] for x in os.walk(self._save_dir)]  #Walk gives a tuple: (dirpath, dirnames, filenames)
-                dirs.sort()
+                dirs = self._get_last_expt_dirs()
 
-            for cur_cand_dir in dirs[::-1]:
+            for cur_cand_dir in dirs:
                 cur_dir = cur_cand_dir.replace('\\','/')
                 #Check current candidate directory has the required files
                 if not os.path.isfile(cur_dir + "/laboratory_configuration.txt"):
@@ -423,29 +444,54 @@ class Laboratory:
             new_rec_params += [(new_rec_param[0], new_rec_param[1], cur_param_name)]
         kwargs['rec_params'] = new_rec_params
 
-        ret_vals = expt_obj._run(cur_exp_path, sweep_vars, ping_iteration=self._update_progress_bar, kill_signal=self._kill_switch_check, **kwargs)
-        self._group_dir['ExptIndex'] += 1
-
-        #Save the experiment configuration
-        self.save_experiment_configs(cur_exp_path)
-        #Save experiment-specific experiment-configuration data (i.e. timing diagram)
-        expt_obj.save_config(cur_exp_path, 'timing_diagram', 'experiment_parameters.txt', self._group_dir['SweepQueue'], self._group_dir['ExptIndex'])
-
-        #Run postprocessing if the experiment completed
-        if not self._killed_expt:
-            expt_obj._post_process(ret_vals)
+        #The experiment is recorded in the save directory's index even if it fails (with Completed set to False)
+        ret_vals = None
+        run_completed = False
+        try:
+            ret_vals = expt_obj._run(cur_exp_path, sweep_vars, ping_iteration=self._update_progress_bar, kill_signal=self._kill_switch_check, **kwargs)
+            self._group_dir['ExptIndex'] += 1
+
+            #Save the experiment configuration
+            self.save_experiment_configs(cur_exp_path)
+            #Save experiment-specific experiment-configuration data (i.e. timing diagram)
+            expt_obj.save_config(cur_exp_path, 'timing_diagram', 'experiment_parameters.txt', self._group_dir['SweepQueue'], self._group_dir['ExptIndex'])
+
+            #Run postprocessing if the experiment completed
+            if not self._killed_expt:
+                expt_obj._post_process(ret_vals)
         
-        #Save instrument configurations (QCoDeS)
-        self._save_instrument_config(cur_exp_path)
-        #Save Laboratory Configuration
-        self.save_laboratory_config(cur_exp_path)
+            #Save instrument configurations (QCoDeS)
+            self._save_instrument_config(cur_exp_path)
+            #Save Laboratory Configuration
+            self.save_laboratory_config(cur_exp_path)
         
-        #Save Laboratory Parameters
-        self.save_variables(cur_exp_path)
+            #Save Laboratory Parameters
+            self.save_variables(cur_exp_path)
+            run_completed = True
+        finally:
+            self._add_index_entry(expt_obj, folder_time_stamp, sweep_vars, ret_vals, run_completed)
 
         self.update_state()
         return ret_vals
 
+    def _add_index_entry(self, expt_obj, folder_time_stamp, sweep_vars, ret_vals, run_completed = True):
+        entry = {
+            'TimeStamp' : datetime.now().isoformat(),
+            'Name' : expt_obj.Name,
+            'Type' : expt_obj.__class__.__name__,
+            'Group' : self._group_dir['Dir'],
+            'Folder' : folder_time_stamp,
+            #Malformed sweeping variables (i.e. the experiment raised on them) are skipped so that the original error is not masked
+            'Sweeps' : [x[0] if isinstance(x[0], str) else x[0].Name for x in sweep_vars if isinstance(x, tuple)] if isinstance(sweep_vars, list) else [],
+            'Completed' : run_completed and not self._killed_expt
+        }
+        if isinstance(ret_vals, FileIOReader):
+            entry['DataFile'] = os.path.basename(ret_vals.file_path)
+            entry['Shape'] = [len(x) for x in ret_vals.param_vals] + [len(ret_vals.dep_params)]
+        if isinstance(getattr(expt_obj, 'last_rec_params', None), FileIOReader):
+            entry['RecParamsFile'] = os.path.basename(expt_obj.last_rec_params.file_path)
+        self._expt_index.add_entry(entry)
+
     def save_variables(self, cur_exp_path = '', file_name = 'laboratory_parameters.txt'):
         param_dict = {k:v._get_current_config() for (k,v) in self._variables.items()}
         with open(cur_exp_path + file_name, 'w') as outfile:
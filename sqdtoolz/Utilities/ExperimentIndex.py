@@ -0,0 +1,76 @@
+import json
+import os
+
+class ExperimentIndex:
+    '''
+    Append-only index of the experiments run in a save directory. It is stored as a JSON-lines file in the save directory; each
+    line records a single experiment (time-stamp, name, group, sweeping variables, data shape and file paths relative to the save
+    directory). This makes lookups like "the last experiment" O(1) instead of having to walk through every folder in the save
+    directory. Note that it only depends on the standard library so that standalone tools (e.g. ExperimentViewer) may use it.
+    '''
+    FILE_NAME = '_experiment_index.jsonl'
+
+    def __init__(self, save_dir):
+        self._save_dir = save_dir.replace('\\','/')
+        if self._save_dir != '' and not self._save_dir.endswith('/'):
+            self._save_dir += '/'
+        self._file_path = self._save_dir + ExperimentIndex.FILE_NAME
+
+    @property
+    def FilePath(self):
+        return self._file_path
+
+    def exists(self):
+        return os.path.isfile(self._file_path)
+
+    def add_entry(self, entry):
+        #A single write of a whole line keeps the file parsable even if the kernel is killed mid-experiment
+        with open(self._file_path, 'a') as outfile:
+            outfile.write(json.dumps(entry) + '\n')
+
+    def get_folder_path(self, entry):
+        return self._save_dir + entry['Folder']
+
+    def get_entries(self):
+        if not self.exists():
+            return []
+        with open(self._file_path, 'rb') as infile:
+            entries = [self._parse_line(x) for x in infile]
+        return [x for x in entries if x is not None]
+
+    def get_last_entry(self):
+        return next(self.iter_entries_reversed(), None)
+
+    def iter_entries_reversed(self, block_size = 4096):
+        #Reads the file backwards in blocks so that the latest entries are found without parsing the entire file
+        if not self.exists():
+            return
+        with open(self._file_path, 'rb') as infile:
+            infile.seek(0, os.SEEK_END)
+            cur_pos = infile.tell()
+            remainder = b''
+            while cur_pos > 0:
+                read_size = min(block_size, cur_pos)
+                cur_pos -= read_size
+                infile.seek(cur_pos)
+                lines = (infile.read(read_size) + remainder).split(b'\n')
+                #The first line may be incomplete - so it is carried into the next block
+                remainder = lines.pop(0)
+                for cur_line in lines[::-1]:
+                    cur_entry = self._parse_line(cur_line)
+                    if cur_entry is not None:
+                        yield cur_entry
+            cur_entry = self._parse_line(remainder)
+            if cur_entry is not None:
+                yield cur_entry
+
+    @staticmethod
+    def _parse_line(line):
+        line = line.strip()
+        if len(line) == 0:
+            return None
+        try:
+            return json.loads(line)
+        except ValueError:
+            #Ignore partially written lines
+            return None
@@ -7,6 +7,12 @@ import os
 import json
 import sys
 
+try:
+    #Run as a standalone script from the Utilities folder (see Laboratory.open_browser)
+    from ExperimentIndex import ExperimentIndex
+except ModuleNotFoundError:
+    from sqdtoolz.Utilities.ExperimentIndex import ExperimentIndex
+
 from numpy import isin
 
 class ListBoxScrollBar:
@@ -311,17 +317,29 @@ class ExperimentViewer:
         self.pw_main_LR_UI.update()
         self.pw_main_LR_UI.sash_place(0, 110, 0)
 
+        #Populate the experiments from the index of the save directory and then walk through the date folders for any experiments
+        #missing from the index (e.g. legacy folders written before the index); only completed experiment folders are listed.
+        expt_folders = {}
+        expt_index = ExperimentIndex(self._path)
+        for cur_entry in expt_index.get_entries():
+            cur_date_folder, cur_data_folder = cur_entry['Folder'].strip('/').split('/', 1)
+            expt_folders.setdefault(cur_date_folder, {})[cur_data_folder] = expt_index.get_folder_path(cur_entry).rstrip('/')
         cur_date_folders = next(os.walk(self._path))[1]
         for cur_date_folder in cur_date_folders:
-            tree_folder_date =self.trvw_expts.insert("", "end", text=cur_date_folder)
-
             cur_path_date = self._path + cur_date_folder
             cur_folders = next(os.walk(cur_path_date))[1]
             for cur_data_folder in cur_folders:
-                # cur_sub_folders  = next(os.walk(cur_path_data))[1]
-                cur_path_data = cur_path_date + '/' + cur_data_folder
+                if not cur_data_folder in expt_folders.get(cur_date_folder, {}):
+                    expt_folders.setdefault(cur_date_folder, {})[cur_data_folder] = cur_path_date + '/' + cur_data_folder
+
+        for cur_date_folder in sorted(expt_folders.keys()):
+            tree_folder_date = None
+            for cur_data_folder in sorted(expt_folders[cur_date_folder].keys()):
+                cur_path_data = expt_folders[cur_date_folder][cur_data_folder]
                 if not os.path.isfile(cur_path_data + "/laboratory_configuration.txt"):
                     continue
+                if tree_folder_date == None:
+                    tree_folder_date = self.trvw_expts.insert("", "end", text=cur_date_folder)
                 self.trvw_expts.insert(tree_folder_date, "end", text=cur_data_folder, tags=[cur_path_data])
 
         while True:
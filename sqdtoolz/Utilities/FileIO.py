@@ -4,6 +4,10 @@ import json
 from h5py._hl.files import File
 import numpy as np
 import itertools
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import queue
+import time
 import xarray as xr
 
 from datetime import datetime
@@ -16,6 +20,13 @@ class FileIOWriter:
         self._filepath = filepath
         self._hf = None
         self.store_timestamps = kwargs.get('store_timestamps', True)
+        #Compact time-stamps: stored as int64 nanoseconds since epoch; one per data packet instead of one per data point
+        self.compact_timestamps = kwargs.get('compact_timestamps', False)
+        #Buffered mode: data packets are held in an in-memory ring buffer and written to disk in chunk-aligned batches
+        self.buffered = kwargs.get('buffered', False)
+        self.flush_time = kwargs.get('flush_time', 5.0)             #Maximum time (in seconds) that data may sit in the buffer
+        self.flush_size = kwargs.get('flush_size', 64*1024**2)      #Size (in bytes) of the ring buffer
+        self.chunk_size = kwargs.get('chunk_size', 1024**2)         #Target size (in bytes) of the HDF5 chunks in buffered mode
 
     def _init_hdf5(self, sweep_vars, data_pkt, sweepEx = {}):
         if self._hf == None:
@@ -66,33 +77,145 @@ class FileIOWriter:
 
                 data_array_shape = [x[1].size for x in sweep_vars] + list(param_sizes)
                 arr_size = int(np.prod(data_array_shape))
-                arr = np.zeros((arr_size, len(data_pkt['data'].keys())))
-                arr[:] = np.nan
-                self._dset = self._hf.create_dataset("data", data=arr, compression="gzip")
+                num_chs = len(self._meas_chs)
+                if self.compact_timestamps:
+                    self._ts_per_pkt = 1
+                else:
+                    self._ts_per_pkt = self._datapkt_size
+                if self.buffered:
+                    chunk_rows = self._init_buffer(arr_size, num_chs)
+                    chunks_data, chunks_ts = (chunk_rows, num_chs), (chunk_rows // self._datapkt_size * self._ts_per_pkt,)
+                else:
+                    chunks_data, chunks_ts = True, True
+                #The datasets are chunked with a fill-value so that HDF5 only allocates chunks (lazily) on being written; thus, the
+                #start-up cost and memory footprint do not scale with the sweep size. Unwritten points are read as NaN (or NaT).
+                self._dset = self._hf.create_dataset("data", shape=(arr_size, num_chs), dtype=np.float64, fillvalue=np.nan, compression="gzip", chunks=chunks_data)
                 self._dset_ind = 0
-                #Time-stamps (usually length 27 bytes)
                 if self.store_timestamps:
-                    self._ts_len = len( np.datetime_as_string(np.datetime64(datetime.now()),timezone='UTC').encode('utf-8') )
-                    arr = np.array([np.datetime64()]*arr_size, dtype=f'S{self._ts_len}')
-                    self._dsetTS = self._hf.create_dataset("timeStamps", data=arr, compression="gzip")
+                    ts_size = arr_size // self._datapkt_size * self._ts_per_pkt
+                    if self.compact_timestamps:
+                        #The fill-value is the integer representation of NaT
+                        ts_dtype, ts_fill = np.int64, np.datetime64('NaT').astype(np.int64)
+                    else:
+                        #Time-stamps (usually length 27 bytes)
+                        self._ts_len = len( np.datetime_as_string(np.datetime64(datetime.now()),timezone='UTC').encode('utf-8') )
+                        ts_dtype, ts_fill = f'S{self._ts_len}', b'NaT'
+                    self._dsetTS = self._hf.create_dataset("timeStamps", shape=(ts_size,), dtype=ts_dtype, fillvalue=ts_fill, compression="gzip", chunks=chunks_ts)
+                    if self.compact_timestamps:
+                        self._dsetTS.attrs['packet_size'] = self._datapkt_size
+                    if self.buffered:
+                        self._buf_ts = np.zeros(self._buf_pkts * self._ts_per_pkt, dtype=ts_dtype)
                 
                 self._hf.swmr_mode = True
 
-    def push_datapkt(self, data_pkt, sweep_vars, sweepEx = {}):
+    def _init_buffer(self, arr_size, num_chs):
+        #Chunks hold an integer number of data packets (capped to the total dataset size)
+        pkt_bytes = self._datapkt_size * num_chs * 8
+        pkts_total = arr_size // self._datapkt_size
+        pkts_per_chunk = int(min(max(self.chunk_size // pkt_bytes, 1), pkts_total))
+        #The ring buffer holds an integer number of chunks so that every full flush is chunk-aligned
+        chunks_per_buf = max(self.flush_size // (pkts_per_chunk * pkt_bytes), 1)
+        self._buf_pkts = int(min(chunks_per_buf * pkts_per_chunk, pkts_total))
+        self._buf = np.zeros((self._buf_pkts * self._datapkt_size, num_chs))
+        self._buf_start = 0     #Packet index (in the dataset) of the first slot in the ring buffer
+        self._buf_filled = 0    #Number of packets currently written into the ring buffer
+        self._buf_written = 0   #Number of packets in the ring buffer already written onto disk
+        self._buf_last_flush = time.time()
+        return pkts_per_chunk * self._datapkt_size
+
+    def _flush_buffer(self):
+        if self._buf_filled > self._buf_written:
+            buf_slc = np.s_[self._buf_written*self._datapkt_size : self._buf_filled*self._datapkt_size]
+            dset_slc = np.s_[(self._buf_start+self._buf_written)*self._datapkt_size : (self._buf_start+self._buf_filled)*self._datapkt_size]
+            self._dset[dset_slc] = self._buf[buf_slc]
+            if self.store_timestamps:
+                ts_slc = np.s_[(self._buf_start+self._buf_written)*self._ts_per_pkt : (self._buf_start+self._buf_filled)*self._ts_per_pkt]
+                self._dsetTS[ts_slc] = self._buf_ts[self._buf_written*self._ts_per_pkt : self._buf_filled*self._ts_per_pkt]
+                self._dsetTS.flush()
+            self._dset.flush()
+            self._buf_written = self._buf_filled
+        self._buf_last_flush = time.time()
+        #Wrap around once the ring buffer has been completely written onto disk
+        if self._buf_written == self._buf_pkts:
+            self._buf_start += self._buf_pkts
+            self._buf_filled = 0
+            self._buf_written = 0
+
+    def push_datapkt(self, data_pkt, sweep_vars, sweepEx = {}, timestamp = None):
+        '''
+        Writes the data packet. The time-stamp (a datetime object) may be given if the data packet was acquired earlier than it is
+        written (e.g. when written via FileIOWriterThread); otherwise, the current time is used.
+        '''
         self._init_hdf5(sweep_vars, data_pkt, sweepEx)
 
+        if self.buffered:
+            self._push_datapkt_buffered(data_pkt, timestamp)
+            return
+
         cur_data = np.vstack([data_pkt['data'][x].flatten() for x in self._meas_chs]).T
         self._dset[self._dset_ind*self._datapkt_size : (self._dset_ind+1)*self._datapkt_size] = cur_data
         if self.store_timestamps:
-            #Trick taken from here: https://stackoverflow.com/questions/68443753/datetime-storing-in-hd5-database
-            cur_times = [np.datetime64(datetime.now())] * cur_data.shape[0]
-            utc_strs = np.array( [np.datetime_as_string(n,timezone='UTC').encode('utf-8') for n in cur_times] )
-            self._dsetTS[self._dset_ind*self._datapkt_size : (self._dset_ind+1)*self._datapkt_size] = utc_strs
+            self._dsetTS[self._dset_ind*self._ts_per_pkt : (self._dset_ind+1)*self._ts_per_pkt] = self._get_cur_timestamps(timestamp=timestamp)
         self._dset_ind += 1
         self._dset.flush()
-    
+
+    def push_datapkt_blocks(self, data_blocks, num_blocks, sweep_vars, sweepEx = {}):
+        '''
+        Writes a single data packet that is streamed as an iterable of blocks along its first parameter (e.g. repetitions yielded by
+        the ACQ driver). Each block is written straight into its slice of the dataset so that the full data packet is never held in
+        memory. The blocks must be formatted like a data packet with the first dimension being the number of indices in the block.
+        The argument num_blocks gives the total size of the first dimension over the entire data packet.
+        '''
+        assert not self.buffered, "Streamed data packets cannot be written in buffered mode."
+        cur_row, end_row = None, None
+        for cur_blk in data_blocks:
+            if self._hf == None:
+                #Only the shape of the data packet is required to create the file - so use zero-strided arrays to describe it
+                data_pkt = {k:v for k,v in cur_blk.items() if k != 'data'}
+                data_pkt['data'] = {k : np.broadcast_to(np.nan, (num_blocks,) + v.shape[1:]) for k,v in cur_blk['data'].items()}
+                self._init_hdf5(sweep_vars, data_pkt, sweepEx)
+            if cur_row is None:
+                cur_row, end_row = self._dset_ind*self._datapkt_size, (self._dset_ind+1)*self._datapkt_size
+            cur_data = np.vstack([cur_blk['data'][x].reshape(-1) for x in self._meas_chs]).T
+            assert cur_row + cur_data.shape[0] <= end_row, "The streamed blocks exceed the size of the data packet."
+            self._dset[cur_row : cur_row + cur_data.shape[0]] = cur_data
+            if self.store_timestamps and not self.compact_timestamps:
+                self._dsetTS[cur_row : cur_row + cur_data.shape[0]] = self._get_cur_timestamps(cur_data.shape[0])
+            cur_row += cur_data.shape[0]
+            self._dset.flush()
+        if cur_row is None:
+            return
+        if self.store_timestamps and self.compact_timestamps:
+            self._dsetTS[self._dset_ind : self._dset_ind+1] = self._get_cur_timestamps()
+        self._dset_ind += 1
+
+    def _get_cur_timestamps(self, num_points = None, timestamp = None):
+        if timestamp is None:
+            timestamp = datetime.now()
+        cur_time = np.datetime64(timestamp, 'ns')
+        if self.compact_timestamps:
+            return np.array([cur_time.astype(np.int64)])
+        if num_points is None:
+            num_points = self._ts_per_pkt
+        #Trick taken from here: https://stackoverflow.com/questions/68443753/datetime-storing-in-hd5-database
+        #The time-stamp string is encoded once and then broadcast across all points in the data packet
+        return np.full(num_points, np.datetime_as_string(cur_time, unit='us', timezone='UTC').encode('utf-8'), dtype=f'S{self._ts_len}')
+
+    def _push_datapkt_buffered(self, data_pkt, timestamp = None):
+        buf_slc = np.s_[self._buf_filled*self._datapkt_size : (self._buf_filled+1)*self._datapkt_size]
+        for m, cur_ch in enumerate(self._meas_chs):
+            self._buf[buf_slc, m] = np.ravel(data_pkt['data'][cur_ch])
+        if self.store_timestamps:
+            self._buf_ts[self._buf_filled*self._ts_per_pkt : (self._buf_filled+1)*self._ts_per_pkt] = self._get_cur_timestamps(timestamp=timestamp)
+        self._buf_filled += 1
+        self._dset_ind += 1
+        if self._buf_filled == self._buf_pkts or time.time() - self._buf_last_flush >= self.flush_time:
+            self._flush_buffer()
+
     def close(self):
         if self._hf:
+            if self.buffered and hasattr(self, '_buf'):
+                self._flush_buffer()
             self._hf.close()
             self._hf = None
 
@@ -126,6 +249,199 @@ class FileIOWriter:
         hf.create_dataset("data", data=data_array.reshape((arr_size, len(dep_param_names))), compression="gzip")
         hf.close()
 
+class FileIOWriterThread:
+    '''
+    Background thread that takes data packets off a bounded queue and pushes them onto their FileIOWriter objects. This allows the
+    file I/O of one sweeping point to overlap with the instrument preparation and acquisition of the next. The queue size bounds the
+    number of data packets held in memory (push_datapkt blocks when it is full). The time-stamps of the data packets are taken when
+    they are queued (not when they are written). Any error raised while writing is re-raised in the calling thread on the next call
+    to push_datapkt, check_error or close.
+    '''
+    def __init__(self, max_queue_size = 8):
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            cur_item = self._queue.get()
+            if cur_item is None:
+                break
+            #After an error, the remaining data packets are discarded so that the queue still drains (i.e. push_datapkt never hangs)
+            if self._error is None:
+                try:
+                    cur_item[0].push_datapkt(*cur_item[1:4], timestamp=cur_item[4])
+                except Exception as e:
+                    self._error = e
+
+    def push_datapkt(self, writer, data_pkt, sweep_vars, sweepEx = {}):
+        self.check_error()
+        #Time-stamp the data packet now as it may sit in the queue for several sweeping points
+        self._queue.put((writer, data_pkt, sweep_vars, sweepEx, datetime.now()))
+
+    def check_error(self):
+        if self._error is not None:
+            self._stop()
+            raise self._error
+
+    def _stop(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def close(self):
+        '''
+        Waits for all queued data packets to be written (the FileIOWriter objects are not closed).
+        '''
+        self._stop()
+        self.check_error()
+
+class FileIOLazyArrayBase:
+    """
+    Common indexing for the read-only lazy ND-arrays. Supports integers, slices, Ellipsis and 1D integer arrays on every axis
+    (note that like h5py, the integer arrays index each axis independently).
+    """
+    def __init__(self, shape, dtype):
+        self.shape = tuple(int(x) for x in shape)
+        self.dtype = dtype
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None):
+        arr = self[...]
+        if dtype is not None:
+            return arr.astype(dtype)
+        return arr
+
+    def _get_indices(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        num_ellipsis = sum(1 for x in key if x is Ellipsis)
+        assert num_ellipsis <= 1, "Only one Ellipsis can be used when slicing the lazy array."
+        if num_ellipsis == 1:
+            ind = next(m for m,x in enumerate(key) if x is Ellipsis)
+            key = key[:ind] + (np.s_[:],)*(self.ndim - len(key) + 1) + key[ind+1:]
+        assert len(key) <= self.ndim, f"Too many indices given for a lazy array with {self.ndim} dimensions."
+        key = key + (np.s_[:],)*(self.ndim - len(key))
+        #Convert every axis into an array of indices, noting the axes that are dropped via integer indexing
+        inds, drops = [], []
+        for m, cur_key in enumerate(key):
+            cur_size = self.shape[m]
+            if isinstance(cur_key, slice):
+                inds += [np.arange(*cur_key.indices(cur_size))]
+                drops += [False]
+            elif np.isscalar(cur_key) and np.issubdtype(type(cur_key), np.integer):
+                assert -cur_size <= cur_key < cur_size, f"Index {cur_key} is out of bounds for axis {m} of size {cur_size}."
+                inds += [np.array([cur_key % cur_size])]
+                drops += [True]
+            else:
+                cur_key = np.asarray(cur_key)
+                assert cur_key.ndim == 1 and np.issubdtype(cur_key.dtype, np.integer), f"Axis {m} must be indexed via an integer, slice or 1D array of integers."
+                assert np.all((cur_key >= -cur_size) & (cur_key < cur_size)), f"The indices on axis {m} are out of bounds for size {cur_size}."
+                inds += [cur_key % cur_size]
+                drops += [False]
+        return inds, drops
+
+class FileIOLazyArray(FileIOLazyArrayBase):
+    """
+    Read-only ND-array view over the 2D data array (i.e. rows by output channels) in a SQDToolz HDF5 file. It is indexed just like
+    the array returned by FileIOReader.get_numpy_array (i.e. [param1, param2, ..., channel]), except that slicing it only reads the
+    required hyperslabs from disk.
+    """
+    def __init__(self, dset, param_shape):
+        self._dset = dset
+        self._param_shape = tuple(int(x) for x in param_shape)
+        super().__init__(self._param_shape + (dset.shape[1],), dset.dtype)
+        #Number of rows in the 2D array spanned by a unit step along each parameter axis
+        self._row_strides = [int(np.prod(self._param_shape[m+1:])) for m in range(len(self._param_shape))]
+
+    def _get_row_runs(self, inds):
+        #Returns the starting rows of (equally sized) contiguous runs of rows along with the length of the runs
+        num_params = len(self._param_shape)
+        full_axes = [np.array_equal(inds[m], np.arange(self._param_shape[m])) for m in range(num_params)]
+        #Innermost parameter axis that is not fully selected (all subsequent axes are contiguous blocks of rows)
+        k = max([m for m in range(num_params) if not full_axes[m]], default=-1)
+        if k == -1:
+            return np.array([0]), int(np.prod(self._param_shape))
+        block = self._row_strides[k]
+        if inds[k].size > 1 and np.all(np.diff(inds[k]) == 1):
+            run_len = inds[k].size * block
+            offsets = inds[k][:1] * block
+        else:
+            run_len = block
+            offsets = inds[k] * block
+        starts = np.zeros(1, dtype=np.int64)
+        for m in range(k):
+            starts = (starts[:,None] + inds[m][None,:]*self._row_strides[m]).ravel()
+        return (starts[:,None] + offsets[None,:]).ravel(), run_len
+
+    def __getitem__(self, key):
+        inds, drops = self._get_indices(key)
+        out_shape = [x.size for x in inds]
+        final_shape = tuple(x for m,x in enumerate(out_shape) if not drops[m])
+        if 0 in out_shape:
+            return np.empty(final_shape, dtype=self.dtype)
+
+        #Read a contiguous range of channels (HDF5 only supports increasing selections) and select the actual channels in RAM
+        ch_inds = inds[-1]
+        if ch_inds.size == 1 or np.all(np.diff(ch_inds) == 1):
+            ch_slc, ch_sel = np.s_[ch_inds[0]:ch_inds[-1]+1], None
+        else:
+            ch_slc, ch_sel = np.s_[ch_inds.min():ch_inds.max()+1], ch_inds - ch_inds.min()
+
+        starts, run_len = self._get_row_runs(inds[:-1])
+        diffs = np.diff(starts)
+        if starts.size == 1 or np.all(diffs == run_len):
+            #Single contiguous hyperslab
+            arr = self._dset[starts[0] : starts[0] + starts.size*run_len, ch_slc]
+        elif np.all(diffs == diffs[0]) and diffs[0] > run_len:
+            #Regularly strided blocks can be read as a single hyperslab
+            arr = self._dset[h5py.MultiBlockSlice(start=int(starts[0]), stride=int(diffs[0]), count=starts.size, block=run_len), ch_slc]
+        else:
+            arr = np.empty((starts.size*run_len, ch_slc.stop - ch_slc.start), dtype=self.dtype)
+            for m, cur_start in enumerate(starts):
+                arr[m*run_len:(m+1)*run_len] = self._dset[cur_start : cur_start+run_len, ch_slc]
+        if ch_sel is not None:
+            arr = arr[:, ch_sel]
+        return arr.reshape(final_shape)
+
+class FileIOLazyStack(FileIOLazyArrayBase):
+    """
+    Read-only ND-array view over a list of SQDToolz HDF5 files with identical inner shapes stacked along some outer (sweeping)
+    axes. Slicing it only opens the files required by the slice along the outer axes and only reads the required hyperslabs
+    from said files.
+    """
+    def __init__(self, file_paths, outer_shape, inner_shape, num_chs, dtype):
+        assert len(file_paths) == np.prod(outer_shape), "The number of files must match the size of the outer axes."
+        self._file_paths = file_paths
+        self._outer_shape = tuple(int(x) for x in outer_shape)
+        super().__init__(self._outer_shape + tuple(inner_shape) + (num_chs,), np.dtype(dtype))
+
+    def __getitem__(self, key):
+        inds, drops = self._get_indices(key)
+        num_outer = len(self._outer_shape)
+        final_shape = tuple(x.size for m,x in enumerate(inds) if not drops[m])
+        ret_arr = np.empty(tuple(x.size for x in inds), dtype=self.dtype)
+        if ret_arr.size == 0:
+            return ret_arr.reshape(final_shape)
+        inner_key = tuple(inds[num_outer:])
+        for cur_outer_ind in np.ndindex(*[x.size for x in inds[:num_outer]]):
+            cur_file_ind = np.ravel_multi_index(tuple(inds[m][x] for m,x in enumerate(cur_outer_ind)), self._outer_shape)
+            cur_reader = FileIOReader(self._file_paths[cur_file_ind])
+            ret_arr[cur_outer_ind] = cur_reader.get_lazy_array()[inner_key]
+            cur_reader.release()
+        return ret_arr.reshape(final_shape)
+
 class FileIOReader:
     def __init__(self, filepath):
         self.file_path = filepath
@@ -174,6 +490,13 @@ class FileIOReader:
             assert False, "The reader has released the file - create a new FileIOReader instance to extract data."
             return np.array([])
     
+    def get_lazy_array(self):
+        if not self.hdf5_file is None:
+            return FileIOLazyArray(self.dset, [len(x) for x in self.param_vals])
+        else:
+            assert False, "The reader has released the file - create a new FileIOReader instance to extract data."
+            return None
+
     def get_xarray(self):
         data_arrays = []
         arr = self.get_numpy_array()
@@ -189,7 +512,12 @@ class FileIOReader:
             assert not self.dsetTS is None, "There are no time-stamps in this data file. It was probably created before the time-stamp feature was implemented in SQDToolz."
             cur_shape = [len(x) for x in self.param_vals]
             cur_data = self.dsetTS[:]
-            cur_data = np.array([np.datetime64(x) for x in cur_data])
+            if cur_data.dtype.kind == 'i':
+                #Compact format - i.e. one epoch time-stamp (in ns) per data packet
+                cur_data = np.repeat(cur_data.astype('datetime64[ns]'), self.dsetTS.attrs['packet_size'])
+            else:
+                #Strip the UTC designator (i.e. Z) before parsing the strings in one go
+                cur_data = np.char.rstrip(cur_data, b'Z').astype('datetime64[us]')
             return cur_data.reshape(tuple(x for x in cur_shape))
         else:
             assert False, "The reader has released the file - create a new FileIOReader instance to extract data."
@@ -204,6 +532,9 @@ class FileIOReader:
             self.hdf5_file = None
 
 class FileIODirectory:
+    #Cache (stored in the group directory) of the metadata scanned from every folder
+    INDEX_CACHE_FILE = '_dir_index.json'
+
     class plt_object:
         def __init__(self, pc, z_values):
             self.pc = pc
@@ -219,7 +550,7 @@ class FileIODirectory:
             ax.add_collection(self.pc)
             ax.autoscale()
 
-    def __init__(self, filepath):
+    def __init__(self, filepath, **kwargs):
         cur_dir_path = os.path.dirname(filepath)
         dir_name = os.path.basename(cur_dir_path)
         assert dir_name[0:6].isdigit(), "The time-stamp is not present in this folder."
@@ -228,45 +559,29 @@ class FileIODirectory:
         assert os.path.basename(self._main_dir)[0:6].isdigit(), "The time-stamp is not present in the parent folder."
         self._cur_dir_suffix = dir_name[6:]
         self._cur_file_name = os.path.basename(filepath)
+        self._num_threads = kwargs.get('num_threads', 8)
 
-        #Collect all relevant similar files...
+        #Collect all relevant similar files (note that the giant numpy arrays are not read in here)...
         cur_dir_files = [x[0] for x in os.walk(self._main_dir)][1:]
+        cur_dir_files = [x for x in cur_dir_files if os.path.basename(x).endswith(self._cur_dir_suffix)]
+        use_index_cache = kwargs.get('use_index_cache', True)
+        index_cache = self._load_index_cache() if use_index_cache else {}
+        #The metadata of every folder is scanned concurrently as it is mostly bound by the file-system latency
+        with ThreadPoolExecutor(max_workers=self._num_threads) as executor:
+            folder_infos = list(executor.map(lambda x: self._scan_folder(x, index_cache.get(self._index_key(x))), cur_dir_files))
+        if use_index_cache:
+            self._save_index_cache(index_cache, cur_dir_files, folder_infos)
+
         cur_files = []
         self.folders = []
         self.folders_ignored = []
-        no_file_index = False
-        for cur_folder in cur_dir_files:
-            #Check that the suffix of the folder name matches...
-            if not os.path.basename(cur_folder).endswith(self._cur_dir_suffix):
-                continue
-
-            #Check that the relevant data and attribute files exist...
-            filepath = cur_folder +'/' + self._cur_file_name
-            if not os.path.isfile(cur_folder +'/' + self._cur_file_name):
+        for cur_folder, cur_info in zip(cur_dir_files, folder_infos):
+            #Folders with missing data or attribute files are ignored
+            if cur_info is None:
                 self.folders_ignored += [cur_folder]
                 continue
-            if not os.path.isfile(cur_folder +'/' + 'experiment_parameters.txt'):
-                self.folders_ignored += [cur_folder]
-                continue
-            if not os.path.isfile(cur_folder +'/' + 'laboratory_parameters.txt'):
-                self.folders_ignored += [cur_folder]
-                continue
-
-            #Collect the information and add it to a list (note that the giant numpy array is not read in here...)...
-            cur_file = FileIOReader(filepath)
-            with open(cur_folder +'/' + 'experiment_parameters.txt') as json_file:
-                data = json.load(json_file)
-                var_names = data['Sweeps']
-                if not no_file_index and 'FileIndex' in data:
-                    cur_file_index = data['FileIndex']
-                else:
-                    cur_file_index = 0
-                    no_file_index = True
-            with open(cur_folder +'/' + 'laboratory_parameters.txt') as json_file:
-                data = json.load(json_file)
-                var_vals = [data[x]['Value'] for x in var_names]
-
-            cur_files += [(cur_file, var_names, var_vals, cur_file_index, cur_folder)]
+            cur_files += [(cur_info, cur_info['var_names'], cur_info['var_vals'], cur_info['file_index'], cur_folder)]
+        no_file_index = any(x[3] is None for x in cur_files)
 
         #Correct for the arbitrary nature of the folder order given by: os.walk
         if no_file_index:
@@ -279,9 +594,9 @@ class FileIODirectory:
 
         #Try to figure out the outer structure...
         cur_param_names_outer = cur_files[0][1]
-        cur_param_names_inner = cur_files[0][0].param_names
-        cur_param_vals_inner = cur_files[0][0].param_vals
-        self.dep_params = cur_files[0][0].dep_params
+        cur_param_names_inner = cur_files[0][0]['param_names']
+        cur_param_vals_inner = cur_files[0][0]['param_vals']
+        self.dep_params = cur_files[0][0]['dep_params']
         same_sweep_vars_outer_loop = True
         for cur_file in cur_files:
             #Check that the outer looping variables are the same
@@ -289,15 +604,15 @@ class FileIODirectory:
                 same_sweep_vars_outer_loop = False
             #Check inner sweeping variables are the same
             #TODO: Investigate whether the demand that the files must be of the same inner parameter order is too stringent.
-            assert cur_param_names_inner == cur_file[0].param_names, "The inner parameters are different across files. This is a vary non-uniform set of files and shall not be parsed."
-            if len(cur_param_vals_inner) == len(cur_file[0].param_vals):
+            assert cur_param_names_inner == cur_file[0]['param_names'], "The inner parameters are different across files. This is a vary non-uniform set of files and shall not be parsed."
+            if len(cur_param_vals_inner) == len(cur_file[0]['param_vals']):
                 for cur_ind in range(len(cur_param_vals_inner)):
-                    if not np.array_equal(cur_param_vals_inner[cur_ind], cur_file[0].param_vals[cur_ind]):
+                    if not np.array_equal(cur_param_vals_inner[cur_ind], cur_file[0]['param_vals'][cur_ind]):
                         self.non_uniform = True
                         break
             else:
                 self.non_uniform = True
-            assert self.dep_params == cur_file[0].dep_params, "The dependent parameters are different across files. This is a vary non-uniform set of files and shall not be parsed."
+            assert self.dep_params == cur_file[0]['dep_params'], "The dependent parameters are different across files. This is a vary non-uniform set of files and shall not be parsed."
         if len(cur_param_names_outer) == 0:
             same_sweep_vars_outer_loop = False
 
@@ -321,25 +636,17 @@ class FileIODirectory:
             cur_param_names_outer = ['DirFileNo']
             self._cur_param_vals_outer = [np.arange(len(cur_files))]
 
+        self._file_paths = [x[4] + '/' + self._cur_file_name for x in cur_files]
         if not self.non_uniform:
-            #The sampling is uniform and thus, one can amalgamate all datasets into one giant numpy array!
-            cur_arrays = []
-            for cur_file in cur_files:
-                cur_arrays += [cur_file[0].get_numpy_array()]
-            cur_data = np.concatenate(cur_arrays)
-
-            #Process time-stamps (assuming that if the first file supports it, then the remaining shall as well...)
-            if cur_file[0].dsetTS is not None:
-                cur_arrays_ts = [cur_file[0].get_time_stamps() for cur_file in cur_files]
-                self._ts_valid = True
-            else:
-                self._ts_valid = False
-            cur_arrays_ts = np.concatenate(cur_arrays_ts)
-
+            #The sampling is uniform and thus, one can amalgamate all datasets into one giant (lazily read) array!
             self.param_names = cur_param_names_outer + cur_param_names_inner
             self.param_vals = self._cur_param_vals_outer + cur_param_vals_inner
-            self._cur_data = cur_data.reshape(tuple( [x.size for x in self.param_vals] + [len(self.dep_params)] ))
-            self._cur_data_ts = cur_arrays_ts.reshape(tuple( [x.size for x in self.param_vals] ))
+            self._lazy_data = FileIOLazyStack(self._file_paths, [x.size for x in self._cur_param_vals_outer], [x.size for x in cur_param_vals_inner],
+                                              len(self.dep_params), cur_files[0][0]['dtype'])
+            self._cur_data = None
+            #Process time-stamps (assuming that if the first file supports it, then the remaining shall as well...)
+            self._ts_valid = cur_files[0][0]['has_time_stamps']
+            self._cur_data_ts = None
         else:
             #TIME STAMPS ARE CURRENTLY UNSUPPORTED FOR NON-UNIFORM INDEXING
             #TODO: Give support for time-stamps in non-uniform indexing...
@@ -349,7 +656,12 @@ class FileIODirectory:
             self.param_names = cur_param_names_outer + cur_param_names_inner
             self.param_vals = self._cur_param_vals_outer
 
-            self._cur_data = [{'param_vals':x[0].param_vals, 'data':x[0].get_numpy_array()} for x in cur_files]
+            self._lazy_data = None
+            self._cur_data = []
+            for cur_file_path in self._file_paths:
+                cur_reader = FileIOReader(cur_file_path)
+                self._cur_data += [{'param_vals':cur_reader.param_vals, 'data':cur_reader.get_numpy_array()}]
+                cur_reader.release()
             #Setup the indexing to match the outer sweeping parameters...
             self._cur_data = np.array(self._cur_data).reshape(tuple(x.size for x in self.param_vals))
 
@@ -358,34 +670,101 @@ class FileIODirectory:
             for cur_inner_ind in range(len(cur_param_names_inner)):
                 param_uniform = True
                 for cur_file in cur_files:
-                    if not np.array_equal(cur_file[0].param_vals[cur_inner_ind], cur_files[0][0].param_vals[cur_inner_ind]):
+                    if not np.array_equal(cur_file[0]['param_vals'][cur_inner_ind], cur_files[0][0]['param_vals'][cur_inner_ind]):
                         param_uniform = False
                         break
                 uniform_inners += [param_uniform]
             self.uniform_indices += uniform_inners
-        
-        #Release the HDF5 reader files...
-        for cur_file in cur_files:
-            cur_file[0].release()
+
+    def _index_key(self, folder):
+        return os.path.basename(folder) + '/' + self._cur_file_name
+
+    def _in_index_scope(self, key):
+        cur_folder, cur_file_name = key.split('/', 1)
+        return cur_folder.endswith(self._cur_dir_suffix) and cur_file_name == self._cur_file_name
+
+    def _load_index_cache(self):
+        cache_file = self._main_dir + '/' + FileIODirectory.INDEX_CACHE_FILE
+        if os.path.isfile(cache_file):
+            try:
+                with open(cache_file) as json_file:
+                    return json.load(json_file)
+            except (OSError, ValueError):
+                #A corrupted cache (e.g. from an interrupted write) is simply regenerated
+                pass
+        return {}
+
+    def _save_index_cache(self, index_cache, folders, folder_infos):
+        #The entries for the folder suffix and file name of this scan are rebuilt solely from the current scan (i.e. deleted folders
+        #are dropped); the entries of other scans in the same directory (i.e. other suffixes or file names) are kept.
+        new_cache = {k:v for k,v in index_cache.items() if not self._in_index_scope(k)}
+        for cur_folder, cur_info in zip(folders, folder_infos):
+            if cur_info is not None:
+                new_cache[self._index_key(cur_folder)] = {**cur_info, 'param_vals' : [x.tolist() for x in cur_info['param_vals']]}
+        if new_cache == index_cache:
+            return
+        try:
+            with open(self._main_dir + '/' + FileIODirectory.INDEX_CACHE_FILE, 'w') as outfile:
+                json.dump(new_cache, outfile)
+        except OSError:
+            #The data directory may be read-only (e.g. on a shared drive)
+            pass
+
+    def _scan_folder(self, cur_folder, cached_info = None):
+        #Check that the relevant data and attribute files exist (returning None if not)...
+        file_paths = [cur_folder + '/' + x for x in [self._cur_file_name, 'experiment_parameters.txt', 'laboratory_parameters.txt']]
+        if not all(os.path.isfile(x) for x in file_paths):
+            return None
+        mod_times = [os.path.getmtime(x) for x in file_paths]
+        if cached_info is not None and cached_info['mod_times'] == mod_times:
+            return {**cached_info, 'param_vals' : [np.array(x) for x in cached_info['param_vals']]}
+
+        with open(file_paths[1]) as json_file:
+            data = json.load(json_file)
+            var_names = data['Sweeps']
+            cur_file_index = data.get('FileIndex', None)
+        with open(file_paths[2]) as json_file:
+            data = json.load(json_file)
+            var_vals = [data[x]['Value'] for x in var_names]
+        cur_reader = FileIOReader(file_paths[0])
+        ret_info = {
+            'mod_times' : mod_times,
+            'var_names' : var_names,
+            'var_vals' : var_vals,
+            'file_index' : cur_file_index,
+            'param_names' : cur_reader.param_names,
+            'param_vals' : cur_reader.param_vals,
+            'dep_params' : cur_reader.dep_params,
+            'dtype' : cur_reader.dset.dtype.str,
+            'has_time_stamps' : cur_reader.dsetTS is not None
+        }
+        cur_reader.release()
+        return ret_info
 
     @classmethod
-    def fromReader(cls, obj_FileIOReader):
-        return cls(obj_FileIOReader.file_path)
+    def fromReader(cls, obj_FileIOReader, **kwargs):
+        return cls(obj_FileIOReader.file_path, **kwargs)
 
     def get_numpy_array(self):
+        if self._cur_data is None:
+            self._cur_data = np.asarray(self._lazy_data)
         return self._cur_data
 
+    def get_lazy_array(self):
+        assert not self.non_uniform, "Lazy arrays are only supported for uniformly sampled datasets."
+        return self._lazy_data
+
     def get_var_dict_arrays(self, return_slicing_params = False):
         ret_dict = {}
         array_shape = [x.size for x in self._cur_param_vals_outer]
         array_size = np.prod(array_shape)
-        for m, cur_folder in enumerate(self.folders):
-            with open(cur_folder +'/' + 'laboratory_parameters.txt') as json_file:
-                data = json.load(json_file)
-                for cur_var in data.keys():
-                    if not cur_var in ret_dict:
-                        ret_dict[cur_var] = np.empty((array_size,))
-                    ret_dict[cur_var][m] = data[cur_var]['Value']
+        with ThreadPoolExecutor(max_workers=self._num_threads) as executor:
+            folder_vars = executor.map(lambda x: self._load_json(x +'/' + 'laboratory_parameters.txt'), self.folders)
+        for m, data in enumerate(folder_vars):
+            for cur_var in data.keys():
+                if not cur_var in ret_dict:
+                    ret_dict[cur_var] = np.empty((array_size,))
+                ret_dict[cur_var][m] = data[cur_var]['Value']
         for cur_var in ret_dict:
             ret_dict[cur_var] = ret_dict[cur_var].reshape(tuple(array_shape))
         if return_slicing_params:
@@ -393,8 +772,20 @@ class FileIODirectory:
         else:
             return ret_dict
 
+    @staticmethod
+    def _load_json(file_path):
+        with open(file_path) as json_file:
+            return json.load(json_file)
+
     def get_time_stamps(self):
         assert self._ts_valid, "Time-stamps are not present or supported for this directory."
+        if self._cur_data_ts is None:
+            cur_arrays_ts = []
+            for cur_file_path in self._file_paths:
+                cur_reader = FileIOReader(cur_file_path)
+                cur_arrays_ts += [cur_reader.get_time_stamps()]
+                cur_reader.release()
+            self._cur_data_ts = np.concatenate(cur_arrays_ts).reshape(tuple( [x.size for x in self.param_vals] ))
         return self._cur_data_ts
 
     def get_rects_from_nonuniform_index(self, second_axis_param, slicing_indices_dict, non_uniform_on_x = True):
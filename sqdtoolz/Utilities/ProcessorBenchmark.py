@@ -0,0 +1,275 @@
+from sqdtoolz.Laboratory import Laboratory
+from sqdtoolz.HAL.Processors.ProcessorCPU import*
+from sqdtoolz.HAL.Processors.ProcessorCPUPool import*
+from sqdtoolz.HAL.Processors.CPU.CPU_DDC import*
+from sqdtoolz.HAL.Processors.CPU.CPU_FIR import*
+from sqdtoolz.HAL.Processors.CPU.CPU_Mean import*
+from sqdtoolz.HAL.Processors.CPU.CPU_Integrate import*
+from sqdtoolz.HAL.Processors.CPU.CPU_Max import*
+from sqdtoolz.HAL.Processors.CPU.CPU_MeanBlock import*
+from sqdtoolz.HAL.Processors.CPU.CPU_FFT import*
+from sqdtoolz.HAL.Processors.CPU.CPU_ESD import*
+from sqdtoolz.HAL.Processors.CPU.CPU_ConstantArithmetic import*
+from sqdtoolz.HAL.Processors.CPU.CPU_ChannelArithmetic import*
+import numpy as np
+import scipy
+import tracemalloc
+import subprocess
+import platform
+import tempfile
+import argparse
+import shutil
+import json
+import time
+import os
+
+class ProcessorBenchmark:
+    '''
+    Reproducible throughput benchmark of the CPU processing stages and typical processing chains. Synthetic data packets (formatted
+    as given by DummyACQ.get_data_blocks - i.e. blocks of repetitions with the parameters repetition, segment and sample) are pushed
+    through a ProcessorCPU for every benchmark case. Each case records the best and median wall time over a number of runs, the
+    resulting throughput (in raw input samples per second across all channels) and the peak memory allocated during a separate
+    traced run (via tracemalloc). The results may be saved as a JSON baseline and compared against a previous baseline (e.g. from
+    a previous commit on the same machine).
+
+    It may be run as a script: python -m sqdtoolz.Utilities.ProcessorBenchmark --help
+    '''
+    #Data sizes given as: (repetitions, segments, samples, repetitions-per-block)
+    SIZES = {
+        'small'  : (64, 2, 1024, 16),
+        'medium' : (1024, 4, 2048, 128),
+        'large'  : (4096, 4, 8192, 256)
+    }
+    SAMPLE_RATE = 1e9
+
+    def __init__(self, size = 'medium', num_runs = 5, num_channels = 2, cases = None, include_pool = False, seed = 42):
+        '''
+        Inputs:
+            - size         - Data size as one of the keys in ProcessorBenchmark.SIZES.
+            - num_runs     - Number of timed runs per case (after a single warm-up run that fills the stage caches).
+            - num_channels - Number of input channels in every data packet.
+            - cases        - List of case names to run (defaults to all cases - see get_case_names).
+            - include_pool - If True, the cases are also run on a ProcessorCPUPool (the worker processes are started in the warm-up).
+            - seed         - Seed for the synthetic data.
+        '''
+        assert size in ProcessorBenchmark.SIZES, f"The size must be one of: {list(ProcessorBenchmark.SIZES.keys())}"
+        assert num_runs > 0, "The number of runs must be positive."
+        assert num_channels >= 2, "The benchmark cases require at least 2 input channels (e.g. I and Q)."
+        self._size = size
+        self._num_runs = num_runs
+        self._num_channels = num_channels
+        self._include_pool = include_pool
+        self._seed = seed
+        all_cases = ProcessorBenchmark.get_case_names()
+        self._cases = all_cases if cases == None else cases
+        for cur_case in self._cases:
+            assert cur_case in all_cases, f"Benchmark case {cur_case} does not exist."
+
+    @staticmethod
+    def _get_cases(num_channels):
+        #Each case is given as: (name, main-stages, end-stages, precision, integer-input); the stages are built afresh on every call
+        fir_specs = [{'Type' : 'low', 'Taps' : 40, 'fc' : 10e6, 'Win' : 'hamming'}]*(2*num_channels)
+        fir_specs_long = [{'Type' : 'low', 'Taps' : 256, 'fc' : 10e6, 'Win' : 'hamming'}]*(2*num_channels)
+        fir_specs_dec = [{'Type' : 'low', 'Taps' : 128, 'fc' : 10e6, 'Win' : 'hamming', 'Decimation' : 8}]*(2*num_channels)
+        ddc_freqs = [25e6]*num_channels
+        return [
+            ('ConstantArithmetic', lambda: [CPU_ConstantArithmetic(2.0, '*')], lambda: [], 'float64', False),
+            ('ChannelArithmetic', lambda: [CPU_ChannelArithmetic([0,1], '-')], lambda: [], 'float64', False),
+            ('DDC', lambda: [CPU_DDC(ddc_freqs)], lambda: [], 'float64', False),
+            ('FIR', lambda: [CPU_FIR(fir_specs)], lambda: [], 'float64', False),
+            ('FIR-FFT', lambda: [CPU_FIR(fir_specs_long)], lambda: [], 'float64', False),
+            ('FIR-Decimate', lambda: [CPU_FIR(fir_specs_dec)], lambda: [], 'float64', False),
+            ('Mean-Sample', lambda: [CPU_Mean('sample')], lambda: [], 'float64', False),
+            ('Mean-Repetition', lambda: [], lambda: [CPU_Mean('repetition')], 'float64', False),
+            ('MeanBlock', lambda: [CPU_MeanBlock('sample', 8)], lambda: [], 'float64', False),
+            ('Integrate', lambda: [CPU_Integrate('sample')], lambda: [], 'float64', False),
+            ('Max', lambda: [CPU_Max('sample')], lambda: [], 'float64', False),
+            ('FFT', lambda: [CPU_FFT()], lambda: [], 'float64', False),
+            ('ESD', lambda: [CPU_ESD()], lambda: [], 'float64', False),
+            #Typical chains
+            ('DDC-FIR-Mean', lambda: [CPU_DDC(ddc_freqs), CPU_FIR(fir_specs), CPU_Mean('sample')], lambda: [CPU_Mean('repetition')], 'float64', False),
+            ('DDC-FIR-Mean-float32', lambda: [CPU_DDC(ddc_freqs), CPU_FIR(fir_specs), CPU_Mean('sample')], lambda: [CPU_Mean('repetition')], 'float32', True),
+            ('DDC-FIR-Traces', lambda: [CPU_DDC(ddc_freqs), CPU_FIR(fir_specs)], lambda: [CPU_Mean('repetition')], 'float64', False),
+            ('DDC-FIR-Traces-float32', lambda: [CPU_DDC(ddc_freqs), CPU_FIR(fir_specs)], lambda: [CPU_Mean('repetition')], 'float32', True),
+            ('FFT-Mean', lambda: [CPU_FFT()], lambda: [CPU_Mean('repetition')], 'float64', False),
+            ('ESD-Mean', lambda: [CPU_ESD()], lambda: [CPU_Mean('repetition')], 'float64', False),
+            ('ChannelArithmetic-Mean', lambda: [CPU_ConstantArithmetic(0.5, '-'), CPU_ChannelArithmetic([0,1], '*'), CPU_Mean('sample')], lambda: [CPU_Mean('repetition')], 'float64', False)
+        ]
+
+    @staticmethod
+    def get_case_names():
+        return [x[0] for x in ProcessorBenchmark._get_cases(2)]
+
+    def _get_blocks(self, integer_input):
+        num_reps, num_segs, num_samples, block_reps = ProcessorBenchmark.SIZES[self._size]
+        rng = np.random.default_rng(self._seed)
+        ret_blocks = []
+        for cur_rep in range(0, num_reps, block_reps):
+            cur_reps = min(block_reps, num_reps - cur_rep)
+            cur_data = {}
+            for m in range(self._num_channels):
+                if integer_input:
+                    #Raw digitiser samples (e.g. from the M4i)
+                    cur_data[f'ch{m+1}'] = rng.integers(-2**13, 2**13, size=(cur_reps, num_segs, num_samples), dtype=np.int16)
+                else:
+                    cur_data[f'ch{m+1}'] = rng.random((cur_reps, num_segs, num_samples))
+            ret_blocks.append(cur_data)
+        return ret_blocks
+
+    def _run_once(self, processor, blocks):
+        #The packets are copied before the timer starts as the stages may operate in-place
+        data_pkts = [{
+            'parameters' : ['repetition', 'segment', 'sample'],
+            'data' : {cur_ch : cur_arr.copy() for cur_ch, cur_arr in cur_block.items()},
+            'misc' : {'SampleRates' : [ProcessorBenchmark.SAMPLE_RATE]*self._num_channels}
+        } for cur_block in blocks]
+        start_time = time.perf_counter()
+        for cur_pkt in data_pkts:
+            processor.push_data(cur_pkt)
+        processor.get_all_data()
+        return time.perf_counter() - start_time
+
+    def _run_case(self, lab, case, proc_type):
+        case_name, get_main, get_end, precision, integer_input = case
+        blocks = self._get_blocks(integer_input)
+        processor = proc_type(f'bench_{proc_type.__name__}_{case_name}', lab, get_main(), get_end(), precision=precision)
+        #Warm-up (i.e. carriers, filter coefficients, worker processes)
+        self._run_once(processor, blocks)
+        times = [self._run_once(processor, blocks) for m in range(self._num_runs)]
+
+        #The peak memory is measured separately as tracing slows down the processing; note that the worker processes are not traced
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        init_mem = tracemalloc.get_traced_memory()[0]
+        self._run_once(processor, blocks)
+        peak_mem = tracemalloc.get_traced_memory()[1] - init_mem
+        if not was_tracing:
+            tracemalloc.stop()
+
+        if isinstance(processor, ProcessorCPUPool):
+            processor.shutdown()
+        num_samples = sum(sum(x.size for x in cur_block.values()) for cur_block in blocks)
+        input_bytes = sum(sum(x.nbytes for x in cur_block.values()) for cur_block in blocks)
+        return {
+            'Processor' : proc_type.__name__,
+            'Precision' : precision,
+            'Samples' : num_samples,
+            'InputBytes' : input_bytes,
+            'BestTime' : min(times),
+            'MedianTime' : float(np.median(times)),
+            'SamplesPerSecond' : num_samples / min(times),
+            'PeakBytes' : peak_mem
+        }
+
+    def run(self, verbose = False):
+        '''
+        Runs all benchmark cases and returns the results as a dictionary with the keys:
+            - Machine - Machine, library versions and the current git commit
+            - Settings - Benchmark settings (data size, number of runs etc.)
+            - Results - Dictionary of the results of every case (keyed by the case name with the suffix ':pool' for ProcessorCPUPool)
+        '''
+        proc_types = [ProcessorCPU, ProcessorCPUPool] if self._include_pool else [ProcessorCPU]
+        cases = [x for x in ProcessorBenchmark._get_cases(self._num_channels) if x[0] in self._cases]
+        results = {}
+        temp_dir = tempfile.mkdtemp()
+        try:
+            lab = Laboratory('', temp_dir + '/')
+            for cur_type in proc_types:
+                for cur_case in cases:
+                    cur_name = cur_case[0] if cur_type is ProcessorCPU else cur_case[0] + ':pool'
+                    results[cur_name] = self._run_case(lab, cur_case, cur_type)
+                    if verbose:
+                        print(ProcessorBenchmark._get_result_line(cur_name, results[cur_name]))
+            lab.release_all_instruments()
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        num_reps, num_segs, num_samples, block_reps = ProcessorBenchmark.SIZES[self._size]
+        return {
+            'Machine' : ProcessorBenchmark.get_machine_info(),
+            'Settings' : {
+                'Size' : self._size, 'Repetitions' : num_reps, 'Segments' : num_segs, 'Samples' : num_samples, 'BlockRepetitions' : block_reps,
+                'Channels' : self._num_channels, 'Runs' : self._num_runs, 'Seed' : self._seed
+            },
+            'Results' : results
+        }
+
+    @staticmethod
+    def _get_result_line(case_name, result):
+        return f"{case_name:<30} {result['SamplesPerSecond']/1e6:>10.2f} MS/s {result['BestTime']*1e3:>10.2f} ms {result['PeakBytes']/2**20:>10.2f} MiB"
+
+    @staticmethod
+    def get_machine_info():
+        try:
+            git_commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+        except OSError:
+            git_commit = ''
+        return {
+            'Platform' : platform.platform(),
+            'Processor' : platform.processor(),
+            'CPUs' : os.cpu_count(),
+            'Python' : platform.python_version(),
+            'NumPy' : np.__version__,
+            'SciPy' : scipy.__version__,
+            'GitCommit' : git_commit,
+            'TimeStamp' : time.strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+    @staticmethod
+    def save_results(results, file_path):
+        with open(file_path, 'w') as outfile:
+            json.dump(results, outfile, indent=4)
+
+    @staticmethod
+    def load_results(file_path):
+        with open(file_path, 'r') as infile:
+            return json.load(infile)
+
+    @staticmethod
+    def compare_results(baseline, results, tolerance = 0.2):
+        '''
+        Compares the throughput and peak memory of the cases common to both results. Returns a list of dictionaries (one per case)
+        with the keys: Case, Speedup (i.e. new throughput over the baseline throughput), MemoryRatio (i.e. new peak memory over
+        the baseline peak memory) and Regression (True if the throughput dropped or the peak memory grew by more than the given
+        fractional tolerance). Note that the baseline is only meaningful if it was run on the same machine with the same settings.
+        '''
+        ret_list = []
+        for cur_case, cur_result in results['Results'].items():
+            if not cur_case in baseline['Results']:
+                continue
+            cur_base = baseline['Results'][cur_case]
+            speedup = cur_result['SamplesPerSecond'] / cur_base['SamplesPerSecond']
+            mem_ratio = cur_result['PeakBytes'] / cur_base['PeakBytes'] if cur_base['PeakBytes'] > 0 else 1.0
+            ret_list.append({
+                'Case' : cur_case,
+                'Speedup' : speedup,
+                'MemoryRatio' : mem_ratio,
+                'Regression' : speedup < 1 - tolerance or mem_ratio > 1 + tolerance
+            })
+        return ret_list
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the throughput and peak memory of the CPU processing stages.')
+    parser.add_argument('--size', default='medium', choices=list(ProcessorBenchmark.SIZES.keys()), help='Data size of each case.')
+    parser.add_argument('--runs', type=int, default=5, help='Number of timed runs per case.')
+    parser.add_argument('--channels', type=int, default=2, help='Number of input channels.')
+    parser.add_argument('--cases', nargs='+', default=None, help=f'Cases to run (default is all): {ProcessorBenchmark.get_case_names()}')
+    parser.add_argument('--pool', action='store_true', help='Also run the cases on a ProcessorCPUPool.')
+    parser.add_argument('--save', default='', help='Saves the results as a JSON baseline onto the given file.')
+    parser.add_argument('--compare', default='', help='Compares the results to the given JSON baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Fractional tolerance before flagging a regression.')
+    args = parser.parse_args()
+
+    bench = ProcessorBenchmark(args.size, args.runs, args.channels, args.cases, args.pool)
+    print(f"{'Case':<30} {'Throughput':>15} {'Best time':>13} {'Peak memory':>14}")
+    results = bench.run(verbose=True)
+    if args.save != '':
+        ProcessorBenchmark.save_results(results, args.save)
+    if args.compare != '':
+        comparison = ProcessorBenchmark.compare_results(ProcessorBenchmark.load_results(args.compare), results, args.tolerance)
+        print(f"\n{'Case':<30} {'Speedup':>10} {'Memory':>10}")
+        for cur_comp in comparison:
+            print(f"{cur_comp['Case']:<30} {cur_comp['Speedup']:>9.2f}x {cur_comp['MemoryRatio']:>9.2f}x{'  REGRESSION' if cur_comp['Regression'] else ''}")
+        if any(x['Regression'] for x in comparison):
+            exit(1)
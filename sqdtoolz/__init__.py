@@ -22,6 +22,7 @@ from sqdtoolz.HAL.WaveformMapper import*
 from sqdtoolz.HAL.WaveformTransformations import*
 
 from sqdtoolz.HAL.Processors.ProcessorCPU import*
+from sqdtoolz.HAL.Processors.ProcessorCPUPool import ProcessorCPUPool
 try:
     from sqdtoolz.HAL.Processors.ProcessorGPU import*
 except ModuleNotFoundError: